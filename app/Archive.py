@@ -0,0 +1,102 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Interval, Boolean, text, inspect
+import os
+from Reservation import Base, Reservation
+
+# Monthly partitions created ahead of time, so archived rows never need a new partition
+PARTITIONS_AHEAD = int(os.getenv('RESERVATION_ARCHIVE_PARTITIONS_AHEAD', 3))
+
+
+class ReservationArchive(Base):
+    """Conferences and reservations retired by the sweeper, kept for billing.
+
+    On PostgreSQL the table is range-partitioned by start_time into monthly partitions,
+    so dropping history past its retention is a metadata operation. Other databases
+    keep a single table.
+    """
+    __tablename__ = 'reservations_archive'
+    __table_args__ = {'postgresql_partition_by': 'RANGE (start_time)'}
+
+    # The partition key has to be part of the primary key
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    start_time = Column(DateTime, primary_key=True)
+    name = Column(String)
+    end_time = Column(DateTime)
+    duration = Column(Interval)
+    timezone = Column(String)
+    pin = Column(String)
+    mail_owner = Column(String)
+    active = Column(Boolean)
+    user_id = Column(String)
+    owner_id = Column(String)
+    user_name = Column(String)
+    email = Column(String)
+    avatar = Column(String)
+    recurrence = Column(String)
+    recurrence_end = Column(DateTime)
+    archived_at = Column(DateTime)
+
+    def __repr__(self):
+        return f'<ReservationArchive(id={self.id}, name={self.name}, start_time={self.start_time})>'
+
+
+# Columns copied from reservations into the archive
+ARCHIVED_COLUMNS = [column.name for column in Reservation.__table__.columns
+                    if column.name in ReservationArchive.__table__.columns]
+
+
+def month_start(when: datetime, offset: int = 0) -> datetime:
+    """Get the first day of the month offset months after when"""
+    month = when.year * 12 + when.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Get the name of the archive partition for a month"""
+    return f'{ReservationArchive.__tablename__}_{month:%Y_%m}'
+
+
+def ensure_partitions(engine, since: datetime, months_ahead: int = PARTITIONS_AHEAD):
+    """Create the monthly archive partitions from since up to months_ahead after now.
+    Rows outside those months go to a default partition."""
+    if engine.dialect.name != 'postgresql':
+        return
+
+    table = ReservationArchive.__tablename__
+    with engine.begin() as connection:
+        connection.execute(text(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT'))
+        month = month_start(since)
+        last = month_start(datetime.utcnow(), months_ahead)
+        while month <= last:
+            following = month_start(month, 1)
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+            ))
+            month = following
+
+
+def drop_partitions(engine, before: datetime) -> int:
+    """Drop archived history that started before the given time, return the number of partitions dropped.
+    On PostgreSQL whole monthly partitions are dropped, elsewhere the rows are deleted."""
+    table = ReservationArchive.__tablename__
+    if engine.dialect.name != 'postgresql':
+        with engine.begin() as connection:
+            connection.execute(text(f'DELETE FROM {table} WHERE start_time < :before'), {'before': before})
+        return 0
+
+    dropped = 0
+    with engine.begin() as connection:
+        for name in inspect(connection).get_table_names():
+            if not name.startswith(f'{table}_') or name == f'{table}_default':
+                continue
+            try:
+                month = datetime.strptime(name[len(table) + 1:], '%Y_%m')
+            except ValueError:
+                continue
+            if month_start(month, 1) <= before:
+                connection.execute(text(f'DROP TABLE {name}'))
+                dropped += 1
+        # Stray rows older than the first partition
+        connection.execute(text(f'DELETE FROM {table}_default WHERE start_time < :before'), {'before': before})
+    return dropped
@@ -0,0 +1,40 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import os
+from Conferences import Manager, engine_options
+from Metrics import query_counter
+
+
+class AsyncManager:
+    """Runs the Manager logic on AsyncSessions for the ASGI app.
+
+    Each call opens its own AsyncSession and runs the Manager method through run_sync,
+    so the queries go through the async driver and never block the event loop.
+    """
+
+    def __init__(self, url: str = None):
+        url = url or os.environ.get('RESERVATION_SERVICE_ASYNC_DATABASE_URL') \
+            or os.environ['RESERVATION_SERVICE_DATABASE_URL']
+        self.engine = create_async_engine(url, echo=False, **engine_options(url))
+        self.Session = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.manager = Manager(engine=self.engine.sync_engine, create_schema=False)
+
+    async def create_schema(self):
+        """Create missing tables, indexes and version counters"""
+        async with self.engine.begin() as connection:
+            await connection.run_sync(self.manager.create_schema)
+
+    async def call(self, method: str, **kwargs):
+        """Run a Manager method in a new session and return its result"""
+        counter = query_counter.get()
+
+        def run(sync_session):
+            # The sync code runs in a greenlet with its own context, count its queries for this request
+            query_counter.set(counter)
+            return getattr(self.manager.with_session(sync_session), method)(**kwargs)
+
+        async with self.Session() as session:
+            return await session.run_sync(run)
+
+    async def dispose(self):
+        """Close all pooled connections"""
+        await self.engine.dispose()
@@ -1,68 +1,291 @@
 from typing import Union
 from CustomExceptions import ConferenceExists, OverlappingReservation
 from sqlalchemy import create_engine, Column, Integer, String, Boolean
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import between, or_, create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy import between, or_, and_, func, create_engine, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime, timedelta
+import copy
 import logging
 import os
-from Reservation import Base, Reservation
-Session = sessionmaker()
+import threading
+from Reservation import Base, Reservation, ReservationRecord, record_columns, RECURRENCE_HORIZON
+from Version import Version
+from Registry import ActiveConferenceRegistry
+import Archive  # registers the archive table for create_all
+import Idempotency
+from Idempotency import IdempotencyKey
+from Events import Event, snapshot
+from Metrics import ENABLED as METRICS_ENABLED, TimedQueuePool, TimedAsyncAdaptedQueuePool, instrumented
+Session = scoped_session(sessionmaker(expire_on_commit=False))
+
+# Rows fetched per round trip when streaming list responses
+STREAM_BATCH_SIZE = int(os.getenv('RESERVATION_SERVICE_STREAM_BATCH_SIZE', 1000))
+
+
+# SQLSTATE raised by PostgreSQL when the reservation exclusion constraint rejects a row
+EXCLUSION_VIOLATION = '23P01'
+
+
+def find_free_slots(busy: list, start_time, end_time, duration: timedelta) -> list:
+    """Get the (start, end) gaps between busy (start, end) intervals inside [start_time, end_time]
+    that fit a reservation of duration. Reservations that touch count as overlapping, so a gap
+    bounded by a busy interval has to be longer than duration."""
+    slots = []
+    free_from, after_busy = start_time, False
+    # Sweep over the intervals by start, merging the ones that overlap or touch
+    for busy_start, busy_end in sorted(busy):
+        if busy_start > free_from and busy_start - free_from > duration:
+            slots.append((free_from, busy_start))
+        if busy_end >= free_from:
+            free_from, after_busy = busy_end, True
+    length = end_time - free_from
+    if length > duration or (length == duration and not after_busy):
+        slots.append((free_from, end_time))
+    return slots
+
+
+def engine_options(url: str) -> dict:
+    """Get the connection pool settings for the database URL from the environment"""
+    options = {
+        'pool_pre_ping': os.getenv('RESERVATION_SERVICE_DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'pool_recycle': int(os.getenv('RESERVATION_SERVICE_DB_POOL_RECYCLE', 1800)),
+    }
+    # SQLite uses a single-connection pool that takes no sizing arguments
+    if make_url(url).get_backend_name() != 'sqlite':
+        options['pool_size'] = int(os.getenv('RESERVATION_SERVICE_DB_POOL_SIZE', 5))
+        options['max_overflow'] = int(os.getenv('RESERVATION_SERVICE_DB_MAX_OVERFLOW', 10))
+        options['pool_timeout'] = float(os.getenv('RESERVATION_SERVICE_DB_POOL_TIMEOUT', 30))
+        if METRICS_ENABLED:
+            options['poolclass'] = TimedAsyncAdaptedQueuePool if make_url(url).get_dialect().is_async else TimedQueuePool
+    return options
+
 
 class Manager:
-    def __init__(self): 
+    def __init__(self, engine=None, create_schema: bool = True):
         self.__logger = logging.getLogger()
-        engine = create_engine(os.environ['RESERVATION_SERVICE_DATABASE_URL'], echo=False)
-        Base.metadata.create_all(engine)
+        self.__engine = None
+        self.__engine_lock = threading.Lock()
+        self.__create_schema = create_schema
+        self.__session = None
+        self.registry = ActiveConferenceRegistry()
+        if engine is not None:
+            self.__setup(engine)
+
+    @property
+    def engine(self):
+        """Get the database engine, creating it on first use.
+        Nothing connects at import time, so the app can be loaded before gunicorn forks its workers."""
+        if self.__engine is None:
+            with self.__engine_lock:
+                if self.__engine is None:
+                    url = os.environ['RESERVATION_SERVICE_DATABASE_URL']
+                    self.__setup(create_engine(url, echo=False, **engine_options(url)))
+        return self.__engine
+
+    def __setup(self, engine):
+        if self.__create_schema:
+            self.create_schema(engine)
         Session.configure(bind=engine)
-        self.session = Session()
-
-    def all_reservations(self, current_user = None) -> list:
+        self.__engine = engine
+
+    def after_fork(self):
+        """Drop the pooled connections inherited from the parent process, call in each forked worker"""
+        if self.__engine is not None:
+            self.__engine.dispose(close=False)
+
+    def dispose(self):
+        """Close all pooled connections, e.g. in the parent process before forking"""
+        if self.__engine is not None:
+            self.__engine.dispose()
+
+    def create_schema(self, bind):
+        """Create missing tables, indexes and version counters"""
+        Base.metadata.create_all(bind)
+        self.ensure_indexes(bind)
+        self.ensure_version(bind, Version.EVENTS_PRUNED)
+
+    def ensure_indexes(self, bind):
+        """Create indexes missing on tables that existed before the indexes were declared"""
+        for index in Reservation.__table__.indexes:
+            try:
+                index.create(bind=bind, checkfirst=True)
+            except Exception as e:
+                self.__logger.error('Could not create index %s: %s', index.name, e)
+
+    def ensure_version(self, bind, scope: str):
+        """Create a version counter if it does not exist yet"""
+        session = Session.session_factory(bind=bind)
+        try:
+            if session.get(Version, scope) is None:
+                session.add(Version(scope=scope, version=0))
+                session.commit()
+        except IntegrityError:
+            # Another process created it first
+            session.rollback()
+        finally:
+            session.close()
+
+    def bump_version(self, scope: str):
+        """Increment a version counter as part of the current transaction, creating it on first use.
+        Its row stays locked until the commit. Transactions bump their counters in the order of
+        their scopes, conference shards before tenants, so they never wait for each other in a cycle."""
+        dialect = self.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+            statement = insert(Version).values(scope=scope, version=1)
+            self.session.execute(statement.on_conflict_do_update(
+                index_elements=[Version.scope], set_={'version': Version.version + 1}))
+            return
+        updated = self.session.query(Version) \
+            .filter(Version.scope == scope) \
+            .update({Version.version: Version.version + 1}, synchronize_session=False)
+        if not updated:
+            self.session.add(Version(scope=scope, version=1))
+            self.session.flush()
+
+    def bump_tenant_version(self, owner_id: str):
+        """Increment the version counter of a tenant as part of the current transaction.
+        The writes of one tenant commit one after the other."""
+        self.bump_version(Version.tenant(owner_id))
+
+    def record_events(self, type: str, events: list):
+        """Append events for changed reservations to the event log as part of the current transaction"""
+        events = [event for event in events if event.owner_id is not None]
+        if not events:
+            return
+        # Assign the ids of new rows before they are copied into the events
+        self.session.flush()
+        for owner_id in sorted({event.owner_id for event in events}):
+            self.bump_tenant_version(owner_id)
+        now = datetime.utcnow()
+        self.session.add_all([Event(owner_id=event.owner_id, type=type, reservation_id=event.id, name=event.name,
+                                    data=snapshot(event), created_at=now) for event in events])
+
+    @property
+    def session(self):
+        """Get the database session of the current request"""
+        if self.__session is not None:
+            return self.__session
+        if self.__engine is None:
+            self.engine
+        return Session()
+
+    def with_session(self, session) -> 'Manager':
+        """Get a copy of this manager that works on the given session instead of the request session"""
+        manager = copy.copy(self)
+        manager.__session = session
+        return manager
+
+    def remove_session(self):
+        """Close the session of the current request and return its connection to the pool"""
+        Session.remove()
+
+    @instrumented
+    def all_reservations(self, current_user = None, limit: int = None, after: int = None, stream: bool = False,
+                         start_time=None, end_time=None):
         """Get all reservations as dict"""
         owner_id = current_user['context']['group']
 
-        filter = self.session.query(Reservation) \
+        filter = self.records() \
             .filter(Reservation.owner_id == owner_id) \
             .filter(Reservation.active == False) \
             .order_by(Reservation.id)
-        return filter.all()
+        if start_time is not None and end_time is not None:
+            filter = filter.filter(self.overlaps(start_time, end_time))
+        return self.paginate(filter, limit=limit, after=after, stream=stream)
 
-    def all_conferences(self, current_user = None) -> list:
+    @instrumented
+    def all_conferences(self, current_user = None, limit: int = None, after: int = None, stream: bool = False,
+                        start_time=None, end_time=None):
         """Get all conferences as dict"""
         owner_id = current_user['context']['group']
-        filter = self.session.query(Reservation) \
+        filter = self.records() \
             .filter(Reservation.active == True) \
             .filter(Reservation.owner_id == owner_id) \
             .order_by(Reservation.id)
-        return filter.all()
-
+        if start_time is not None and end_time is not None:
+            filter = filter.filter(self.overlaps(start_time, end_time))
+        return self.paginate(filter, limit=limit, after=after, stream=stream)
+
+    def paginate(self, query, limit: int = None, after: int = None, stream: bool = False):
+        """Apply keyset pagination on the id to a query ordered by id.
+        Returns a list of records, or an iterator fetching them in batches if stream is set."""
+        if after is not None:
+            query = query.filter(Reservation.id > after)
+        if limit is not None:
+            query = query.limit(limit)
+        if stream:
+            return map(ReservationRecord._make, query.yield_per(STREAM_BATCH_SIZE))
+        return [ReservationRecord._make(row) for row in query]
+
+    def records(self):
+        """Query the columns of ReservationRecord for the read endpoints.
+        The rows are plain tuples, they are not built as entities or tracked in the identity map."""
+        return self.session.query(*record_columns())
+
+    def first_record(self, query) -> Union[ReservationRecord, None]:
+        """Get the first row of a records() query as ReservationRecord"""
+        row = query.first()
+        return ReservationRecord._make(row) if row is not None else None
+
+    @instrumented
     def allocate(self, data: dict, current_user = None)-> dict:
         """Check if the conference request matches a reservation."""
         name = data.get('name')
 
+        # Fetch the running conference or else the reservation for this room in one query.
+        # Running conferences sort first, and the row stays locked until the commit.
+        event = self.session.query(Reservation) \
+            .filter(Reservation.name == name) \
+            .order_by(Reservation.active.desc(), Reservation.id) \
+            .with_for_update() \
+            .first()
+
         # Check for conflicting conference
-        event = self.get_conference_without_owner_id(name=name, current_user=current_user)
-        print("get_conference_without_owner_id event", event)
-        if event:
-            self.__logger.info(f'Conference {event.id} already exists')
+        if event is not None and event.active:
+            self.__logger.info('Conference %s already exists', event.id)
             raise ConferenceExists(event.id)
 
-        # Check for existing reservation
-        event = self.get_reservation_without_owner_id(name=name, current_user=current_user)
-        if event:
+        if event and event.recurrence:
+            # The series stays reserved, the current occurrence becomes the conference
+            event = event.start_occurrence(owner=data.get('mail_owner'), start_time=data.get('start_time'))
+            self.__logger.debug('Reservation series for room %s checked, conference can start.', name)
+            event.active = True
+            self.session.add(event)
+        elif event:
             # Raise ConferenceNotAllowed if necessary
             event.check_allowed(owner=data.get('mail_owner'), start_time=data.get('start_time'))
-            self.__logger.debug(f'Reservation for room {name} checked, conference can start.')
+            self.__logger.debug('Reservation for room %s checked, conference can start.', name)
             event.active = True
-            self.session.commit()
         else:
-            self.__logger.debug(f'No reservation found for room {name}')
-            event = self.add_conference(data=data, current_user=current_user)
-            # Check for overlapping reservations for PostgreSQL
-            self.check_overlapping_reservations(event, current_user)
+            # No reservation exists for this room, so there is nothing it could overlap with
+            self.__logger.debug('No reservation found for room %s', name)
+            event = Reservation().from_dict(data, current_user)
+            event.active = True
+            self.session.add(event)
+
+        try:
+            # Both flush the conference, a concurrent join for this room may fail here already
+            self.bump_version(Version.conferences(event.name))
+            self.record_events(Event.CONFERENCE_STARTED, [event])
+            self.session.commit()
+        except (IntegrityError, StaleDataError):
+            # A concurrent join for this room committed first. Databases without row locks let
+            # both read the reservation, the version column then rejects the second update.
+            self.session.rollback()
+            existing = self.get_conference_without_owner_id(name=name, current_user=current_user)
+            raise ConferenceExists(existing.id if existing else None)
+        finally:
+            self.registry.invalidate(event.name)
 
         return event.get_jicofo_api_dict()
 
+    @instrumented
     def delete_conference(self, id: int = None, name: str = None, current_user=None) -> bool:
         """Delete a conference in the database"""
         event = self.session.query(Reservation) \
@@ -75,19 +298,27 @@ class Manager:
             return False
 
         self.session.delete(event)
+        self.bump_version(Version.conferences(event.name))
+        self.record_events(Event.CONFERENCE_ENDED, [event])
         self.session.commit()
+        self.registry.invalidate(event.name)
         return True
 
+    @instrumented
     def add_conference(self, data: dict, current_user = None) -> str:
         """Add a conference to the database"""
         event = Reservation().from_dict(data, current_user)
         event.active = True
         self.session.add(event)
+        self.bump_version(Version.conferences(event.name))
+        self.record_events(Event.CONFERENCE_STARTED, [event])
         self.session.commit()
-        self.__logger.debug(f'Add conference {event.id} - {event.name} to the database')
+        self.registry.invalidate(event.name)
+        self.__logger.debug('Add conference %s - %s to the database', event.id, event.name)
         return event
 
 
+    @instrumented
     def get_conference_without_owner_id(self, id: int = None, name: str = None, current_user = None) -> Union[Reservation, None]:
         """Get the conference information"""
         owner_id = current_user['context']['group']
@@ -97,15 +328,14 @@ class Manager:
             .filter(Reservation.active == True) \
             .first()
 
+    @instrumented
     def get_conference_with_id(self, id: int = None, current_user = None) -> Union[Reservation, None]:
         """Get the conference information"""
         owner_id = current_user['context']['group']
 
-        return self.session.query(Reservation) \
-            .filter(Reservation.id == id) \
-            .filter(Reservation.active == True) \
-            .first()
+        return self.registry.get_by_id(self.session, id)
 
+    @instrumented
     def get_conference(self, id: int = None, name: str = None, current_user = None) -> Union[Reservation, None]:
         """Get the conference information"""
         owner_id = current_user['context']['group']
@@ -116,16 +346,17 @@ class Manager:
             .filter(Reservation.active == True) \
             .first()
 
-    def get_conference_by_name(self, name: str = None, current_user = None) -> Union[Reservation, None]:
+    @instrumented
+    def get_conference_by_name(self, name: str = None, current_user = None) -> Union[ReservationRecord, None]:
         """Get the conference information by conference name"""
         owner_id = current_user['context']['group']
 
-        return self.session.query(Reservation) \
+        return self.first_record(self.records() \
             .filter(Reservation.name == name) \
             .filter(Reservation.owner_id == owner_id) \
-            .filter(Reservation.active == True) \
-            .first()
+            .filter(Reservation.active == True))
 
+    @instrumented
     def delete_reservation(self, id: int = None, name: str = None, current_user = None) -> bool:
         owner_id = current_user['context']['group']
 
@@ -140,9 +371,14 @@ class Manager:
             return False
 
         self.session.delete(event)
+        if event.active:
+            self.bump_version(Version.conferences(event.name))
+        self.record_events(Event.CONFERENCE_ENDED if event.active else Event.RESERVATION_DELETED, [event])
         self.session.commit()
+        self.registry.invalidate(event.name)
         return True
 
+    @instrumented
     def delete_reservation_by_id(self, id: int = None, name: str = None, current_user = None) -> bool:
         owner_id = current_user['context']['group']
 
@@ -156,9 +392,14 @@ class Manager:
             return False
 
         self.session.delete(event)
+        if event.active:
+            self.bump_version(Version.conferences(event.name))
+        self.record_events(Event.CONFERENCE_ENDED if event.active else Event.RESERVATION_DELETED, [event])
         self.session.commit()
+        self.registry.invalidate(event.name)
         return True
 
+    @instrumented
     def get_reservation_without_owner_id(self, id: int = None, name: str = None, current_user = None) -> Union[Reservation, None]:
         """Get the reservation information"""
         owner_id = current_user['context']['group']
@@ -169,26 +410,26 @@ class Manager:
             .first()
 
 
-    def get_reservation(self, id: int = None, name: str = None, current_user = None) -> Union[Reservation, None]:
+    @instrumented
+    def get_reservation(self, id: int = None, name: str = None, current_user = None) -> Union[ReservationRecord, None]:
         """Get the reservation information"""
         owner_id = current_user['context']['group']
 
-        return self.session.query(Reservation) \
+        return self.first_record(self.records() \
             .filter(Reservation.owner_id == owner_id) \
             .filter(Reservation.name == name) \
-            .filter(Reservation.active == False) \
-            .first()
+            .filter(Reservation.active == False))
 
-    def get_reservation_by_id(self, id: int = None, current_user = None) -> Union[Reservation, None]:
+    @instrumented
+    def get_reservation_by_id(self, id: int = None, current_user = None) -> Union[ReservationRecord, None]:
         """Get the reservation information"""
         owner_id = current_user['context']['group']
-        print("id,,,,,,,,,,,,,,,", id, current_user)
-        return self.session.query(Reservation) \
+        return self.first_record(self.records() \
             .filter(Reservation.owner_id == owner_id) \
             .filter(Reservation.id == id) \
-            .filter(Reservation.active == False) \
-            .first()
+            .filter(Reservation.active == False))
 
+    @instrumented
     def add_reservation(self, data: dict, current_user = None) -> int:
         """Add a reservation to the database."""
         event = Reservation().from_dict(data, current_user=current_user)
@@ -197,43 +438,252 @@ class Manager:
         # Check if this reservation might start before active conferences with the same name end.
         self.check_overlapping_conference(event, current_user)
 
-        print("add_reservation", event)
-        print("add_reservation", event.start_time)
-        print("timezone", event.timezone)
-
         self.session.add(event)
-        self.session.commit()
-        self.__logger.debug(f'Add reservation for room {event.name} to the database')
+        try:
+            self.record_events(Event.RESERVATION_CREATED, [event])
+            self.session.commit()
+        except IntegrityError as e:
+            self.session.rollback()
+            # A concurrent insert won the race, report it like the overlap check would
+            if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+                raise OverlappingReservation()
+            raise
+        self.__logger.debug('Add reservation for room %s at %s %s to the database', event.name, event.start_time, event.timezone)
 
         return event
 
+    @instrumented
+    def add_reservations(self, data: list, current_user = None) -> list:
+        """Add a batch of reservations to the database in one transaction.
+        Returns one entry per item: the added reservation, or the OverlappingReservation,
+        ConferenceExists or ValueError that rejected it."""
+        results = []
+        for item in data:
+            try:
+                results.append(Reservation().from_dict(item, current_user=current_user))
+            except ValueError as e:
+                results.append(e)
+        events = [event for event in results if isinstance(event, Reservation)]
+        if not events:
+            return results
+
+        # Fetch every reservation the batch could overlap with in one query
+        start_time = min(event.start_time for event in events)
+        end_time = max(self.window_end(event) for event in events)
+        booked = {}
+        for existing in self.session.query(Reservation) \
+                .filter(Reservation.name.in_({event.name for event in events})) \
+                .filter(self.overlaps(start_time, end_time)) \
+                .filter(Reservation.active == False):
+            booked.setdefault(existing.name, []).append(existing)
+        # Like check_overlapping_conference, no reservation may start during a running conference
+        running = {}
+        for conference in self.session.query(Reservation) \
+                .filter(Reservation.name.in_({event.name for event in events})) \
+                .filter(Reservation.active == True):
+            running.setdefault(conference.name, []).append(conference)
+
+        # Earlier items of the batch win over later ones
+        for index, event in enumerate(results):
+            if not isinstance(event, Reservation):
+                continue
+            conference = next((conference for conference in running.get(event.name, [])
+                               if conference.start_time <= event.start_time <= conference.end_time), None)
+            if conference is not None:
+                results[index] = self.running_conference_exists(conference)
+                continue
+            conflicts = [other for other in booked.get(event.name, [])
+                         if event.overlaps_with(other, RECURRENCE_HORIZON)]
+            if conflicts:
+                results[index] = OverlappingReservation(events=conflicts)
+            else:
+                booked.setdefault(event.name, []).append(event)
+
+        accepted = [event for event in results if isinstance(event, Reservation)]
+        self.session.add_all(accepted)
+        try:
+            self.record_events(Event.RESERVATION_CREATED, accepted)
+            self.session.commit()
+        except IntegrityError as e:
+            self.session.rollback()
+            # A concurrent insert won the race for at least one item, nothing was added
+            if getattr(e.orig, 'pgcode', None) == EXCLUSION_VIOLATION:
+                return [OverlappingReservation() if isinstance(event, Reservation) else event for event in results]
+            raise
+        self.__logger.debug('Add %d of %d reservations to the database', len(accepted), len(events))
+
+        return results
+
+    @instrumented
     def check_overlapping_conference(self, event: Reservation, current_user) -> bool:
         """Check if start and end time of the new entry overlap with an existing reservation."""
         time_filter = between(event.start_time, Reservation.start_time, Reservation.end_time)
         result = self.session.query(Reservation) \
                              .filter(Reservation.name == event.name) \
                              .filter(time_filter) \
-                             .filter(Reservation.active is True) \
+                             .filter(Reservation.active == True) \
                              .first()
 
-        print("check_overlapping_conference results:", result)
         if result is not None:
-            message = f'A conference with this name currently exists. Your reservation can only \
-                        start once the event is over, which will be at {result.end_time_formatted}'
-            raise ConferenceExists(message=message)
+            raise self.running_conference_exists(result)
 
         return True
 
+    def running_conference_exists(self, conference: Reservation) -> ConferenceExists:
+        """Get the error for a reservation that would start while the conference is running"""
+        message = f'A conference with this name currently exists. Your reservation can only ' \
+                  f'start once the event is over, which will be at {conference.end_time_formatted}'
+        return ConferenceExists(conference.id, message=message)
+
+    @instrumented
     def check_overlapping_reservations(self, event: Reservation, current_user) -> bool:
         """Check if start time of the new entry overlaps with existing conferences."""
-        results = self.session.query(Reservation) \
+        candidates = self.session.query(Reservation) \
                              .filter(Reservation.name == event.name) \
-                             .filter(event.start_time <= Reservation.end_time) \
-                             .filter(event.end_time >= Reservation.start_time) \
-                             .filter(Reservation.active is False)
+                             .filter(self.overlaps(event.start_time, self.window_end(event))) \
+                             .filter(Reservation.active == False) \
+                             .all()
+        # Series match on their whole span, compare their occurrences
+        results = [candidate for candidate in candidates if event.overlaps_with(candidate, RECURRENCE_HORIZON)]
+
+        if results:
+            raise OverlappingReservation(events=results)
+
+        return True
+
+    def overlaps(self, start_time, end_time):
+        """Get a filter for rows whose [start_time, end_time] overlaps the given interval,
+        and for series whose span does. Occurrences of the series still need to be compared.
+        On PostgreSQL single rows are matched with a range overlap that uses the GiST index of
+        the exclusion constraint, elsewhere with the (name, start_time, end_time) index."""
+        if self.engine.dialect.name == 'postgresql':
+            single = func.tsrange(Reservation.start_time, Reservation.end_time, '[]') \
+                .op('&&')(func.tsrange(start_time, end_time, '[]'))
+        else:
+            single = and_(Reservation.start_time <= end_time, Reservation.end_time >= start_time)
+        series = and_(Reservation.recurrence != None,
+                      Reservation.start_time <= end_time,
+                      or_(Reservation.recurrence_end == None, Reservation.recurrence_end >= start_time))
+        return or_(single, series)
+
+    @instrumented
+    def free_slots(self, names: list, start_time, end_time, duration: timedelta, current_user=None) -> dict:
+        """Get the free slots of each room in [start_time, end_time] that fit a reservation of duration.
+        The reservations and running conferences of all rooms are fetched in one range query,
+        series are expanded inside the window."""
+        busy = {name: [] for name in names}
+        # Each arm matches the partial index of its rows, running conferences block their room until they end
+        running = and_(Reservation.active == True,
+                       Reservation.start_time <= end_time, Reservation.end_time >= start_time)
+        rows = self.session.execute(
+            select(Reservation.name, Reservation.start_time, Reservation.end_time, Reservation.recurrence,
+                   Reservation.duration)
+            .where(Reservation.name.in_(names))
+            .where(or_(and_(Reservation.active == False, self.overlaps(start_time, end_time)), running)))
+        for name, row_start, row_end, recurrence, row_duration in rows:
+            if recurrence is None:
+                busy[name].append((row_start, row_end))
+            else:
+                series = ReservationRecord(None, name, None, row_start, row_end, row_duration, None, None, recurrence, None)
+                busy[name].extend(series.occurrences(start_time, end_time))
+        return {name: find_free_slots(intervals, start_time, end_time, duration) for name, intervals in busy.items()}
+
+    def window_end(self, event: Reservation):
+        """Get the end of the time span an entry can overlap others in"""
+        span_end = event.span_end
+        return span_end if span_end is not None else event.start_time + RECURRENCE_HORIZON
+
+    def expand_occurrences(self, rows, start_time, end_time):
+        """Replace each series by its occurrences inside [start_time, end_time]"""
+        for row in rows:
+            if row.recurrence:
+                for occurrence_start, _ in row.occurrences(start_time, end_time):
+                    yield row.occurrence(occurrence_start)
+            else:
+                yield row
+
+    @instrumented
+    def events(self, current_user=None, after: int = None, limit: int = None) -> list:
+        """Get the events of the tenant with an id greater than the cursor after, oldest first"""
+        owner_id = current_user['context']['group']
+
+        query = self.session.query(Event) \
+            .filter(Event.owner_id == owner_id) \
+            .order_by(Event.id)
+        if after is not None:
+            query = query.filter(Event.id > after)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+    @instrumented
+    def tenant_version(self, current_user=None) -> int:
+        """Get the version counter of the tenant, 0 if it never wrote anything"""
+        owner_id = current_user['context']['group']
+
+        return self.session.query(Version.version) \
+            .filter(Version.scope == Version.tenant(owner_id)) \
+            .scalar() or 0
+
+    @instrumented
+    def latest_event_id(self, current_user=None) -> int:
+        """Get the id of the newest event of the tenant, 0 if there is none"""
+        owner_id = current_user['context']['group']
 
-        print("check_overlapping_reservations results:", results)
-        if results.count():
-            raise OverlappingReservation(events=results.all())
+        return self.session.query(func.max(Event.id)) \
+            .filter(Event.owner_id == owner_id) \
+            .scalar() or 0
+
+    @instrumented
+    def events_pruned(self) -> int:
+        """Get the highest event id the sweeper removed, cursors below it may have missed events"""
+        version = self.session.get(Version, Version.EVENTS_PRUNED)
+        return version.version if version is not None else 0
+
+    @instrumented
+    def claim_idempotency_key(self, key: str, request_hash: str) -> Union[IdempotencyKey, None]:
+        """Claim an idempotency key for a new request with a placeholder, committed right away.
+        Returns None if the request should run, else the existing entry: a stored response, or a
+        placeholder of a request that is still running. Expired entries and placeholders whose
+        lease ran out are taken over."""
+        now = datetime.utcnow()
+        entry = self.session.get(IdempotencyKey, key)
+        if entry is not None and (entry.expires_at <= now or (entry.status is None and entry.locked_until <= now)):
+            self.session.delete(entry)
+            self.session.flush()
+            entry = None
+        if entry is not None:
+            self.session.commit()
+            return entry
+
+        self.session.add(IdempotencyKey(key=key, request_hash=request_hash, created_at=now,
+                                        locked_until=now + Idempotency.LEASE, expires_at=now + Idempotency.TTL))
+        try:
+            self.session.commit()
+        except IntegrityError:
+            # A concurrent retry claimed it first
+            self.session.rollback()
+            entry = self.session.get(IdempotencyKey, key, populate_existing=True)
+            self.session.commit()
+            return entry if entry is not None else IdempotencyKey(key=key, request_hash=request_hash)
+        return None
+
+    @instrumented
+    def complete_idempotency_key(self, key: str, status: int, body: bytes):
+        """Store the response of a request that claimed its key"""
+        self.session.rollback()
+        self.session.query(IdempotencyKey) \
+            .filter(IdempotencyKey.key == key) \
+            .update({IdempotencyKey.status: status, IdempotencyKey.body: body, IdempotencyKey.locked_until: None},
+                    synchronize_session=False)
+        self.session.commit()
 
-        return True
\ No newline at end of file
+    @instrumented
+    def release_idempotency_key(self, key: str):
+        """Drop the placeholder of a request that failed, so a retry runs it again"""
+        self.session.rollback()
+        self.session.query(IdempotencyKey) \
+            .filter(IdempotencyKey.key == key) \
+            .filter(IdempotencyKey.status == None) \
+            .delete(synchronize_session=False)
+        self.session.commit()
@@ -3,7 +3,7 @@ class ConferenceExists(Exception):
 
     def __init__(self, id=None, message=None):
         self.id = id
-        self.message = 'This room already exists.'
+        self.message = message or 'This room already exists.'
 
 
 class ConferenceNotAllowed(Exception):
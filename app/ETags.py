@@ -0,0 +1,24 @@
+from werkzeug.http import parse_etags, quote_etag, unquote_etag
+import hashlib
+
+
+def tenant_etag(owner_id: str, version: int, route: str = '', arguments: dict = None) -> str:
+    """Get the ETag of the list responses of a tenant at a version of its counter.
+    The tenant, the route and the parsed list arguments are part of the tag, so a list cached
+    for another token, list or page never matches."""
+    variant = '\n'.join([owner_id, route, *(f'{key}={value!r}' for key, value in sorted((arguments or {}).items()))])
+    digest = hashlib.sha256(variant.encode('utf-8')).hexdigest()[:16]
+    return quote_etag(f'{digest}-{version}', weak=True)
+
+
+def row_etag(id: int, version: int) -> str:
+    """Get the ETag of a single conference or reservation at a version of its row"""
+    return quote_etag(f'{id}-{version}', weak=True)
+
+
+def matches(if_none_match: str, etag: str) -> bool:
+    """Check if an If-None-Match header value lists etag, compared weakly"""
+    if not if_none_match:
+        return False
+    tag, _ = unquote_etag(etag)
+    return parse_etags(if_none_match).contains_weak(tag)
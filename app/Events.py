@@ -0,0 +1,67 @@
+from datetime import timedelta
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, JSON, Index
+import os
+from Reservation import Base
+
+# How long events are kept for consumers, and how long a poll waits for new ones at most
+RETENTION = timedelta(hours=float(os.getenv('RESERVATION_SERVICE_EVENTS_RETENTION_HOURS', 72)))
+MAX_WAIT = float(os.getenv('RESERVATION_SERVICE_EVENTS_MAX_WAIT', 25))
+POLL_INTERVAL = float(os.getenv('RESERVATION_SERVICE_EVENTS_POLL_INTERVAL', 0.5))
+MAX_LIMIT = int(os.getenv('RESERVATION_SERVICE_EVENTS_MAX_LIMIT', 1000))
+# Polls of a Flask worker process that may wait at the same time, each holds one of its threads
+MAX_WAITING = int(os.getenv('RESERVATION_SERVICE_EVENTS_MAX_WAITING', 2))
+
+
+class Event(Base):
+    """Append-only log of conference and reservation changes, for consumers that follow a tenant.
+
+    Events are written in the transaction of the change they describe, after the version
+    counter of the tenant was bumped. That row stays locked until the commit, so the ids
+    of the events of one tenant become visible in increasing order and can be used as cursor.
+    """
+    __tablename__ = 'events'
+    CONFERENCE_STARTED = 'conference.started'
+    CONFERENCE_ENDED = 'conference.ended'
+    RESERVATION_CREATED = 'reservation.created'
+    RESERVATION_DELETED = 'reservation.deleted'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    owner_id = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    reservation_id = Column(Integer)
+    name = Column(String)
+    data = Column(JSON)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_events_owner_id_id', owner_id, id),
+        Index('ix_events_created_at', created_at),
+    )
+
+    def __repr__(self):
+        return f'<Event(id={self.id}, type={self.type}, reservation_id={self.reservation_id})>'
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'type': self.type,
+            'reservation_id': self.reservation_id,
+            'name': self.name,
+            'created_at': self.created_at.isoformat(),
+            'data': self.data,
+        }
+
+
+def snapshot(event) -> dict:
+    """Get the fields of a reservation or conference an event carries, like the API returns them"""
+    return {
+        'id': event.id,
+        'mail_owner': event.mail_owner,
+        'name': event.name,
+        'duration': str(event.duration) if event.duration is not None else None,
+        'start_time': event.start_time.isoformat() if event.start_time is not None else None,
+        'end_time': event.end_time.isoformat() if event.end_time is not None else None,
+        'timezone': event.timezone,
+        'recurrence': event.recurrence,
+        'active': bool(event.active),
+    }
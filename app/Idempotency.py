@@ -0,0 +1,45 @@
+from datetime import timedelta
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, Index
+import hashlib
+import os
+from Reservation import Base
+
+# How long a stored response answers retries, and how long a request may hold its key before a retry takes it over
+TTL = timedelta(hours=float(os.getenv('RESERVATION_SERVICE_IDEMPOTENCY_TTL_HOURS', 24)))
+LEASE = timedelta(seconds=float(os.getenv('RESERVATION_SERVICE_IDEMPOTENCY_LEASE', 60)))
+MAX_KEY_LENGTH = 255
+HEADER = 'Idempotency-Key'
+
+
+class IdempotencyKey(Base):
+    """Responses of create requests by their Idempotency-Key, so retries get the stored response.
+
+    A request claims its key with a placeholder row before it runs, status stays NULL
+    until the response is stored. Rows expire after the TTL and are removed by the sweeper.
+    """
+    __tablename__ = 'idempotency_keys'
+
+    key = Column(String(64), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status = Column(Integer)
+    body = Column(LargeBinary)
+    created_at = Column(DateTime, nullable=False)
+    locked_until = Column(DateTime)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_idempotency_keys_expires_at', expires_at),
+    )
+
+    def __repr__(self):
+        return f'<IdempotencyKey(key={self.key}, status={self.status}, expires_at={self.expires_at})>'
+
+
+def scoped_key(owner_id: str, method: str, route: str, key: str) -> str:
+    """Get the stored key for an Idempotency-Key header, scoped to the tenant and route"""
+    return hashlib.sha256(f'{owner_id}\n{method} {route}\n{key}'.encode('utf-8')).hexdigest()
+
+
+def request_digest(body: bytes) -> str:
+    """Get the digest of a request body, to reject a key reused for a different request"""
+    return hashlib.sha256(body or b'').hexdigest()
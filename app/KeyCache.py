@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from cryptography.hazmat.primitives.serialization import load_pem_public_key
+import logging
+import os
+import threading
+import time
+import asyncio
+import requests
+
+
+class KeyServiceError(Exception):
+    """Raised if the key service could not answer, as opposed to not knowing the kid."""
+
+
+class KeyCache:
+    """Per-process cache of JWT public keys keyed by kid.
+
+    Keys are fetched from the secret management service once, parsed into
+    loaded key objects and kept for a TTL. Kids the key service answers with
+    404 are cached negatively for a shorter TTL, and concurrent misses for one
+    kid share a single fetch. If a refresh fails for another reason (an error
+    status, a timeout), the expired key keeps being served and the fetch is
+    retried after the retry interval; failures are never cached as unknown kids.
+    """
+
+    def __init__(self, base_url: str = None, ttl: float = None, negative_ttl: float = None,
+                 max_size: int = None, timeout: float = None, retry_interval: float = None):
+        self.__logger = logging.getLogger()
+        self.base_url = base_url or os.getenv("SECRET_MANAGEMENT_SERVICE_PUBLIC_KEY_URL")
+        self.ttl = ttl if ttl is not None else float(os.getenv("PUBLIC_KEY_CACHE_TTL", 3600))
+        self.negative_ttl = negative_ttl if negative_ttl is not None else float(os.getenv("PUBLIC_KEY_CACHE_NEGATIVE_TTL", 30))
+        self.max_size = max_size if max_size is not None else int(os.getenv("PUBLIC_KEY_CACHE_SIZE", 128))
+        self.timeout = timeout if timeout is not None else float(os.getenv("PUBLIC_KEY_FETCH_TIMEOUT", 5))
+        self.retry_interval = retry_interval if retry_interval is not None \
+            else float(os.getenv("PUBLIC_KEY_FETCH_RETRY_INTERVAL", 5))
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.__inflight = {}
+
+    def get(self, kid: str):
+        """Get the loaded public key for kid, or None if the key service does not know it."""
+        with self._lock:
+            entry = self._lookup(kid)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            event = self.__inflight.get(kid)
+            leader = event is None
+            if leader:
+                event = self.__inflight[kid] = threading.Event()
+
+        if not leader:
+            # Another thread is fetching this kid, wait for its result
+            event.wait(self.timeout)
+            with self._lock:
+                entry = self._lookup(kid)
+            return entry[0] if entry is not None else None
+
+        try:
+            try:
+                key = self.fetch(kid)
+            except Exception as e:
+                with self._lock:
+                    return self._failed(kid, e)
+            with self._lock:
+                self._store(kid, key)
+            return key
+        finally:
+            with self._lock:
+                del self.__inflight[kid]
+            event.set()
+
+    def fetch(self, kid: str):
+        """Fetch the PEM for kid from the key service and load it. Return None for unknown kids."""
+        public_key_url = self.base_url + "/" + kid + '.pem'
+        response = requests.get(public_key_url, timeout=self.timeout)
+        return self._load(kid, response.status_code, response.content)
+
+    def clear(self):
+        """Drop all cached keys."""
+        with self._lock:
+            self._entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        """Get the cache counters"""
+        return {'hits': self.hits, 'misses': self.misses, 'failures': self.failures, 'size': len(self._entries)}
+
+    def _load(self, kid: str, status_code: int, content: bytes):
+        if status_code == 404:
+            self.__logger.warning('Public key %s not found', kid)
+            return None
+        if status_code != 200:
+            raise KeyServiceError(f'Key service answered {status_code} for public key {kid}')
+        return load_pem_public_key(content)
+
+    def _lookup(self, kid: str):
+        """Get the entry of kid if it has not expired. Expired entries stay until they are
+        replaced or evicted, so their key can be served while the key service fails."""
+        entry = self._entries.get(kid)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        self._entries.move_to_end(kid)
+        return entry
+
+    def _failed(self, kid: str, error: Exception):
+        """Handle a failed fetch: serve the expired key of kid until the retry interval
+        has passed, or return None without caching anything if there is none."""
+        self.failures += 1
+        entry = self._entries.get(kid)
+        if entry is not None and entry[0] is not None:
+            self.__logger.warning('Could not refresh public key %s, serving the expired key: %s', kid, error)
+            self._entries[kid] = (entry[0], time.monotonic() + self.retry_interval)
+            return entry[0]
+        self.__logger.warning('Could not fetch public key %s: %s', kid, error)
+        return None
+
+    def _store(self, kid: str, key):
+        ttl = self.ttl if key is not None else self.negative_ttl
+        self._entries[kid] = (key, time.monotonic() + ttl)
+        self._entries.move_to_end(kid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class AsyncKeyCache(KeyCache):
+    """KeyCache for the ASGI app, fetching keys with an async HTTP client.
+
+    Concurrent misses for one kid on the event loop await the same fetch.
+    """
+
+    def __init__(self, client=None, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            import httpx
+            client = httpx.AsyncClient(timeout=self.timeout)
+        self.client = client
+        self.__pending = {}
+
+    async def get(self, kid: str):
+        """Get the loaded public key for kid, or None if the key service does not know it."""
+        with self._lock:
+            entry = self._lookup(kid)
+            if entry is not None:
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        pending = self.__pending.get(kid)
+        if pending is None:
+            pending = self.__pending[kid] = asyncio.ensure_future(self.__fetch_and_store(kid))
+            pending.add_done_callback(lambda _: self.__pending.pop(kid, None))
+        # A cancelled caller must not cancel the fetch other callers are waiting for
+        return await asyncio.shield(pending)
+
+    async def fetch(self, kid: str):
+        """Fetch the PEM for kid from the key service and load it. Return None for unknown kids."""
+        public_key_url = self.base_url + "/" + kid + '.pem'
+        response = await self.client.get(public_key_url)
+        return self._load(kid, response.status_code, response.content)
+
+    async def __fetch_and_store(self, kid: str):
+        try:
+            key = await self.fetch(kid)
+        except Exception as e:
+            with self._lock:
+                return self._failed(kid, e)
+        with self._lock:
+            self._store(kid, key)
+        return key
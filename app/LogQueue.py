@@ -0,0 +1,58 @@
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import logging
+import os
+import queue
+import sys
+
+LOG_FORMAT = os.getenv('RESERVATION_SERVICE_LOG_FORMAT', '%(asctime)s %(levelname)s %(name)s %(process)d %(message)s')
+
+_queue_handler = None
+_handler = None
+_listener = None
+
+
+def configure_logging(level: str = None):
+    """Send log records through a queue to a background thread that writes them to stderr.
+
+    Request threads only enqueue records, so a slow stdout/stderr pipe never blocks them.
+    Records below the level are dropped before their message is formatted. Safe to call
+    more than once.
+    """
+    global _queue_handler, _handler
+    level = level or os.getenv('RESERVATION_SERVICE_LOG_LEVEL', 'INFO')
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    if _handler is not None:
+        return
+
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    _start_listener()
+    atexit.register(stop_logging)
+
+
+def after_fork():
+    """Restart the writer thread in a forked worker, threads do not survive fork"""
+    if _queue_handler is not None:
+        # The parent's queue may have been locked by its writer thread at fork time
+        _queue_handler.queue = queue.SimpleQueue()
+        _start_listener()
+
+
+def stop_logging():
+    """Write out the queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def _start_listener():
+    global _listener
+    _listener = QueueListener(_queue_handler.queue, _handler, respect_handler_level=True)
+    _listener.start()
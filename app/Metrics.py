@@ -0,0 +1,289 @@
+"""Prometheus metrics and optional OpenTelemetry spans.
+
+Metrics are recorded with prometheus_client and rendered in the Prometheus text format
+by the /metrics endpoints. The instrumentation stays on in production; it can be switched
+off with RESERVATION_SERVICE_METRICS_ENABLED=false.
+
+With several worker processes, set PROMETHEUS_MULTIPROC_DIR to an empty directory shared
+by them (e.g. on /dev/shm) before the service starts. prometheus_client then keeps the
+samples of every process in memory-mapped files there, and /metrics sums the counters and
+histograms of all workers, including those that exited. Values read on collection (pools,
+caches) are those of the worker answering the scrape, with a pid label.
+
+Set RESERVATION_SERVICE_TRACING=true to also open OpenTelemetry spans for requests,
+request stages and Manager calls. The opentelemetry packages and exporter are then
+configured through the standard OTEL_* environment variables.
+"""
+from contextvars import ContextVar
+from functools import wraps
+from prometheus_client import CollectorRegistry, Counter, Histogram, generate_latest, multiprocess, CONTENT_TYPE_LATEST
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+import glob
+import os
+import time
+
+ENABLED = os.getenv('RESERVATION_SERVICE_METRICS_ENABLED', 'true').lower() == 'true'
+TRACING = os.getenv('RESERVATION_SERVICE_TRACING', 'false').lower() == 'true'
+# Read by prometheus_client when it is imported, so it has to be set before the service starts
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+# Latency buckets in seconds, from a cache hit to a slow database round trip
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+if TRACING:
+    from opentelemetry import context as otel_context, trace
+    tracer = trace.get_tracer('reservation-service')
+else:
+    tracer = None
+
+
+class Callback:
+    """Counter or gauge read from other objects when the metrics are collected, as a prometheus_client collector.
+    The callback returns (labelvalues, value) pairs, pid adds the process as a label."""
+
+    def __init__(self, name: str, documentation: str, type: str, callback, labelnames=(), pid: int = None):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.pid = pid
+
+    def collect(self):
+        family_class = CounterMetricFamily if self.type == 'counter' else GaugeMetricFamily
+        extra = (str(self.pid),) if self.pid is not None else ()
+        family = family_class(self.name, self.documentation, labels=self.labelnames + (('pid',) if extra else ()))
+        for labelvalues, value in self.callback():
+            family.add_metric(tuple(str(label) for label in labelvalues) + extra, value)
+        yield family
+
+    def for_process(self, pid: int) -> 'Callback':
+        """Get this collector with the pid label, for scrapes that merge the samples of several processes"""
+        return Callback(self.name, self.documentation, self.type, self.callback, self.labelnames, pid)
+
+
+REGISTRY = CollectorRegistry()
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_LATENCY = Histogram(
+    'reservation_http_request_duration_seconds', 'Time to handle a request, by route template',
+    ['route', 'method', 'status'], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+STAGE_LATENCY = Histogram(
+    'reservation_request_stage_duration_seconds', 'Time spent in a stage of request handling',
+    ['stage'], buckets=LATENCY_BUCKETS, registry=REGISTRY)
+MANAGER_LATENCY = Histogram(
+    'reservation_manager_call_duration_seconds', 'Time spent in a Manager method', ['method'],
+    buckets=LATENCY_BUCKETS, registry=REGISTRY)
+REQUEST_QUERIES = Histogram(
+    'reservation_db_queries_per_request', 'Database statements executed per request', ['route'],
+    buckets=COUNT_BUCKETS, registry=REGISTRY)
+QUERIES = Counter('reservation_db_queries', 'Database statements executed', registry=REGISTRY)
+POOL_CHECKOUT_LATENCY = Histogram(
+    'reservation_db_pool_checkout_duration_seconds',
+    'Time to get a connection from the pool, waiting for a free one or opening a new one',
+    buckets=LATENCY_BUCKETS, registry=REGISTRY)
+ADMISSION_REJECTED = Counter(
+    'reservation_admission_rejected', 'Requests answered with 429 by the per-tenant admission control', ['route'],
+    registry=REGISTRY)
+IDEMPOTENT_REPLAYS = Counter(
+    'reservation_idempotent_replays', 'Retries answered with the stored response of their Idempotency-Key', ['route'],
+    registry=REGISTRY)
+
+# Caches and engines reported on collection, by name
+caches = {}
+engines = {}
+
+
+def cache_requests():
+    for name, cache in caches.items():
+        stats = cache.stats
+        yield (name, 'hit'), stats['hits']
+        yield (name, 'miss'), stats['misses']
+
+
+def cache_hit_ratios():
+    for name, cache in caches.items():
+        stats = cache.stats
+        requests = stats['hits'] + stats['misses']
+        yield (name,), stats['hits'] / requests if requests else 0.0
+
+
+def pool_connections():
+    for name, engine in engines.items():
+        pool = engine().pool
+        if hasattr(pool, 'checkedout'):
+            yield (name, 'checked_out'), pool.checkedout()
+            yield (name, 'idle'), pool.checkedin()
+
+
+CALLBACKS = [
+    Callback('reservation_cache_requests', 'Cache lookups by result', 'counter', cache_requests, ['cache', 'result']),
+    Callback('reservation_cache_hit_ratio', 'Share of cache lookups that hit', 'gauge', cache_hit_ratios, ['cache']),
+    Callback('reservation_db_pool_connections', 'Pooled database connections by state', 'gauge',
+             pool_connections, ['pool', 'state']),
+]
+for collector in CALLBACKS:
+    REGISTRY.register(collector)
+
+
+def render() -> bytes:
+    """Render the metrics of all workers if they share PROMETHEUS_MULTIPROC_DIR, else those of this process"""
+    if not MULTIPROC_DIR:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, MULTIPROC_DIR)
+    for collector in CALLBACKS:
+        registry.register(collector.for_process(os.getpid()))
+    return generate_latest(registry)
+
+
+def after_fork():
+    """Start over in a forked worker, the samples recorded before the fork belong to the parent.
+    In multiprocess mode prometheus_client notices the new pid and opens files of its own."""
+    if MULTIPROC_DIR:
+        return
+    for metric in (REQUEST_LATENCY, STAGE_LATENCY, MANAGER_LATENCY, REQUEST_QUERIES, ADMISSION_REJECTED,
+                   IDEMPOTENT_REPLAYS):
+        metric.clear()
+    QUERIES.reset()
+    # prometheus_client has no public reset for histograms without labels
+    POOL_CHECKOUT_LATENCY._metric_init()
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited worker, its counters and histograms are kept"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid, MULTIPROC_DIR)
+
+
+def clear_store():
+    """Remove the files of processes of an earlier run from PROMETHEUS_MULTIPROC_DIR, as prometheus_client expects"""
+    if not MULTIPROC_DIR:
+        return
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, '*.db')):
+        pid = os.path.basename(path)[:-3].rsplit('_', 1)[-1]
+        if pid != str(os.getpid()):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def watch_cache(name: str, cache):
+    """Report the hit and miss counters of a KeyCache or TokenCache"""
+    caches[name] = cache
+
+
+def watch_engine(name: str, engine):
+    """Report the pool of an engine, given as a callable so lazily created engines are not forced"""
+    engines[name] = engine
+
+
+def span(name: str):
+    """Open an OpenTelemetry span if tracing is enabled, to be closed with end_span"""
+    if tracer is None:
+        return None
+    current = tracer.start_span(name)
+    return current, otel_context.attach(trace.set_span_in_context(current))
+
+
+def end_span(opened, **attributes):
+    if opened is None:
+        return
+    current, token = opened
+    otel_context.detach(token)
+    for key, value in attributes.items():
+        current.set_attribute(key, value)
+    current.end()
+
+
+class Stage:
+    """Times a block into STAGE_LATENCY, e.g. with Stage('jwt_decode'): ..."""
+
+    __slots__ = ('name', 'started', 'opened')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.opened = span(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            STAGE_LATENCY.labels(self.name).observe(time.perf_counter() - self.started)
+        end_span(self.opened)
+
+
+def instrumented(method):
+    """Time a Manager method into MANAGER_LATENCY"""
+    if not ENABLED:
+        return method
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        opened = span(f'Manager.{name}')
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            MANAGER_LATENCY.labels(name).observe(time.perf_counter() - started)
+            end_span(opened)
+
+    return wrapper
+
+
+# Statement count of the current request, a one-item list
+query_counter = ContextVar('reservation_query_counter', default=None)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    if not ENABLED:
+        return
+    QUERIES.inc()
+    counter = query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+class RequestMetrics:
+    """Records one request: its latency, its statement count and its span"""
+
+    __slots__ = ('started', 'queries', 'token', 'opened')
+
+    def __init__(self, name: str):
+        self.queries = [0]
+        self.token = query_counter.set(self.queries)
+        self.opened = span(name)
+        self.started = time.perf_counter()
+
+    def finish(self, route: str, method: str, status: int):
+        REQUEST_LATENCY.labels(route, method, status).observe(time.perf_counter() - self.started)
+        REQUEST_QUERIES.labels(route).observe(self.queries[0])
+        query_counter.reset(self.token)
+        end_span(self.opened, **{'http.route': route, 'http.status_code': status})
+
+
+def timed_pool(pool_class):
+    """Subclass a queue pool so that connection checkouts are timed into POOL_CHECKOUT_LATENCY"""
+    class TimedPool(pool_class):
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                POOL_CHECKOUT_LATENCY.observe(time.perf_counter() - started)
+
+    TimedPool.__name__ = TimedPool.__qualname__ = 'Timed' + pool_class.__name__
+    return TimedPool
+
+
+TimedQueuePool = timed_pool(QueuePool)
+TimedAsyncAdaptedQueuePool = timed_pool(AsyncAdaptedQueuePool)
@@ -0,0 +1,56 @@
+"""Response models shared by the Flask app and the ASGI app, so both serialize rows the same way"""
+from flask_restx import Model, fields
+import os
+from Serializer import compile_model
+
+domain = None
+value = os.environ.get("DEPLOYMENT_ENV")
+
+if value == "development":
+    domain = "dev.sariska.io"
+elif value == "production":
+    domain = "sariska.io"
+
+conference_model = Model('Conference', {
+    'id': fields.Integer(
+        required=True,
+        example=1245,
+        description='The id created reservation'
+    ),
+    'mail_owner': fields.String(
+        required=True,
+        example='owner_user_id@'+domain,
+        description='The email address of the conference owner.'
+    ),
+    'name': fields.String(
+        required=True,
+        example='myroom123',
+        description='The name of the conference room.'
+    ),
+    'duration': fields.String(
+        required=True,
+        example=60,  # Sample duration in minutes
+        description='The duration of the conference in minutes.'
+    ),
+    'start_time': fields.DateTime(
+        required=True,
+        example='2023-09-28T15:08',
+        description='The start time of the conference in ISO 8601 format.'
+    ),
+    'timezone': fields.String(
+        required=True,
+        example='America/New York',
+        default='America/New York',
+        description='The timezone of the conference.'
+    ),
+    'pin': fields.String(
+        example='1234',  # Remove required=True for an optional field
+        description='The PIN for accessing the conference (optional).'
+    ),
+    'recurrence': fields.String(
+        example='FREQ=WEEKLY;BYDAY=MO;COUNT=10',
+        description='RRULE for a recurring reservation, start_time is its first occurrence (optional).'
+    ),
+})
+
+serialize_conference = compile_model(conference_model)
@@ -0,0 +1,211 @@
+from collections import OrderedDict
+import logging
+import math
+import os
+import threading
+import time
+
+# Token bucket for one key, run atomically on the shared backend.
+# The reply is the number of milliseconds until enough tokens are available, 0 if they were taken.
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = clock[1] * 1000 + math.floor(clock[2] / 1000)
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate / 1000)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+
+def refill(tokens: float, updated: float, now: float, rate: float, burst: float, cost: float = 1):
+    """Take cost tokens from a bucket last updated at updated (milliseconds).
+    Returns the tokens left and the milliseconds to wait, 0 if the tokens were taken."""
+    tokens = min(burst, tokens + max(0, now - updated) * rate / 1000)
+    if tokens >= cost:
+        return tokens - cost, 0
+    return tokens, math.ceil((cost - tokens) * 1000 / rate)
+
+
+class MemoryBackend:
+    """Token buckets kept in this process, least recently used buckets are dropped first"""
+
+    def __init__(self, max_size: int = None):
+        self.max_size = max_size if max_size is not None else int(os.getenv("RESERVATION_SERVICE_RATE_LIMIT_BUCKETS", 10000))
+        self.__buckets = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1) -> int:
+        """Take cost tokens from the bucket of key, return the milliseconds to wait or 0"""
+        now = time.time() * 1000
+        with self.__lock:
+            tokens, updated = self.__buckets.get(key, (burst, now))
+            tokens, wait = refill(tokens, updated, now, rate, burst, cost)
+            self.__buckets[key] = (tokens, now)
+            self.__buckets.move_to_end(key)
+            if len(self.__buckets) > self.max_size:
+                self.__buckets.popitem(last=False)
+        return wait
+
+
+class RedisBackend:
+    """Token buckets shared by all workers and pods through Redis.
+    The client needs an eval() like redis.Redis, LocalRedis stands in for it offline."""
+
+    def __init__(self, client, prefix: str = 'reservation:rate:'):
+        self.client = client
+        self.prefix = prefix
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1) -> int:
+        """Take cost tokens from the bucket of key, return the milliseconds to wait or 0"""
+        return int(self.client.eval(TOKEN_BUCKET_SCRIPT, 1, self.prefix + key, rate, burst, cost))
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisBackend':
+        """Connect to Redis, requires the redis package"""
+        import redis
+        return cls(redis.Redis.from_url(url, socket_timeout=float(os.getenv("RESERVATION_SERVICE_RATE_LIMIT_REDIS_TIMEOUT", 0.05))))
+
+
+class LocalRedis:
+    """In-process stand-in for a Redis client, for tests and local runs without Redis.
+    It answers TOKEN_BUCKET_SCRIPT with the same arguments, replies and key expiry as Redis."""
+
+    def __init__(self):
+        self.__hashes = {}
+        self.__lock = threading.Lock()
+
+    def eval(self, script: str, numkeys: int, *args):
+        """Run TOKEN_BUCKET_SCRIPT for one key like Redis EVAL, other scripts raise ValueError"""
+        if script != TOKEN_BUCKET_SCRIPT or numkeys != 1:
+            raise ValueError('LocalRedis only answers TOKEN_BUCKET_SCRIPT for one key')
+        key, rate, burst, cost = args[0], float(args[1]), float(args[2]), float(args[3])
+        now = math.floor(time.time() * 1000)
+        with self.__lock:
+            tokens, updated, expires = self.__hashes.get(key, (burst, now, None))
+            if expires is not None and expires <= now:
+                tokens, updated = burst, now
+            tokens, wait = refill(tokens, updated, now, rate, burst, cost)
+            self.__hashes[key] = (tokens, now, now + math.ceil(burst * 1000 / rate) + 1000)
+        return wait
+
+    def __len__(self):
+        now = time.time() * 1000
+        with self.__lock:
+            return sum(1 for _, _, expires in self.__hashes.values() if expires > now)
+
+
+def parse_rules(value: str) -> dict:
+    """Parse per-route limits like 'POST /api/v1/scheduler/reservation=5:10;GET /api/v1/scheduler/reservation=20:40'
+    into {route: (rate per second, burst)}"""
+    rules = {}
+    for rule in filter(None, (rule.strip() for rule in (value or '').split(';'))):
+        route, limit = rule.rsplit('=', 1)
+        rate, burst = limit.split(':') if ':' in limit else (limit, limit)
+        rules[route.strip()] = (float(rate), float(burst))
+    return rules
+
+
+class AdmissionControl:
+    """Per-tenant admission for the API.
+
+    Every request of a tenant takes a token from the bucket of its tenant and route,
+    and the requests of one tenant that run at the same time in this process are capped,
+    so a single tenant can not take all connections of the pool. Both checks report the
+    seconds to wait before retrying instead of blocking. If the shared backend fails,
+    requests are admitted.
+    """
+
+    def __init__(self, backend=None, rate: float = None, burst: float = None, rules: dict = None,
+                 max_in_flight: int = None, retry_after: float = None):
+        self.__logger = logging.getLogger()
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.rate = rate if rate is not None else float(os.getenv("RESERVATION_SERVICE_RATE_LIMIT_RATE", 0))
+        self.burst = burst if burst is not None else float(os.getenv("RESERVATION_SERVICE_RATE_LIMIT_BURST", self.rate * 2))
+        self.rules = rules if rules is not None else parse_rules(os.getenv("RESERVATION_SERVICE_RATE_LIMIT_ROUTES"))
+        self.max_in_flight = max_in_flight if max_in_flight is not None else int(os.getenv("RESERVATION_SERVICE_TENANT_MAX_IN_FLIGHT", 0))
+        self.retry_after = retry_after if retry_after is not None else float(os.getenv("RESERVATION_SERVICE_TENANT_RETRY_AFTER", 1))
+        self.rejected = 0
+        self.__in_flight = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 or bool(self.rules) or self.max_in_flight > 0
+
+    def limit(self, route: str):
+        """Get (rate, burst) for a route, None if it is not limited"""
+        rule = self.rules.get(route)
+        if rule is not None:
+            return rule
+        return (self.rate, self.burst) if self.rate > 0 else None
+
+    def check_rate(self, tenant: str, route: str) -> float:
+        """Take a token for the tenant on route, return the seconds to wait or 0"""
+        limit = self.limit(route)
+        if limit is None:
+            return 0
+        try:
+            wait = self.backend.take(f'{tenant}:{route}', *limit)
+        except Exception as e:
+            self.__logger.warning('Rate limit backend failed, admitting the request: %s', e)
+            return 0
+        return wait / 1000
+
+    def enter(self, tenant: str, route: str) -> float:
+        """Admit a request of tenant on route. Returns 0 if it was admitted, then leave() must
+        be called when it is done, or else the seconds to wait before retrying."""
+        wait = self.check_rate(tenant, route)
+        if not wait and self.max_in_flight > 0:
+            with self.__lock:
+                count = self.__in_flight.get(tenant, 0)
+                if count >= self.max_in_flight:
+                    wait = self.retry_after
+                else:
+                    self.__in_flight[tenant] = count + 1
+        if wait:
+            self.rejected += 1
+        return wait
+
+    def leave(self, tenant: str):
+        """Release the in-flight slot of an admitted request"""
+        if self.max_in_flight <= 0:
+            return
+        with self.__lock:
+            count = self.__in_flight.get(tenant, 0) - 1
+            if count > 0:
+                self.__in_flight[tenant] = count
+            else:
+                self.__in_flight.pop(tenant, None)
+
+    def in_flight(self) -> dict:
+        """Get the admitted requests per tenant that have not left yet"""
+        with self.__lock:
+            return dict(self.__in_flight)
+
+
+def retry_after_header(wait: float) -> str:
+    """Format seconds to wait as a Retry-After value, in whole seconds"""
+    return str(max(1, math.ceil(wait)))
+
+
+def from_environment() -> AdmissionControl:
+    """Create the admission control of the service, on Redis if RESERVATION_SERVICE_RATE_LIMIT_REDIS_URL is set.
+    'local' uses the in-process Redis stand-in."""
+    url = os.getenv("RESERVATION_SERVICE_RATE_LIMIT_REDIS_URL")
+    if not url:
+        return AdmissionControl()
+    if url == 'local':
+        return AdmissionControl(RedisBackend(LocalRedis()))
+    return AdmissionControl(RedisBackend.from_url(url))
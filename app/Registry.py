@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from Reservation import Reservation
+from Version import Version
+
+
+class ActiveConferenceRegistry:
+    """Per-process copy of running conferences, keyed by name and by id.
+
+    Only conferences found running are kept; a lookup that finds none is asked from
+    the database every time, so the registry never answers that a room is taken.
+    Every change of a running conference bumps the version counter of the shard of
+    its room name. An entry remembers the version of its shard when it was loaded
+    and is dropped once that moved. The counters are read at most once per poll
+    interval, so other processes' changes become visible within that interval, and
+    invalidate() drops the entry of a room this process changed right away.
+    """
+
+    def __init__(self, poll_interval: float = None):
+        self.poll_interval = poll_interval if poll_interval is not None \
+            else float(os.getenv('ACTIVE_CONFERENCE_REGISTRY_POLL_INTERVAL', 1))
+        self.__lock = threading.Lock()
+        self.__versions = {}
+        self.__checked = None
+        self.__generation = 0
+        self.__by_name = {}
+        self.__by_id = {}
+        self.loads = 0
+
+    def get_by_name(self, session, name: str):
+        """Get the running conference of a room, or None"""
+        conference = self.__cached(session, name)
+        if conference is None:
+            conference = self.__load(session, Reservation.name == name)
+        return conference
+
+    def get_by_id(self, session, id):
+        """Get the running conference with the given id, or None"""
+        try:
+            id = int(id)
+        except (TypeError, ValueError):
+            return None
+        with self.__lock:
+            name = self.__by_id.get(id)
+        conference = self.__cached(session, name) if name is not None else None
+        if conference is None or conference.id != id:
+            conference = self.__load(session, Reservation.id == id)
+        return conference
+
+    def invalidate(self, *names: str):
+        """Drop the entries of rooms whose conference this process changed"""
+        with self.__lock:
+            self.__generation += 1
+            for name in names:
+                self.__drop(name)
+
+    def __drop(self, name: str):
+        entry = self.__by_name.pop(name, None)
+        if entry is not None:
+            self.__by_id.pop(entry[0].id, None)
+
+    def __cached(self, session, name: str):
+        versions = self.__current(session)
+        with self.__lock:
+            entry = self.__by_name.get(name)
+            if entry is None:
+                return None
+            conference, version = entry
+            if versions.get(Version.conferences(name), 0) != version:
+                self.__drop(name)
+                return None
+            return conference
+
+    def __load(self, session, criterion):
+        # Take the versions before the row, so a concurrent change leaves the entry stale
+        versions = self.__current(session)
+        with self.__lock:
+            generation = self.__generation
+            self.loads += 1
+        conference = session.query(Reservation) \
+            .filter(criterion) \
+            .filter(Reservation.active == True) \
+            .first()
+        if conference is None:
+            return None
+        # Detach the row so it can be shared read-only between requests
+        session.expunge(conference)
+
+        with self.__lock:
+            # Do not keep a row read before this process changed a conference
+            if generation == self.__generation:
+                self.__drop(conference.name)
+                self.__by_name[conference.name] = (conference, versions.get(Version.conferences(conference.name), 0))
+                self.__by_id[conference.id] = conference.name
+        return conference
+
+    def __current(self, session) -> dict:
+        """Get the shard versions, read again from the database once per poll interval"""
+        now = time.monotonic()
+        with self.__lock:
+            if self.__checked is not None and now - self.__checked < self.poll_interval:
+                return self.__versions
+
+        # The lock is not held during the query, so a slow database does not block
+        # lookups of other threads, or of other tasks on the same event loop.
+        versions = dict(session.query(Version.scope, Version.version)
+                        .filter(Version.scope.startswith(Version.CONFERENCES, autoescape=True)))
+        with self.__lock:
+            self.__versions = versions
+            self.__checked = now
+            return versions
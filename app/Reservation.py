@@ -1,14 +1,106 @@
-from datetime import datetime, timedelta
+from collections import namedtuple
+from datetime import datetime, timedelta, tzinfo
 from dateutil import parser as dp
+from dateutil.rrule import rrule, rrulestr, DAILY, WEEKLY
+from itertools import islice, takewhile
+from functools import lru_cache
 from typing import Union
+from zoneinfo import ZoneInfo
 import os
 import pytz
 from CustomExceptions import ConferenceNotAllowed
-from sqlalchemy import Column, Integer, String, DateTime, Interval, Boolean, Interval
+from sqlalchemy import Column, Integer, String, DateTime, Interval, Boolean, Interval, Index, DDL, event
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
 
+# Bounded series are expanded once when they are written, to store the end of their last occurrence
+MAX_OCCURRENCES = int(os.environ.get('RESERVATION_RECURRENCE_MAX_OCCURRENCES', 10000))
+# How far ahead series that never end are compared with each other
+RECURRENCE_HORIZON = timedelta(days=int(os.getenv('RESERVATION_RECURRENCE_HORIZON_DAYS', 366)))
+# Every overlap check may expand a series over the horizon, so keep that bounded
+MAX_HORIZON_OCCURRENCES = int(os.environ.get('RESERVATION_RECURRENCE_MAX_HORIZON_OCCURRENCES', 1000))
+
+
+@lru_cache(maxsize=1024)
+def parse_recurrence(recurrence: str, dtstart: datetime) -> rrule:
+    """Parse an RRULE string for a series starting at dtstart"""
+    rule = rrulestr(recurrence, dtstart=dtstart, forceset=False)
+    if not isinstance(rule, rrule):
+        raise ValueError('Only a single RRULE is supported.')
+    return rule
+
+
+def check_recurrence(rule: rrule):
+    """Raise ValueError for rules that repeat more often than daily, or more than
+    MAX_HORIZON_OCCURRENCES times within the recurrence horizon"""
+    if rule._freq > DAILY:
+        raise ValueError('A series can repeat at most daily.')
+    horizon_end = rule._dtstart + RECURRENCE_HORIZON
+    within = sum(1 for _ in islice(takewhile(lambda start: start <= horizon_end, rule), MAX_HORIZON_OCCURRENCES + 1))
+    if within > MAX_HORIZON_OCCURRENCES:
+        raise ValueError(f'A series can have at most {MAX_HORIZON_OCCURRENCES} occurrences '
+                         f'within {RECURRENCE_HORIZON.days} days.')
+
+
+# Rules of these frequencies without BY* parts repeat their first occurrence in fixed steps
+FIXED_STEPS = {DAILY: timedelta(days=1), WEEKLY: timedelta(weeks=1)}
+
+
+def occurrences_between(rule: rrule, start_time: datetime, end_time: datetime) -> list:
+    """Get the starts of the occurrences of a rule inside [start_time, end_time], like rule.between(inc=True).
+    rrule iterates from the first occurrence, so rules that repeat in fixed steps are computed directly."""
+    step = FIXED_STEPS.get(rule._freq)
+    if step is None or any(rule._original_rule.values()) or rule._bysetpos or rule._byeaster:
+        return rule.between(start_time, end_time, inc=True)
+    step *= rule._interval
+    dtstart = rule._dtstart
+    first = max(0, -((dtstart - start_time) // step))
+    last = (end_time - dtstart) // step
+    if rule._count is not None:
+        last = min(last, rule._count - 1)
+    if rule._until is not None:
+        last = min(last, (rule._until - dtstart) // step)
+    return [dtstart + n * step for n in range(first, last + 1)]
+
+
+@lru_cache(maxsize=1024)
+def get_timezone(name: str) -> tzinfo:
+    """Get the timezone for a stored timezone name, which may use spaces instead of underscores"""
+    return pytz.timezone(name.replace(' ', '_'))
+
+
+@lru_cache(maxsize=1024)
+def get_zoneinfo(name: str) -> Union[ZoneInfo, None]:
+    """Get the timezone as zoneinfo, read from the tz database of pytz so both agree"""
+    key = name.replace(' ', '_')
+    try:
+        with pytz.open_resource(key) as tzfile:
+            return ZoneInfo.from_file(tzfile, key=key)
+    except (OSError, ValueError):
+        return None
+
+
+def localize(when: datetime, name: str) -> datetime:
+    """Make a wall-clock time in the named timezone aware, like pytz localize(is_dst=False).
+    zoneinfo is much faster, pytz only decides times that are ambiguous or skipped around a DST change."""
+    zone = get_zoneinfo(name)
+    # pytz rounds the sub-minute offsets of historical local mean times, leave old dates to it
+    if zone is not None and when.year >= 1970:
+        aware = when.replace(tzinfo=zone)
+        offset = aware.utcoffset()
+        if offset == when.replace(tzinfo=zone, fold=1).utcoffset() and not offset.seconds % 60:
+            return aware
+    return get_timezone(name).localize(when)
+
+
+@lru_cache(maxsize=256)
+def format_offset(offset: timedelta) -> str:
+    """Format a UTC offset like strftime('%z')"""
+    sign = '-' if offset < timedelta(0) else '+'
+    minutes = abs(offset) // timedelta(minutes=1)
+    return f'{sign}{minutes // 60:02d}{minutes % 60:02d}'
+
 
 class Reservation(Base):
     """The Reservation class holds room reservations and running conferences."""
@@ -27,7 +119,24 @@ class Reservation(Base):
     user_name = Column(String)
     email = Column(String)
     avatar = Column(String)
-
+    # RRULE of a reservation series, start_time and end_time hold its first occurrence
+    recurrence = Column(String)
+    # End of the last occurrence of a series, NULL if the series does not end
+    recurrence_end = Column(DateTime)
+    # Incremented by the ORM on every update of the row, the ETag of its detail responses
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    # Indexes for the lookups done by Conferences.Manager
+    __table_args__ = (
+        Index('ix_reservations_name_active', name, active),
+        Index('ix_reservations_owner_id_active_id', owner_id, active, id),
+        Index('ix_reservations_name_start_time_end_time', name, start_time, end_time),
+        # Only one conference per room can run at a time. Running conferences are a small
+        # subset, so the unique index is partial where the database supports it.
+        Index('uq_reservations_active_name', name, unique=True,
+              postgresql_where=active == True, sqlite_where=active == True),
+    )
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Reservation(id={self.id}, name={self.name}, start_time={self.start_time})>'
@@ -40,8 +149,8 @@ class Reservation(Base):
         self.timezone = data.get('timezone', 'UTC')
         self.set_start_time(start_time=data.get('start_time'))
         self.set_duration(duration=data.get('duration', -1))
+        self.set_recurrence(recurrence=data.get('recurrence'))
         self.jitsi_server = os.environ.get('PUBLIC_URL')  # Public URL of the Jitsi web service
-        print("current_user", current_user)
         self.owner_id = current_user['context']['group']
         self.user_id = current_user['context']['user']['id']
         self.user_name = current_user['context']['user'].get('name', None)
@@ -51,19 +160,16 @@ class Reservation(Base):
         return self
 
     def set_start_time(self, start_time: Union[datetime, str]):
-        """Set the conference start time and make it timezone-aware"""
+        """Set the conference start time as wall-clock time in the timezone of the entry.
+        Times with a UTC offset are converted, every stored time is naive."""
 
         if isinstance(start_time, datetime):
             start_time = start_time
         else:
             start_time = dp.isoparse(start_time)
 
-        print("start_time", start_time)
-
-        # timezone = pytz.timezone(self.timezone.replace(' ', '_'))
-        # if (start_time.tzinfo is None or start_time.tzinfo.utcoffset(start_time) is None):
-        #     print("timezone.localize(start_time)", timezone.localize(start_time), start_time)
-        #     start_time = timezone.localize(start_time)
+        if start_time.tzinfo is not None:
+            start_time = start_time.astimezone(get_timezone(self.timezone or 'UTC')).replace(tzinfo=None)
 
         self.start_time = start_time
 
@@ -77,6 +183,114 @@ class Reservation(Base):
             self.duration = timedelta(seconds=duration)
         self.end_time = self.start_time + self.duration
 
+    def set_recurrence(self, recurrence: str = None):
+        """Set the recurrence rule of a series and the end of its last occurrence"""
+
+        self.recurrence = recurrence or None
+        self.recurrence_end = None
+        if self.recurrence is None:
+            return
+
+        rule = self.recurrence_rule
+        check_recurrence(rule)
+        if rule._count is None and rule._until is None:
+            return
+        last = None
+        for count, last in enumerate(rule):
+            if count >= MAX_OCCURRENCES:
+                raise ValueError(f'A series can have at most {MAX_OCCURRENCES} occurrences.')
+        if last is None:
+            raise ValueError('The recurrence rule has no occurrences.')
+        self.recurrence_end = last + self.duration
+
+    @property
+    def recurrence_rule(self) -> Union[rrule, None]:
+        """Get the parsed recurrence rule of a series"""
+
+        if not self.recurrence:
+            return None
+        return parse_recurrence(self.recurrence, self.start_time)
+
+    @property
+    def span_end(self) -> Union[datetime, None]:
+        """Get the end of the last occurrence, None for series that do not end"""
+
+        if not self.recurrence:
+            return self.end_time
+        return self.recurrence_end
+
+    def occurrences(self, start_time: datetime, end_time: datetime) -> list:
+        """Get (start, end) of every occurrence that overlaps [start_time, end_time].
+        Series are only expanded inside the given window."""
+
+        if not self.recurrence:
+            if self.start_time <= end_time and self.end_time >= start_time:
+                return [(self.start_time, self.end_time)]
+            return []
+        starts = occurrences_between(self.recurrence_rule, start_time - self.duration, end_time)
+        return [(start, start + self.duration) for start in starts]
+
+    def overlaps_with(self, other: 'Reservation', horizon: timedelta) -> bool:
+        """Check if any occurrence of this entry overlaps any occurrence of the other one.
+        When neither of them ends, only the horizon after the later start is compared."""
+
+        start_time = max(self.start_time, other.start_time)
+        ends = [end for end in (self.span_end, other.span_end) if end is not None]
+        end_time = min(ends) if ends else start_time + horizon
+        if start_time > end_time:
+            return False
+
+        mine = self.occurrences(start_time, end_time)
+        theirs = other.occurrences(start_time, end_time)
+        i = j = 0
+        while i < len(mine) and j < len(theirs):
+            if mine[i][0] <= theirs[j][1] and theirs[j][0] <= mine[i][1]:
+                return True
+            if mine[i][1] < theirs[j][1]:
+                i += 1
+            else:
+                j += 1
+        return False
+
+    def occurrence(self, start_time: datetime) -> 'Reservation':
+        """Get a single, unsaved reservation for the occurrence of this series starting at start_time"""
+
+        event = Reservation(
+            id=self.id,
+            name=self.name,
+            timezone=self.timezone,
+            pin=self.pin,
+            mail_owner=self.mail_owner,
+            active=self.active,
+            user_id=self.user_id,
+            owner_id=self.owner_id,
+            user_name=self.user_name,
+            email=self.email,
+            avatar=self.avatar,
+        )
+        event.set_start_time(start_time=start_time)
+        event.set_duration(duration=self.duration)
+        return event
+
+    def start_occurrence(self, owner: str = None, start_time: str = None) -> 'Reservation':
+        """Check if a conference of this series is allowed to start and return it as a new entry.
+        The conference starts with the latest occurrence at or before start_time."""
+
+        if self.mail_owner != owner:
+            raise ConferenceNotAllowed('This user is not allowed to start this conference!')
+
+        when = dp.isoparse(start_time) if start_time is not None else datetime.now(pytz.utc)
+        if when.tzinfo is not None:
+            # Occurrences are in the wall-clock time of the reservation
+            when = when.astimezone(get_timezone(self.timezone)).replace(tzinfo=None)
+        occurrence_start = self.recurrence_rule.before(when, inc=True)
+        if occurrence_start is None:
+            raise ConferenceNotAllowed('The conference has not started yet.')
+
+        conference = self.occurrence(occurrence_start)
+        conference.id = None
+        return conference
+
     @property
     def start_time_formatted(self) -> str:
         """Get the timezone-aware start date formatted for the frontend"""
@@ -92,15 +306,12 @@ class Reservation(Base):
     @property
     def start_time_aware(self) -> datetime:
         """Get the timezone-aware start date"""
-        timezone = pytz.timezone(self.timezone.replace(' ', '_'))
-        return timezone.localize(self.start_time)
+        return localize(self.start_time, self.timezone)
 
     @property
     def end_time_aware(self) -> datetime:
         """Get the timezone-aware end date"""
-        
-        timezone = pytz.timezone(self.timezone.replace(' ', '_'))
-        return timezone.localize(self.end_time)
+        return localize(self.end_time, self.timezone)
 
     @property
     def room_url(self):
@@ -117,11 +328,19 @@ class Reservation(Base):
         """Get a Java SimpleDateFormat compatible date string.
         Disgusting hack to make isoformat() print the precision time in milliseconds instead of
         microseconds, becasue Java can't handle that. -.-
+        The string is cached on the instance until start_time or timezone change.
         """
 
-        start_time = self.start_time_aware.strftime('%Y-%m-%dT%H:%M:%S.ms%z')
+        key = (self.start_time, self.timezone)
+        cached = self.__dict__.get('_simple_date_format_start_time')
+        if cached is not None and cached[0] == key:
+            return cached[1]
 
-        return start_time.replace('ms', '{:03.0f}'.format(self.start_time.microsecond//1000))
+        when = self.start_time
+        start_time = f'{when.year:04d}-{when.month:02d}-{when.day:02d}T{when.hour:02d}:{when.minute:02d}:' \
+                     f'{when.second:02d}.{when.microsecond // 1000:03d}{format_offset(self.start_time_aware.utcoffset())}'
+        self._simple_date_format_start_time = (key, start_time)
+        return start_time
 
     def get_duration_in_seconds(self) -> int:
         """Get the conference duration in seconds."""
@@ -149,8 +368,6 @@ class Reservation(Base):
         """Check if the conference is allowed to start.
         The conference is check for owner and/or starting time."""
 
-        print("self.start_time_aware", self.start_time_aware, dp.isoparse(start_time))
-
         if start_time is None:
             start_time = datetime.now(datetime.timezone.utc).isoformat()
             
@@ -160,3 +377,39 @@ class Reservation(Base):
             raise ConferenceNotAllowed('The conference has not started yet.')
 
         return True
+
+
+class ReservationRecord(namedtuple('ReservationRecord', ['id', 'name', 'mail_owner', 'start_time', 'end_time',
+                                                         'duration', 'timezone', 'pin', 'recurrence', 'version'])):
+    """Read-only row with the columns the API responses and their ETags need.
+    Loaded by Conferences.Manager for its read endpoints without ORM entities or identity map,
+    series are expanded the same way as Reservation."""
+    __slots__ = ()
+
+    recurrence_rule = Reservation.recurrence_rule
+    occurrences = Reservation.occurrences
+
+    def occurrence(self, start_time: datetime) -> 'ReservationRecord':
+        """Get the record of the occurrence of this series starting at start_time, like Reservation.occurrence"""
+
+        return self._replace(start_time=start_time, end_time=start_time + self.duration, recurrence=None)
+
+
+def record_columns() -> list:
+    """Get the Reservation columns selected for a ReservationRecord, in field order"""
+    return [getattr(Reservation, field) for field in ReservationRecord._fields]
+
+
+# On PostgreSQL, overlapping reservations of a room are rejected by an exclusion constraint.
+# Its GiST index on (name, tsrange(start_time, end_time)) also serves the overlap queries in
+# Conferences.Manager. Existing databases get it from migrations/002_reservation_overlap_constraint.sql.
+event.listen(
+    Reservation.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS btree_gist').execute_if(dialect='postgresql')
+)
+event.listen(
+    Reservation.__table__, 'after_create',
+    DDL("ALTER TABLE reservations ADD CONSTRAINT ex_reservations_name_during "
+        "EXCLUDE USING gist (name WITH =, tsrange(start_time, end_time, '[]') WITH &&) "
+        "WHERE (active = false)").execute_if(dialect='postgresql')
+)
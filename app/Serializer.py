@@ -0,0 +1,70 @@
+from datetime import datetime
+from flask_restx import fields as restx_fields, marshal
+from flask_restx.marshalling import make
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def field_expression(index: int, key: str, field) -> str:
+    """Get the generated code that formats value v{index} like field.output would"""
+    value = f'v{index}'
+    default = f'_default{index}'
+    if type(field) is restx_fields.String:
+        return f'{default} if {value} is None else str({value})'
+    if type(field) is restx_fields.Integer:
+        return f'{default} if {value} is None else int({value})'
+    if type(field) is restx_fields.DateTime and field.dt_format == 'iso8601':
+        return f'{default} if {value} is None else {value}.isoformat() if {value}.__class__ is _datetime ' \
+               f'else _field{index}.format({value})'
+    if type(field) is restx_fields.Raw:
+        return f'{default} if {value} is None else {value}'
+    return None
+
+
+def compile_model(model):
+    """Build a function that serializes one object like marshal(obj, model).
+
+    The attribute access and formatting of every field is generated once, so serializing
+    a row is a single dict display instead of a walk over the field objects. Fields the
+    generated code does not cover are delegated to their own output() method, and dicts
+    go through marshal itself.
+    """
+    namespace = {'_marshal': marshal, '_model': model, '_datetime': datetime, '_getattr': getattr}
+    lines = [
+        'def serialize(obj):',
+        '    if isinstance(obj, dict):',
+        '        return _marshal(obj, _model)',
+    ]
+    items = []
+    for index, (key, field) in enumerate(getattr(model, 'resolved', model).items()):
+        if isinstance(field, dict):
+            # Nested dicts of fields are marshalled from the same object
+            namespace[f'_field{index}'] = field
+            items.append(f'        {key!r}: _marshal(obj, _field{index}),')
+            continue
+        field = make(field)
+        namespace[f'_field{index}'] = field
+        expression = None
+        if field.attribute is None and not field.mask and not callable(field.default):
+            namespace[f'_default{index}'] = field.format(field.default) if field.default else field.default
+            expression = field_expression(index, key, field)
+        if expression is None:
+            items.append(f'        {key!r}: _field{index}.output({key!r}, obj),')
+        else:
+            lines.append(f'    v{index} = _getattr(obj, {key!r}, None)')
+            items.append(f'        {key!r}: {expression},')
+    lines += ['    return {', *items, '    }']
+
+    exec(compile('\n'.join(lines), f'<serializer {getattr(model, "name", "model")}>', 'exec'), namespace)
+    return namespace['serialize']
+
+
+def dumps(data) -> bytes:
+    """Encode data as JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data).encode()
@@ -0,0 +1,210 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select, literal
+import argparse
+import logging
+import os
+import threading
+from Reservation import Reservation
+from Version import Version
+from Idempotency import IdempotencyKey
+from Events import Event
+import Events
+from Archive import ReservationArchive, ARCHIVED_COLUMNS, ensure_partitions, drop_partitions
+
+
+class Sweeper:
+    """Retires conferences and reservations whose end_time is past the retention period,
+    and removes idempotency keys past their TTL and events past the event retention.
+
+    In archive mode (the default) retired rows are moved to the reservations archive,
+    whose history is dropped after the archive retention. In delete mode they are deleted.
+
+    Expired rows are claimed in bounded batches with SELECT ... FOR UPDATE SKIP LOCKED,
+    so several replicas can sweep at the same time without blocking each other.
+    Times are stored in the wall-clock time of each reservation, so the retention
+    should stay above the largest UTC offset (the default is one day).
+    """
+
+    def __init__(self, manager, retention: timedelta = None, batch_size: int = None, interval: float = None,
+                 mode: str = None, archive_retention: timedelta = None):
+        self.__logger = logging.getLogger()
+        self.manager = manager
+        self.mode = mode or os.getenv('RESERVATION_SWEEPER_MODE', 'archive')
+        self.archive_retention = archive_retention if archive_retention is not None \
+            else timedelta(days=float(os.getenv('RESERVATION_ARCHIVE_RETENTION_DAYS', 400)))
+        self.retention = retention if retention is not None \
+            else timedelta(hours=float(os.getenv('RESERVATION_SWEEPER_RETENTION_HOURS', 24)))
+        self.batch_size = batch_size if batch_size is not None else int(os.getenv('RESERVATION_SWEEPER_BATCH_SIZE', 500))
+        self.interval = interval if interval is not None else float(os.getenv('RESERVATION_SWEEPER_INTERVAL', 300))
+        self.passes = 0
+        self.swept = {'conferences': 0, 'reservations': 0, 'idempotency_keys': 0, 'events': 0}
+        self.last_pass = {'conferences': 0, 'reservations': 0, 'idempotency_keys': 0, 'events': 0}
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def sweep(self) -> dict:
+        """Run one pass and return the number of rows retired per kind"""
+        cutoff = datetime.utcnow() - self.retention
+        archive_cutoff = datetime.utcnow() - self.archive_retention
+        if self.mode == 'archive':
+            ensure_partitions(self.manager.engine, since=archive_cutoff)
+        try:
+            swept = {
+                'conferences': self.sweep_expired(active=True, cutoff=cutoff),
+                'reservations': self.sweep_expired(active=False, cutoff=cutoff),
+                'idempotency_keys': self.sweep_idempotency_keys(datetime.utcnow()),
+                'events': self.sweep_events(datetime.utcnow() - Events.RETENTION),
+            }
+        finally:
+            self.manager.remove_session()
+        if self.mode == 'archive':
+            dropped = drop_partitions(self.manager.engine, before=archive_cutoff)
+            if dropped:
+                self.__logger.info('Sweeper dropped %d archive partitions older than %s', dropped, archive_cutoff)
+
+        self.passes += 1
+        self.last_pass = swept
+        for kind, count in swept.items():
+            self.swept[kind] += count
+        self.__logger.info('Sweeper retired %d conferences and %d reservations that ended before %s, '
+                           'and removed %d expired idempotency keys and %d events',
+                           swept['conferences'], swept['reservations'], cutoff, swept['idempotency_keys'], swept['events'])
+        return swept
+
+    def sweep_expired(self, active: bool, cutoff: datetime) -> int:
+        """Retire expired conferences or reservations in batches, return how many were retired"""
+        session = self.manager.session
+        # Series are only expired once their last occurrence has ended
+        expired = or_(
+            and_(Reservation.recurrence == None, Reservation.end_time < cutoff),
+            and_(Reservation.recurrence != None, Reservation.recurrence_end < cutoff),
+        )
+        total = 0
+        while True:
+            rows = session.query(Reservation.id, Reservation.name) \
+                .filter(Reservation.active == active) \
+                .filter(expired) \
+                .order_by(Reservation.id) \
+                .limit(self.batch_size) \
+                .with_for_update(skip_locked=True) \
+                .all()
+            if not rows:
+                break
+
+            ids = [id for id, _ in rows]
+            names = {name for _, name in rows}
+            if active:
+                # Conference shards before the tenants retire() bumps, in the order of Manager.bump_version
+                for scope in sorted({Version.conferences(name) for name in names}):
+                    self.manager.bump_version(scope)
+            self.retire(ids, Event.CONFERENCE_ENDED if active else Event.RESERVATION_DELETED)
+            session.commit()
+            if active:
+                self.manager.registry.invalidate(*names)
+            total += len(ids)
+            if len(ids) < self.batch_size:
+                break
+        return total
+
+    def sweep_idempotency_keys(self, now: datetime) -> int:
+        """Delete stored responses past their TTL in batches, return how many were deleted"""
+        session = self.manager.session
+        total = 0
+        while True:
+            keys = [key for (key,) in session.query(IdempotencyKey.key)
+                    .filter(IdempotencyKey.expires_at < now)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)]
+            if not keys:
+                break
+
+            session.query(IdempotencyKey) \
+                .filter(IdempotencyKey.key.in_(keys)) \
+                .delete(synchronize_session=False)
+            session.commit()
+            total += len(keys)
+            if len(keys) < self.batch_size:
+                break
+        return total
+
+    def sweep_events(self, cutoff: datetime) -> int:
+        """Delete events created before cutoff in batches, return how many were deleted.
+        The highest deleted id is kept, so consumers with an older cursor learn that they missed events."""
+        session = self.manager.session
+        total = 0
+        while True:
+            ids = [id for (id,) in session.query(Event.id)
+                   .filter(Event.created_at < cutoff)
+                   .order_by(Event.id)
+                   .limit(self.batch_size)
+                   .with_for_update(skip_locked=True)]
+            if not ids:
+                break
+
+            session.query(Event) \
+                .filter(Event.id.in_(ids)) \
+                .delete(synchronize_session=False)
+            session.query(Version) \
+                .filter(Version.scope == Version.EVENTS_PRUNED) \
+                .filter(Version.version < ids[-1]) \
+                .update({Version.version: ids[-1]}, synchronize_session=False)
+            session.commit()
+            total += len(ids)
+            if len(ids) < self.batch_size:
+                break
+        return total
+
+    def retire(self, ids: list, type: str):
+        """Archive and remove the claimed rows as part of the current transaction.
+        An event of the given type is recorded for each of them, so consumers of the change feed
+        drop them too. This bumps the counters of their tenants, so the ETags of their lists change."""
+        retired = self.manager.session.query(Reservation) \
+            .filter(Reservation.id.in_(ids)) \
+            .all()
+        self.manager.record_events(type, retired)
+        if self.mode == 'archive':
+            columns = [getattr(Reservation, name) for name in ARCHIVED_COLUMNS]
+            rows = select(*columns, literal(datetime.utcnow()).label('archived_at')) \
+                .where(Reservation.id.in_(ids))
+            self.manager.session.execute(
+                ReservationArchive.__table__.insert().from_select(ARCHIVED_COLUMNS + ['archived_at'], rows)
+            )
+        self.manager.session.query(Reservation) \
+            .filter(Reservation.id.in_(ids)) \
+            .delete(synchronize_session=False)
+
+    def start(self):
+        """Sweep every interval in a background thread"""
+        if self.__thread is not None:
+            return
+        self.__thread = threading.Thread(target=self.run, name='reservation-sweeper', daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        """Stop the background thread after the current pass"""
+        self.__stop.set()
+
+    def run(self):
+        """Sweep every interval until stopped"""
+        while not self.__stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                self.__logger.error('Sweeper pass failed: %s', e)
+            self.__stop.wait(self.interval)
+
+
+if __name__ == '__main__':
+    from Conferences import Manager
+    from LogQueue import configure_logging
+
+    parser = argparse.ArgumentParser(description='Retire conferences and reservations that have ended.')
+    parser.add_argument('--once', action='store_true', help='Run a single pass and exit')
+    args = parser.parse_args()
+
+    configure_logging()
+    sweeper = Sweeper(Manager())
+    if args.once:
+        sweeper.sweep()
+    else:
+        sweeper.run()
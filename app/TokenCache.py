@@ -0,0 +1,64 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+import time
+
+
+class TokenCache:
+    """Per-process cache of verified token claims keyed by a digest of the token.
+
+    Only tokens that passed full verification are inserted. An entry expires at
+    the earlier of the token's exp claim and the configured max age.
+    """
+
+    def __init__(self, max_age: float = None, max_size: int = None):
+        self.max_age = max_age if max_age is not None else float(os.getenv("TOKEN_CACHE_MAX_AGE", 300))
+        self.max_size = max_size if max_size is not None else int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """Get the cache key for a raw token"""
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token: str):
+        """Get the decoded claims for token, or None if it is not cached or expired."""
+        key = self.digest(token)
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and entry[1] > time.time():
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self.__entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, claims: dict):
+        """Cache the decoded claims of a verified token."""
+        expires = time.time() + self.max_age
+        if 'exp' in claims:
+            expires = min(expires, float(claims['exp']))
+        if self.max_size <= 0 or expires <= time.time():
+            return
+        key = self.digest(token)
+        with self.__lock:
+            self.__entries[key] = (claims, expires)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached tokens."""
+        with self.__lock:
+            self.__entries.clear()
+
+    @property
+    def stats(self) -> dict:
+        """Get the cache counters"""
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.__entries)}
@@ -0,0 +1,128 @@
+from datetime import timedelta
+from dateutil import parser as dp
+from dateutil.rrule import rrule, rrulestr
+import re
+import pytz
+from Reservation import check_recurrence
+
+
+def validate_reservation_data(data):
+    """Check a reservation from a request, return the errors by field, empty if it is valid"""
+    validation_errors = {}
+    start_time = None
+
+    if 'start_time' not in data:
+        validation_errors['start_time'] = 'Start time is required'
+    else:
+        # Accept the ISO 8601 forms Reservation.set_start_time parses, e.g. with or without seconds
+        try:
+            start_time = dp.isoparse(data['start_time'])
+        except (TypeError, ValueError):
+            validation_errors['start_time'] = 'Invalid datetime format'
+
+    if 'timezone' in data and (not isinstance(data['timezone'], str)
+                               or data['timezone'].replace(' ', '_') not in pytz.common_timezones_set):
+        validation_errors['timezone'] = 'Invalid timezone'
+
+    if 'name' not in data:
+        validation_errors['name'] = 'Room name is required'
+    else:
+        name = data['name']
+        if not isinstance(name, str) or not re.match(r'^[a-zA-Z0-9_ -]*$', name):
+            validation_errors['name'] = 'Allowed characters for room names are: a-z, 0-9, -, _, and space'
+
+    if data.get('pin') is not None:
+        pin = data['pin']
+        if not isinstance(pin, str) or not re.match(r'^[a-zA-Z0-9]*$', pin):
+            validation_errors['pin'] = 'Allowed characters for PINs are: a-z and 0-9'
+
+    if data.get('recurrence') is not None:
+        recurrence = data['recurrence']
+        if not isinstance(recurrence, str):
+            validation_errors['recurrence'] = 'Recurrence should be an RRULE string'
+        elif recurrence:
+            try:
+                rule = rrulestr(recurrence, forceset=False, dtstart=start_time)
+                if not isinstance(rule, rrule):
+                    raise ValueError('Only a single RRULE is supported.')
+                if start_time is not None:
+                    check_recurrence(rule)
+            except ValueError as e:
+                validation_errors['recurrence'] = f'Invalid recurrence rule: {e}'
+
+    if 'duration' in data:
+        duration = data['duration']
+        if not isinstance(duration, int):
+            validation_errors['duration'] = 'Duration should be an integer.'
+        elif duration < 0:
+            validation_errors['duration'] = 'Duration should be a non-negative integer.'
+
+    return validation_errors
+
+
+def parse_availability_query(names: list, start_time: str, end_time: str, duration: str,
+                             max_rooms: int, max_window: timedelta):
+    """Parse the arguments of the free slot search, return the query and the validation errors"""
+    validation_errors = {}
+    query = {'names': [], 'start_time': None, 'end_time': None, 'duration': None}
+
+    if not names:
+        validation_errors['name'] = 'At least one room name is required'
+    elif len(names) > max_rooms:
+        validation_errors['name'] = f'At most {max_rooms} rooms can be searched at once'
+    elif not all(re.match(r'^[a-zA-Z0-9_ -]+$', name) for name in names):
+        validation_errors['name'] = 'Allowed characters for room names are: a-z, 0-9, -, _, and space'
+    else:
+        # Room names are stored like Reservation.from_dict normalizes them
+        query['names'] = list(dict.fromkeys(name.replace(' ', '_').lower() for name in names))
+
+    for key, value in (('start_time', start_time), ('end_time', end_time)):
+        if not value:
+            validation_errors[key] = 'Required'
+            continue
+        try:
+            query[key] = dp.isoparse(value).replace(tzinfo=None)
+        except ValueError:
+            validation_errors[key] = 'Invalid datetime format'
+    if query['start_time'] is not None and query['end_time'] is not None:
+        if query['end_time'] <= query['start_time']:
+            validation_errors['end_time'] = 'end_time should be after start_time'
+        elif query['end_time'] - query['start_time'] > max_window:
+            validation_errors['end_time'] = f'The window can span at most {max_window.days} days'
+
+    try:
+        query['duration'] = timedelta(minutes=int(duration))
+        if query['duration'] <= timedelta(0):
+            validation_errors['duration'] = 'Duration should be a positive integer.'
+    except (TypeError, ValueError):
+        validation_errors['duration'] = 'Duration should be an integer.'
+
+    return query, validation_errors
+
+
+def parse_events_query(after: str, limit: str, wait: str, max_limit: int, max_wait: float):
+    """Parse the arguments of the event feed, return the query and the validation errors"""
+    validation_errors = {}
+    query = {'after': None, 'limit': max_limit, 'wait': 0.0}
+
+    for key, value in (('after', after), ('limit', limit)):
+        if value is None:
+            continue
+        try:
+            query[key] = int(value)
+            if query[key] < 0:
+                validation_errors[key] = f'{key} should not be negative'
+        except ValueError:
+            validation_errors[key] = f'{key} should be an integer'
+    query['limit'] = min(query['limit'], max_limit)
+
+    if wait is not None:
+        try:
+            query['wait'] = float(wait)
+            if not 0 <= query['wait'] < float('inf'):
+                validation_errors['wait'] = 'wait should be a number of seconds'
+            query['wait'] = min(query['wait'], max_wait)
+        except ValueError:
+            validation_errors['wait'] = 'wait should be a number of seconds'
+
+    return query, validation_errors
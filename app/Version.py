@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String
+import os
+import zlib
+from Reservation import Base
+
+
+class Version(Base):
+    """Version counters that writers bump, so other processes can tell when their caches are stale."""
+    __tablename__ = 'versions'
+    # Running conferences are counted in shards by room name, so joins to different rooms
+    # do not wait for each other on a single counter row
+    CONFERENCES = 'conferences:'
+    CONFERENCE_SHARDS = int(os.getenv('RESERVATION_SERVICE_CONFERENCE_VERSION_SHARDS', 64))
+    # Highest event id removed by the sweeper, older cursors may have missed events
+    EVENTS_PRUNED = 'events_pruned'
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def tenant(owner_id: str) -> str:
+        """Get the scope of the counter that every write of a tenant bumps"""
+        return f'tenant:{owner_id}'
+
+    @staticmethod
+    def conferences(name: str) -> str:
+        """Get the scope of the counter that every change of a running conference in the room bumps"""
+        return f'{Version.CONFERENCES}{zlib.crc32(name.encode("utf-8")) % Version.CONFERENCE_SHARDS}'
+
+    def __repr__(self):
+        return f'<Version(scope={self.scope}, version={self.version})>'
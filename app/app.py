@@ -1,6 +1,7 @@
 from flask import Flask, request, jsonify
 from flask_api import status
-from flask_restx import Api, Resource, fields, apidoc
+from flask_restx import Api, Resource, fields, apidoc, marshal, reqparse, inputs
+from flask_restx.utils import unpack
 from functools import wraps
 from flasgger import Swagger, swag_from
 import jwt
@@ -9,14 +10,31 @@ import re
 import os
 from datetime import datetime
 import pytz
+from dateutil import parser as dp
 from CustomExceptions import ConferenceExists, ConferenceNotAllowed, OverlappingReservation
 from Reservation import Base, Reservation
-from Conferences import Manager
+from Conferences import Manager, RECURRENCE_HORIZON
+from KeyCache import KeyCache
+from TokenCache import TokenCache
+from Sweeper import Sweeper
+from Validation import validate_reservation_data, parse_availability_query, parse_events_query
+from LogQueue import configure_logging
+import RateLimit
+import Idempotency
+import Events
+import ETags
+import Metrics
+from Metrics import Stage
+from Serializer import dumps
+from Models import domain, conference_model, serialize_conference
 from flask_cors import CORS  # Import Flask-CORS
-from flask import Flask, request, Response, g
+from flask import Flask, request, Response, g, stream_with_context
+from werkzeug.exceptions import HTTPException
 import uuid
 import json
 import logging
+import threading
+import time
 
 app = Flask(__name__)
 CORS(app)
@@ -28,7 +46,7 @@ authorizations = {
         'name': 'Authorization'
     }
 }
-logging.basicConfig(level=logging.INFO) 
+configure_logging()
 
 swagger = Swagger(app)
 api = Api(
@@ -42,7 +60,13 @@ api = Api(
     terms_url='https://www.sariska.io/terms-of-service',
     base_url='https://api.dev.sariska.io'  # Set the base URL for Swagger
 )
-manager = Manager()
+manager = Manager(create_schema=os.environ.get("RESERVATION_SERVICE_CREATE_SCHEMA", "true").lower() == "true")
+key_cache = KeyCache()
+token_cache = TokenCache()
+admission = RateLimit.from_environment()
+# Waiting polls of the event feed, so they cannot take all threads of the worker
+waiting_polls = threading.BoundedSemaphore(Events.MAX_WAITING)
+sweeper = Sweeper(manager)
 
 # Define a namespace
 # Define a new namespace for the token generation route
@@ -90,51 +114,8 @@ token_response_model = api.model('TokenResponse', {
 })
 
 reservation_ns = api.namespace('api/v1/scheduler/reservation', description='Reservation operations for upcoming scheduled meetings')
-domain = None
-value = os.environ.get("DEPLOYMENT_ENV")
-
-if value == "development":
-    domain = "dev.sariska.io"
-elif value == "production":
-    domain = "sariska.io"
-    
-conference_model = api.model('Conference', {
-    'id': fields.Integer(
-        required=True,
-        example=1245,
-        description='The id created reservation'
-    ),
-    'mail_owner': fields.String(
-        required=True,
-        example='owner_user_id@'+domain,
-        description='The email address of the conference owner.'
-    ),
-    'name': fields.String(
-        required=True,
-        example='myroom123',
-        description='The name of the conference room.'
-    ),
-    'duration': fields.String(
-        required=True,
-        example=60,  # Sample duration in minutes
-        description='The duration of the conference in minutes.'
-    ),
-    'start_time': fields.DateTime(
-        required=True,
-        example='2023-09-28T15:08',
-        description='The start time of the conference in ISO 8601 format.'
-    ),
-    'timezone': fields.String(
-        required=True,
-        example='America/New York',
-        default='America/New York',
-        description='The timezone of the conference.'
-    ),
-    'pin': fields.String(
-        example='1234',  # Remove required=True for an optional field
-        description='The PIN for accessing the conference (optional).'
-    ),
-})
+# Registered for the API docs, defined in Models so asgi.py serializes rows the same way
+api.add_model('Conference', conference_model)
 
 conference_model_with_only_id = api.model('Conference', {
     'id': fields.Integer(
@@ -175,15 +156,205 @@ conference_model_without_id = api.model('Conference', {
         example='1234',  # Remove required=True for an optional field
         description='The PIN for accessing the conference (optional).'
     ),
+    'recurrence': fields.String(
+        example='FREQ=WEEKLY;BYDAY=MO;COUNT=10',
+        description='RRULE for a recurring reservation, start_time is its first occurrence (optional).'
+    ),
+})
+
+batch_result_model = api.model('BatchReservationResult', {
+    'index': fields.Integer(description='Position of the item in the request'),
+    'status': fields.String(description='created, conflict or invalid', example='created'),
+    'reservation': fields.Nested(conference_model, allow_null=True, skip_none=True),
+    'error': fields.String(description='Why the item was not created'),
+    'validation_errors': fields.Raw(description='Validation errors of an invalid item'),
 })
 
+BATCH_MAX_SIZE = int(os.environ.get("RESERVATION_SERVICE_BATCH_MAX_SIZE", 500))
+
 conference_ns = api.namespace('api/v1/scheduler/conference', description='Conference operations for currently running conferences')
 
+# Keyset pagination and streaming for the list endpoints
+LIST_MAX_LIMIT = int(os.environ.get("RESERVATION_SERVICE_LIST_MAX_LIMIT", 1000))
+list_parser = reqparse.RequestParser()
+list_parser.add_argument('limit', type=int, location='args', help='Maximum number of entries to return')
+list_parser.add_argument('after', type=int, location='args', help='Return entries with an id greater than this cursor')
+list_parser.add_argument('start_time', type=lambda value: dp.isoparse(value).replace(tzinfo=None), location='args',
+                         help='Only return entries overlapping the window starting at this time, with series expanded into occurrences')
+list_parser.add_argument('end_time', type=lambda value: dp.isoparse(value).replace(tzinfo=None), location='args',
+                         help='End of the window, required together with start_time')
+list_parser.add_argument('stream', type=inputs.boolean, location='args', default=False,
+                         help='Stream all entries as a JSON array instead of building the response in memory')
+
+# Free slot search over the reservations of one or more rooms
+AVAILABILITY_MAX_ROOMS = int(os.environ.get("RESERVATION_SERVICE_AVAILABILITY_MAX_ROOMS", 50))
+availability_parser = reqparse.RequestParser()
+availability_parser.add_argument('name', location='args', action='append', help='Room name, repeat to search several rooms')
+availability_parser.add_argument('start_time', location='args', help='Start of the window in ISO 8601 format')
+availability_parser.add_argument('end_time', location='args', help='End of the window in ISO 8601 format')
+availability_parser.add_argument('duration', location='args', help='Duration of the reservation in minutes')
+
+slot_model = api.model('Slot', {
+    'start_time': fields.DateTime(description='Start of the free slot, exclusive if a reservation ends here'),
+    'end_time': fields.DateTime(description='End of the free slot, exclusive if a reservation starts here'),
+})
+availability_model = api.model('RoomAvailability', {
+    'name': fields.String(example='myroom123', description='The name of the conference room.'),
+    'slots': fields.List(fields.Nested(slot_model)),
+})
+
+events_ns = api.namespace('api/v1/scheduler/events', description='Change feed of the conferences and reservations of a tenant')
+
+# Long-poll over the event log, resumed with the id of the last event received
+events_parser = reqparse.RequestParser()
+events_parser.add_argument('after', location='args', help='Return events with an id greater than this cursor')
+events_parser.add_argument('limit', location='args', help='Maximum number of events to return, 0 to only get the current cursor')
+events_parser.add_argument('wait', location='args', help='Seconds to wait for new events when there are none')
+
+event_model = api.model('Event', {
+    'id': fields.Integer(example=1245, description='The cursor of the event'),
+    'type': fields.String(example='reservation.created',
+                          description='conference.started, conference.ended, reservation.created or reservation.deleted'),
+    'reservation_id': fields.Integer(example=1245, description='The id of the conference or reservation'),
+    'name': fields.String(example='myroom123', description='The name of the conference room.'),
+    'created_at': fields.DateTime(description='When the change was committed, in UTC'),
+    'data': fields.Raw(description='The conference or reservation after the change, or before it was deleted'),
+})
+
+def json_response(data, code: int = status.HTTP_200_OK, headers: dict = None) -> Response:
+    """Encode a serialized response body with the fast JSON encoder"""
+    return Response(dumps(data), status=code, headers=headers, mimetype='application/json')
+
+def not_modified(etag: str) -> Response:
+    """Answer a conditional request whose If-None-Match has the current ETag"""
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+def row_response(row, missing_code: int = status.HTTP_200_OK) -> Response:
+    """Serialize a single conference or reservation with the ETag of its row version"""
+    if row is None:
+        return json_response(serialize_conference(None), missing_code)
+    etag = ETags.row_etag(row.id, row.version)
+    if ETags.matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    return json_response(serialize_conference(row), headers={'ETag': etag})
+
+def list_response(query, current_user):
+    """Run a list query with the pagination arguments of the request.
+    The id to pass as 'after' for the next page is returned in the X-Next-After header.
+    The ETag is the version counter of the tenant with the route and the parsed arguments,
+    so If-None-Match is answered without the query."""
+    # Invalid arguments abort with 400 before anything is read
+    args = list_parser.parse_args()
+    if args['limit'] is not None and args['limit'] < 1:
+        api.abort(status.HTTP_400_BAD_REQUEST, 'limit should be a positive integer')
+    limit = min(args['limit'], LIST_MAX_LIMIT) if args['limit'] is not None else None
+    window = (args['start_time'], args['end_time']) if args['start_time'] and args['end_time'] else None
+
+    # Read the counter before the rows, a concurrent write can only leave the tag older than the data
+    etag = ETags.tenant_etag(current_user['context']['group'], manager.tenant_version(current_user=current_user),
+                             request.path, {'limit': limit, 'after': args['after'], 'window': window,
+                                            'stream': args['stream']})
+    if ETags.matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+
+    if window is None:
+        rows = query(current_user=current_user, limit=limit, after=args['after'], stream=args['stream'])
+    else:
+        rows = query(current_user=current_user, limit=limit, after=args['after'], stream=args['stream'],
+                     start_time=window[0], end_time=window[1])
+
+    if args['stream']:
+        if window is not None:
+            rows = manager.expand_occurrences(rows, *window)
+        return Response(stream_with_context(stream_json(rows)), mimetype='application/json', headers={'ETag': etag})
+
+    headers = {'ETag': etag}
+    if limit is not None and len(rows) == limit:
+        headers['X-Next-After'] = str(rows[-1].id)
+    if window is not None:
+        rows = list(manager.expand_occurrences(rows, *window))
+    with Stage('serialize'):
+        return json_response([serialize_conference(row) for row in rows], headers=headers)
+
+def stream_json(rows):
+    """Write rows as a JSON array one entry at a time"""
+    yield '['
+    for index, row in enumerate(rows):
+        if index:
+            yield ','
+        yield dumps(serialize_conference(row))
+    yield ']'
+
+def admit(f, current_user, *args, **kwargs):
+    """Run an endpoint for a verified user if its tenant is within its rate limit and in-flight cap,
+    answer 429 with Retry-After otherwise"""
+    if not admission.enabled:
+        return f(current_user, *args, **kwargs)
+
+    tenant = current_user['context']['group']
+    route = f'{request.method} {request.url_rule.rule if request.url_rule is not None else request.path}'
+    wait = admission.enter(tenant, route)
+    if wait:
+        if Metrics.ENABLED:
+            Metrics.ADMISSION_REJECTED.labels(route).inc()
+        return json_response({'message': 'Too many requests'}, status.HTTP_429_TOO_MANY_REQUESTS,
+                             headers={'Retry-After': RateLimit.retry_after_header(wait)})
+    try:
+        return f(current_user, *args, **kwargs)
+    finally:
+        admission.leave(tenant)
+
+def idempotent(f):
+    """Answer retries that repeat the Idempotency-Key header of an earlier request with its stored response.
+    Goes below token_required, keys are scoped to the tenant and route."""
+    @wraps(f)
+    def decorator(current_user, *args, **kwargs):
+        header = request.headers.get(Idempotency.HEADER)
+        if header is None:
+            return f(current_user, *args, **kwargs)
+        if not header or len(header) > Idempotency.MAX_KEY_LENGTH:
+            return json_response({'message': f'{Idempotency.HEADER} must have 1 to {Idempotency.MAX_KEY_LENGTH} characters'},
+                                 status.HTTP_400_BAD_REQUEST)
+
+        route = request.url_rule.rule
+        key = Idempotency.scoped_key(current_user['context']['group'], request.method, route, header)
+        request_hash = Idempotency.request_digest(request.get_data())
+        entry = manager.claim_idempotency_key(key, request_hash)
+        if entry is not None:
+            if entry.request_hash != request_hash:
+                return json_response({'message': f'{Idempotency.HEADER} was already used for a different request'}, 422)
+            if entry.status is None:
+                return json_response({'message': 'A request with this key is still in progress'},
+                                     status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+            if Metrics.ENABLED:
+                Metrics.IDEMPOTENT_REPLAYS.labels(f'{request.method} {route}').inc()
+            return Response(entry.body, status=entry.status, mimetype='application/json',
+                            headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            rv = f(current_user, *args, **kwargs)
+            data, code, _ = unpack(rv)
+            if isinstance(data, Response):
+                body = data.get_data()
+                if not isinstance(rv, tuple):
+                    code = data.status_code
+            else:
+                body = dumps(data)
+        except Exception:
+            manager.release_idempotency_key(key)
+            raise
+        if code >= 500:
+            manager.release_idempotency_key(key)
+        else:
+            manager.complete_idempotency_key(key, code, body)
+        return rv
+
+    return decorator
+
 def token_required(f):
     @wraps(f)
     def decorator(*args, **kwargs):
         token = None
-        public_key_url  = None
         decoded_token = None
         if 'Authorization' in request.headers:
             token = request.headers['Authorization']
@@ -192,35 +363,43 @@ def token_required(f):
             return jsonify({'message': 'A valid token is missing'})
 
         try:
+            # Repeated tokens were already verified, skip the signature check
+            decoded_token = token_cache.get(token.split(' ')[1])
+            if decoded_token is not None:
+                return admit(f, decoded_token, *args, **kwargs)
+
             # Get the header data from the token
             header = jwt.get_unverified_header(token.split(' ')[1])
             if not header.get('kid'):
                 return jsonify({'message': 'Token is invalid'})
 
-            # Construct the public key URL based on 'kid' and fetch the public key data
-            public_key_url = os.getenv("SECRET_MANAGEMENT_SERVICE_PUBLIC_KEY_URL")+"/"+header["kid"]+'.pem'
-            response = requests.get(public_key_url)
+            # Look up the public key for 'kid', fetching it from the key service on a miss
+            with Stage('key_lookup'):
+                public_key = key_cache.get(header['kid'])
+            if public_key is None:
+                return jsonify({'message': 'Token is invalid'})
 
-            if response.status_code == 200:
-                # Verify and decode the token
+            # Verify and decode the token
+            with Stage('jwt_decode'):
                 decoded_token = jwt.decode(
                     token.split(' ')[1],
-                    response.content,
+                    public_key,
                     algorithms=[header['alg']],
                     issuer='sariska',
                     audience=['media_messaging_co-browsing', 'media']
                 )
-                # Return the decoded token to the decorated function
-                return f(decoded_token, *args, **kwargs)
+            token_cache.put(token.split(' ')[1], decoded_token)
+            # Return the decoded token to the decorated function
+            return admit(f, decoded_token, *args, **kwargs)
         except jwt.ExpiredSignatureError:
             return jsonify({'message': 'Token has expired'})
         except jwt.InvalidTokenError:
-            return jsonify({'message': public_key_data})
+            return jsonify({'message': 'Token is invalid'})
+        except HTTPException:
+            # Errors the endpoint aborted with, answered by the Api error handler
+            raise
         except Exception as e:
-            print('error decoding',e)
-            print("decoded_token",decoded_token)
-            print("public_key_url", public_key_url)
-
+            app.logger.warning('Token could not be decoded: %s', e)
             return jsonify({'message': e})
 
     return decorator
@@ -238,14 +417,14 @@ class GenerateToken(Resource):
 class Conferences(Resource):
     @token_required
     @api.doc('Get All Conferences', security='apikey')
-    @api.marshal_with(conference_model, as_list=True)
+    @api.expect(list_parser)
+    @api.response(200, 'Success', [conference_model])
     def get(current_user, self):
         # Retrieve a list of all conferences
-        conferences = manager.all_conferences(current_user=current_user)
-        print("conferences", conferences)
-        return conferences
+        return list_response(manager.all_conferences, current_user)
 
     @token_required
+    @idempotent
     @api.doc(False)
     @reservation_ns.expect(conference_exist_model, conference_model, conference_not_allowed_model)
     @api.marshal_with(conference_model)
@@ -255,7 +434,6 @@ class Conferences(Resource):
         request_body_str = request_body.decode('utf-8')
         # Parse the string as a JSON object
         conference_data = json.loads(request_body_str)
-        print("conference_data", conference_data)
         output = None
         try:
             # If a user enters the conference, check for reservations
@@ -269,15 +447,13 @@ class Conferences(Resource):
             return jsonify({'message': e.message}), status.HTTP_403_FORBIDDEN
         else:
             # Conference was created, send back details
-            print("output",output)
-            
             return jsonify(output), status.HTTP_200_OK
 
 @conference_ns.route('/<id>')
 class ConferenceByID(Resource):
     @token_required
     @api.doc('Get Conferences by Id', security='apikey')
-    @conference_ns.marshal_list_with(conference_model)
+    @api.response(200, 'Success', conference_model)
     def get(current_user, self, id):
             # Retrieve a specific conference by its ID    
         user_agent = request.headers.get('User-Agent')
@@ -286,12 +462,13 @@ class ConferenceByID(Resource):
         if 'Prosody' in user_agent:
             conference_info = manager.get_conference_with_id(id=id, current_user=current_user).get_jicofo_api_dict()
         else:
-            conference_info = manager.get_conference_with_id(id=id, current_user=current_user)
+            return row_response(manager.get_conference_with_id(id=id, current_user=current_user),
+                                status.HTTP_404_NOT_FOUND)
 
         if conference_info is not None:
-            return conference_info, status.HTTP_200_OK
+            return json_response(serialize_conference(conference_info))
         else:
-            return None, status.HTTP_404_NOT_FOUND
+            return json_response(serialize_conference(None), status.HTTP_404_NOT_FOUND)
 
     @token_required
     @api.doc(False)
@@ -308,27 +485,27 @@ class ConferenceByID(Resource):
 @conference_ns.route('/room/<name>')
 class ConferenceByName(Resource):
     @token_required
-    @api.marshal_with(conference_model)
+    @api.response(200, 'Success', conference_model)
     @api.doc('Get Conference by Name', security='apikey')
     def get(current_user, self, name):
         try:
             conference = manager.get_conference_by_name(name=name, current_user=current_user)
-            return conference, status.HTTP_200_OK
+            return json_response(serialize_conference(conference))
         except Exception as e:
-            return {}, status.HTTP_404_NOT_FOUND
+            return json_response(serialize_conference({}), status.HTTP_404_NOT_FOUND)
 
 @reservation_ns.route('')
 class Reservations(Resource):
     @token_required
     @api.doc('Get Reservations', security='apikey')
-    @api.marshal_with(conference_model, as_list=True)
+    @api.expect(list_parser)
+    @api.response(200, 'Success', [conference_model])
     def get(current_user, self):
-        # Replace with your database query to fetch reservations
         app.logger.info('Request received for get reservataion')  # Log a message
-        reservations = manager.all_reservations(current_user=current_user)
-        return reservations
+        return list_response(manager.all_reservations, current_user)
 
     @token_required
+    @idempotent
     @api.doc('Create Reservation', security='apikey')
     @reservation_ns.expect(conference_model_without_id)
     @api.marshal_with(conference_model)
@@ -339,7 +516,7 @@ class Reservations(Resource):
         if data is None:
             return {'error': 'Invalid JSON data in request'}, status.HTTP_400_BAD_REQUEST
 
-        app.logger.info('data', data)  # Log a message
+        app.logger.debug('Reservation data %s', data)
         
         validation_errors = validate_reservation_data(data)
         if validation_errors:
@@ -354,6 +531,122 @@ class Reservations(Resource):
             return response, status.HTTP_201_CREATED
         except OverlappingReservation as e:
             return {'error': e.message}, status.HTTP_400_BAD_REQUEST
+        except ConferenceExists as e:
+            # The reservation would start during a running conference of the room, marshal_with drops error bodies
+            api.abort(status.HTTP_409_CONFLICT, e.message, conflict_id=e.id)
+        except ValueError as e:
+            return {'error': str(e)}, status.HTTP_400_BAD_REQUEST
+
+@reservation_ns.route('/batch')
+class ReservationBatch(Resource):
+    @token_required
+    @idempotent
+    @api.doc('Create Reservations in bulk', security='apikey')
+    @reservation_ns.expect([conference_model_without_id])
+    @api.response(200, 'Success', [batch_result_model])
+    def post(current_user, self):
+        data = request.get_json()
+        app.logger.info('Request received for create reservation batch')  # Log a message
+
+        if not isinstance(data, list):
+            return {'error': 'Expected a JSON list of reservations'}, status.HTTP_400_BAD_REQUEST
+        if len(data) > BATCH_MAX_SIZE:
+            return {'error': f'At most {BATCH_MAX_SIZE} reservations can be created at once'}, status.HTTP_400_BAD_REQUEST
+
+        results = []
+        valid = []
+        for index, item in enumerate(data):
+            if not isinstance(item, dict):
+                results.append({'index': index, 'status': 'invalid', 'error': 'Invalid JSON data in request'})
+                continue
+            validation_errors = validate_reservation_data(item)
+            if validation_errors:
+                results.append({'index': index, 'status': 'invalid', 'error': 'Validation failed', 'validation_errors': validation_errors})
+                continue
+            if 'start_time' not in item or 'duration' not in item or 'name' not in item:
+                results.append({'index': index, 'status': 'invalid', 'error': 'Missing required fields in JSON data'})
+                continue
+            item['duration'] = 60*int(item['duration'])
+            valid.append((index, item))
+
+        added = manager.add_reservations(data=[item for _, item in valid], current_user=current_user)
+        for (index, _), result in zip(valid, added):
+            if isinstance(result, (OverlappingReservation, ConferenceExists)):
+                results.append({'index': index, 'status': 'conflict', 'error': result.message})
+            elif isinstance(result, ValueError):
+                results.append({'index': index, 'status': 'invalid', 'error': str(result)})
+            else:
+                results.append({'index': index, 'status': 'created', 'reservation': result})
+
+        results.sort(key=lambda result: result['index'])
+        return marshal(results, batch_result_model, skip_none=True), status.HTTP_200_OK
+
+@reservation_ns.route('/availability')
+class ReservationAvailability(Resource):
+    @token_required
+    @api.doc('Find free slots of rooms', security='apikey')
+    @api.expect(availability_parser)
+    @api.response(200, 'Success', [availability_model])
+    def get(current_user, self):
+        args = availability_parser.parse_args()
+        query, validation_errors = parse_availability_query(args['name'], args['start_time'], args['end_time'],
+                                                            args['duration'], AVAILABILITY_MAX_ROOMS, RECURRENCE_HORIZON)
+        if validation_errors:
+            return {'error': 'Validation failed', 'validation_errors': validation_errors}, status.HTTP_400_BAD_REQUEST
+
+        rooms = manager.free_slots(current_user=current_user, **query)
+        with Stage('serialize'):
+            return json_response([{'name': name, 'slots': [{'start_time': start.isoformat(), 'end_time': end.isoformat()}
+                                                           for start, end in slots]}
+                                  for name, slots in rooms.items()])
+
+@events_ns.route('')
+class EventFeed(Resource):
+    @token_required
+    @api.doc('Follow the changes of the conferences and reservations of the tenant', security='apikey')
+    @api.expect(events_parser)
+    @api.response(200, 'Success', [event_model])
+    @api.response(410, 'The cursor is older than the retained events')
+    def get(current_user, self):
+        args = events_parser.parse_args()
+        query, validation_errors = parse_events_query(args['after'], args['limit'], args['wait'],
+                                                      Events.MAX_LIMIT, Events.MAX_WAIT)
+        if validation_errors:
+            return {'error': 'Validation failed', 'validation_errors': validation_errors}, status.HTTP_400_BAD_REQUEST
+        # Without a cursor, follow from the oldest event that was kept
+        pruned = manager.events_pruned()
+        if query['after'] is None:
+            query['after'] = pruned
+        elif query['after'] < pruned:
+            return {'error': 'Events after this cursor were removed, reload the lists and follow a new cursor'}, \
+                status.HTTP_410_GONE
+        if query['limit'] == 0:
+            cursor = max(manager.latest_event_id(current_user=current_user), pruned)
+            return json_response([], headers={'X-Next-After': str(cursor)})
+
+        deadline = time.monotonic() + query['wait']
+        events = manager.events(current_user=current_user, after=query['after'], limit=query['limit'])
+        if not events and query['wait'] > 0:
+            if not waiting_polls.acquire(blocking=False):
+                return json_response({'message': 'Too many waiting polls, retry later'}, status.HTTP_429_TOO_MANY_REQUESTS,
+                                     headers={'Retry-After': RateLimit.retry_after_header(Events.POLL_INTERVAL)})
+            try:
+                while not events and deadline > time.monotonic():
+                    # Return the connection to the pool while waiting
+                    manager.remove_session()
+                    time.sleep(min(Events.POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+                    events = manager.events(current_user=current_user, after=query['after'], limit=query['limit'])
+            finally:
+                waiting_polls.release()
+
+        if events:
+            cursor = events[-1].id
+        else:
+            # Events of other tenants may have been removed meanwhile, move past them so the
+            # next poll of an idle tenant is not answered with 410
+            cursor = max(query['after'], manager.events_pruned())
+        with Stage('serialize'):
+            return json_response([event.to_dict() for event in events], headers={'X-Next-After': str(cursor)})
 
 @reservation_ns.route('/<id>')
 class Reservation(Resource):
@@ -369,59 +662,51 @@ class Reservation(Resource):
 
     @token_required
     @api.doc('Get Reservation by Id', security='apikey')
-    @conference_ns.marshal_with(conference_model)
+    @api.response(200, 'Success', conference_model)
     def get(current_user, self, id):
         # Retrieve a specific reservation by its ID
-        print(current_user, id)
-        conference_info = manager.get_reservation_by_id(id=id, current_user=current_user)
-        return conference_info, status.HTTP_200_OK
+        return row_response(manager.get_reservation_by_id(id=id, current_user=current_user))
 
 @reservation_ns.route('/room/<name>')
 class Reservation(Resource):
     @token_required
     @api.doc('Get Reservation by name', security='apikey')
-    @conference_ns.marshal_with(conference_model)
+    @api.response(200, 'Success', conference_model)
     def get(current_user, self, name):
         # Retrieve a specific reservation by its name
         conference_info = manager.get_reservation(name=name, current_user=current_user)
-        return conference_info, status.HTTP_200_OK
+        return json_response(serialize_conference(conference_info))
 
 
-def validate_reservation_data(data):
-    validation_errors = {}
+@app.teardown_appcontext
+def remove_session(exception=None):
+    manager.remove_session()
 
-    if 'start_time' not in data:
-        validation_errors['start_time'] = 'Start time is required'
-    else:
-        try:
-            datetime.strptime(data['start_time'], '%Y-%m-%dT%H:%M')
-        except ValueError:
-            validation_errors['start_time'] = 'Invalid datetime format'
+@app.route('/metrics')
+def metrics():
+    return Response(Metrics.render(), content_type=Metrics.CONTENT_TYPE)
 
-    print("data", data)
+if Metrics.ENABLED:
+    Metrics.watch_cache('public_key', key_cache)
+    Metrics.watch_cache('token', token_cache)
+    Metrics.watch_engine('default', lambda: manager.engine)
 
-    if 'timezone' in data and data['timezone'].replace(' ', '_') not in pytz.common_timezones:
-        validation_errors['timezone'] = 'Invalid timezone'
+    @app.before_request
+    def start_request_metrics():
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.request_metrics = Metrics.RequestMetrics(f'{request.method} {route}')
 
-    if 'name' not in data:
-        validation_errors['name'] = 'Room name is required'
-    else:
-        name = data['name']
-        if not re.match(r'^[a-zA-Z0-9_ -]*$', name):
-            validation_errors['name'] = 'Allowed characters for room names are: a-z, 0-9, -, _, and space'
-            
-    if 'pin' in data:
-        pin = data['pin']
-        if not re.match(r'^[a-zA-Z0-9]*$', pin):
-            validation_errors['pin']
-
-    if 'duration' in data:
-        duration = data['duration']
-        if not isinstance(duration, int):
-            validation_errors['duration'] = 'Duration should be an integer.'
-        elif duration < 0:
-            validation_errors['duration'] = 'Duration should be a non-negative integer.'
+    @app.after_request
+    def record_response_status(resp):
+        g.response_status = resp.status_code
+        return resp
 
+    @app.teardown_request
+    def finish_request_metrics(exception=None):
+        request_metrics = g.pop('request_metrics', None)
+        if request_metrics is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            request_metrics.finish(route, request.method, g.get('response_status', 500))
 
 @app.after_request
 def after_request(resp):
@@ -445,5 +730,24 @@ def after_request(resp):
         return new_resp
     return resp    
 
+def start_background_tasks():
+    """Start the per-process background threads, call once in each worker"""
+    if os.environ.get("RESERVATION_SWEEPER_ENABLED", "false").lower() == "true":
+        sweeper.start()
+
+
+def create_app():
+    """Prepare the app for serving and return it.
+
+    Creates the schema once in the calling process and then closes its connections,
+    so gunicorn can preload the app and fork workers that each open their own pool.
+    Background threads are not started here, see start_background_tasks.
+    """
+    manager.engine
+    manager.dispose()
+    return app
+
+
 if __name__ == '__main__':
+    start_background_tasks()
     app.run(debug=True)
\ No newline at end of file
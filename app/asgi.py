@@ -0,0 +1,482 @@
+"""Async serving mode: the scheduler API as an ASGI app.
+
+Serves the same routes as app.py with an async key fetch and AsyncSessions, so one
+process can keep many Prosody/Jicofo calls in flight. Run it with
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8080
+"""
+from contextlib import asynccontextmanager
+from dateutil import parser as dp
+from flask_restx import inputs
+from functools import wraps
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Route
+import asyncio
+import json
+import jwt
+import os
+import time
+from CustomExceptions import ConferenceExists, ConferenceNotAllowed, OverlappingReservation
+from AsyncConferences import AsyncManager
+from Conferences import RECURRENCE_HORIZON, STREAM_BATCH_SIZE
+from KeyCache import AsyncKeyCache
+from TokenCache import TokenCache
+from Validation import validate_reservation_data, parse_availability_query, parse_events_query
+from LogQueue import configure_logging
+import RateLimit
+import Idempotency
+import Events
+import ETags
+import Metrics
+from Metrics import Stage
+from Serializer import dumps
+from Models import serialize_conference
+
+configure_logging()
+manager = AsyncManager()
+key_cache = AsyncKeyCache()
+token_cache = TokenCache()
+admission = RateLimit.from_environment()
+Metrics.watch_cache('public_key', key_cache)
+Metrics.watch_cache('token', token_cache)
+Metrics.watch_engine('default', lambda: manager.engine.sync_engine)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson when it is installed"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+LIST_MAX_LIMIT = int(os.environ.get("RESERVATION_SERVICE_LIST_MAX_LIMIT", 1000))
+BATCH_MAX_SIZE = int(os.environ.get("RESERVATION_SERVICE_BATCH_MAX_SIZE", 500))
+AVAILABILITY_MAX_ROOMS = int(os.environ.get("RESERVATION_SERVICE_AVAILABILITY_MAX_ROOMS", 50))
+
+
+async def admit(f, request, current_user):
+    """Run an endpoint if the tenant of the user is within its rate limit and in-flight cap"""
+    if not admission.enabled:
+        return await f(request, current_user)
+
+    tenant = current_user['context']['group']
+    route = f'{request.method} {getattr(request.scope.get("route"), "path", request.url.path)}'
+    if isinstance(admission.backend, RateLimit.MemoryBackend):
+        wait = admission.enter(tenant, route)
+    else:
+        # The shared backend is a network round trip, keep it off the event loop
+        wait = await run_in_threadpool(admission.enter, tenant, route)
+    if wait:
+        if Metrics.ENABLED:
+            Metrics.ADMISSION_REJECTED.labels(route).inc()
+        return FastJSONResponse({'message': 'Too many requests'}, status_code=429,
+                                headers={'Retry-After': RateLimit.retry_after_header(wait)})
+    try:
+        return await f(request, current_user)
+    finally:
+        admission.leave(tenant)
+
+
+def token_required(f):
+    @wraps(f)
+    async def decorator(request):
+        token = request.headers.get('Authorization')
+        if not token:
+            return FastJSONResponse({'message': 'A valid token is missing'})
+
+        try:
+            token = token.split(' ')[1]
+            decoded_token = token_cache.get(token)
+            if decoded_token is None:
+                header = jwt.get_unverified_header(token)
+                if not header.get('kid'):
+                    return FastJSONResponse({'message': 'Token is invalid'})
+
+                with Stage('key_lookup'):
+                    public_key = await key_cache.get(header['kid'])
+                if public_key is None:
+                    return FastJSONResponse({'message': 'Token is invalid'})
+
+                with Stage('jwt_decode'):
+                    decoded_token = jwt.decode(
+                        token,
+                        public_key,
+                        algorithms=[header['alg']],
+                        issuer='sariska',
+                        audience=['media_messaging_co-browsing', 'media']
+                    )
+                token_cache.put(token, decoded_token)
+        except jwt.ExpiredSignatureError:
+            return FastJSONResponse({'message': 'Token has expired'})
+        except (jwt.InvalidTokenError, IndexError):
+            return FastJSONResponse({'message': 'Token is invalid'})
+
+        return await admit(f, request, decoded_token)
+
+    return decorator
+
+
+def idempotent(f):
+    """Answer POST retries that repeat the Idempotency-Key header of an earlier request with its stored response.
+    Goes below token_required, keys are scoped to the tenant and route."""
+    @wraps(f)
+    async def decorator(request, current_user):
+        header = request.headers.get(Idempotency.HEADER)
+        if header is None or request.method != 'POST':
+            return await f(request, current_user)
+        if not header or len(header) > Idempotency.MAX_KEY_LENGTH:
+            return FastJSONResponse({'message': f'{Idempotency.HEADER} must have 1 to {Idempotency.MAX_KEY_LENGTH} characters'},
+                                    status_code=400)
+
+        route = getattr(request.scope.get('route'), 'path', request.url.path)
+        key = Idempotency.scoped_key(current_user['context']['group'], request.method, route, header)
+        request_hash = Idempotency.request_digest(await request.body())
+        entry = await manager.call('claim_idempotency_key', key=key, request_hash=request_hash)
+        if entry is not None:
+            if entry.request_hash != request_hash:
+                return FastJSONResponse({'message': f'{Idempotency.HEADER} was already used for a different request'},
+                                        status_code=422)
+            if entry.status is None:
+                return FastJSONResponse({'message': 'A request with this key is still in progress'}, status_code=409,
+                                        headers={'Retry-After': '1'})
+            if Metrics.ENABLED:
+                Metrics.IDEMPOTENT_REPLAYS.labels(f'{request.method} {route}').inc()
+            return Response(entry.body, status_code=entry.status, media_type='application/json',
+                            headers={'Idempotent-Replayed': 'true'})
+
+        try:
+            response = await f(request, current_user)
+        except Exception:
+            await manager.call('release_idempotency_key', key=key)
+            raise
+        if response.status_code >= 500:
+            await manager.call('release_idempotency_key', key=key)
+        else:
+            await manager.call('complete_idempotency_key', key=key, status=response.status_code, body=response.body)
+        return response
+
+    return decorator
+
+
+def list_arguments(request) -> dict:
+    """Parse the arguments of the list endpoints like list_parser in app.py, raise ValueError for invalid ones.
+    The window is only applied when both start_time and end_time are given."""
+    params = request.query_params
+    limit = params.get('limit')
+    after = params.get('after')
+    if limit is not None and int(limit) < 1:
+        raise ValueError('limit should be a positive integer')
+    window = None
+    if params.get('start_time') and params.get('end_time'):
+        window = (dp.isoparse(params['start_time']).replace(tzinfo=None),
+                  dp.isoparse(params['end_time']).replace(tzinfo=None))
+    return {
+        'limit': min(int(limit), LIST_MAX_LIMIT) if limit is not None else None,
+        'after': int(after) if after is not None else None,
+        'window': window,
+        'stream': inputs.boolean(params['stream']) if 'stream' in params else False,
+    }
+
+
+def not_modified(etag: str) -> Response:
+    """Answer a conditional request whose If-None-Match has the current ETag"""
+    return Response(status_code=304, headers={'ETag': etag})
+
+
+def row_response(request, row) -> Response:
+    """Serialize a single conference or reservation with the ETag of its row version"""
+    etag = ETags.row_etag(row.id, row.version)
+    if ETags.matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+    return FastJSONResponse(serialize_conference(row), headers={'ETag': etag})
+
+
+async def list_response(method: str, request, current_user):
+    try:
+        arguments = list_arguments(request)
+    except ValueError:
+        return FastJSONResponse({'error': 'limit must be a positive integer, after an integer, start_time and '
+                                          'end_time ISO 8601 times and stream a boolean'}, status_code=400)
+
+    # Read the counter before the rows, a concurrent write can only leave the tag older than the data
+    version = await manager.call('tenant_version', current_user=current_user)
+    etag = ETags.tenant_etag(current_user['context']['group'], version, request.url.path, arguments)
+    if ETags.matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+
+    window = arguments['window']
+    if arguments['stream']:
+        return StreamingResponse(stream_json(method, current_user, arguments), media_type='application/json',
+                                 headers={'ETag': etag})
+
+    rows = await manager.call(method, current_user=current_user, limit=arguments['limit'], after=arguments['after'],
+                              **window_arguments(window))
+    headers = {'ETag': etag}
+    if arguments['limit'] is not None and len(rows) == arguments['limit']:
+        headers['X-Next-After'] = str(rows[-1].id)
+    if window is not None:
+        rows = manager.manager.expand_occurrences(rows, *window)
+    with Stage('serialize'):
+        output = [serialize_conference(row) for row in rows]
+    return FastJSONResponse(output, headers=headers)
+
+
+def window_arguments(window) -> dict:
+    """Get the keyword arguments of the list queries for a (start_time, end_time) window or None"""
+    return {'start_time': window[0], 'end_time': window[1]} if window is not None else {}
+
+
+async def stream_json(method: str, current_user, arguments: dict):
+    """Write the rows as a JSON array one entry at a time, like stream_json in app.py.
+    The rows are read in keyset pages of STREAM_BATCH_SIZE, each in a session of its own,
+    so no connection is held while the client reads."""
+    limit, after, window = arguments['limit'], arguments['after'], arguments['window']
+    separator = b''
+    yield b'['
+    while limit is None or limit > 0:
+        size = STREAM_BATCH_SIZE if limit is None else min(STREAM_BATCH_SIZE, limit)
+        rows = await manager.call(method, current_user=current_user, limit=size, after=after, **window_arguments(window))
+        entries = manager.manager.expand_occurrences(rows, *window) if window is not None else rows
+        for row in entries:
+            yield separator + dumps(serialize_conference(row))
+            separator = b','
+        if len(rows) < size:
+            break
+        after = rows[-1].id
+        if limit is not None:
+            limit -= len(rows)
+    yield b']'
+
+
+@token_required
+@idempotent
+async def conferences(request, current_user):
+    if request.method == 'GET':
+        return await list_response('all_conferences', request, current_user)
+
+    conference_data = json.loads(await request.body())
+    try:
+        output = await manager.call('allocate', data=conference_data, current_user=current_user)
+        return FastJSONResponse(output)
+    except ConferenceExists as e:
+        return FastJSONResponse({'conflict_id': e.id}, status_code=409)
+    except ConferenceNotAllowed as e:
+        return FastJSONResponse({'message': e.message}, status_code=403)
+
+
+@token_required
+async def conference_by_id(request, current_user):
+    id = request.path_params['id']
+    if request.method == 'DELETE':
+        try:
+            if await manager.call('delete_conference', id=id, current_user=current_user):
+                return FastJSONResponse({'status': 'OK'})
+            return FastJSONResponse({'status': 'Failed'}, status_code=403)
+        except Exception as e:
+            return FastJSONResponse({'error': str(e)}, status_code=500)
+
+    conference = await manager.call('get_conference_with_id', id=id, current_user=current_user)
+    if conference is None:
+        return FastJSONResponse(None, status_code=404)
+    if 'Prosody' in request.headers.get('User-Agent', ''):
+        return FastJSONResponse(conference.get_jicofo_api_dict())
+    return row_response(request, conference)
+
+
+@token_required
+async def conference_by_name(request, current_user):
+    conference = await manager.call('get_conference_by_name', name=request.path_params['name'], current_user=current_user)
+    if conference is None:
+        return FastJSONResponse({}, status_code=404)
+    return FastJSONResponse(serialize_conference(conference))
+
+
+def prepare_reservation(data):
+    """Validate a reservation from a request, return its errors or None"""
+    if not isinstance(data, dict):
+        return {'error': 'Invalid JSON data in request'}
+    validation_errors = validate_reservation_data(data)
+    if validation_errors:
+        return {'error': 'Validation failed', 'validation_errors': validation_errors}
+    if 'start_time' not in data or 'duration' not in data or 'name' not in data:
+        return {'error': 'Missing required fields in JSON data'}
+    data['duration'] = 60*int(data['duration'])
+    return None
+
+
+@token_required
+@idempotent
+async def reservations(request, current_user):
+    if request.method == 'GET':
+        return await list_response('all_reservations', request, current_user)
+
+    data = await request.json()
+    error = prepare_reservation(data)
+    if error:
+        return FastJSONResponse(error, status_code=400)
+    try:
+        reservation = await manager.call('add_reservation', data=data, current_user=current_user)
+        return FastJSONResponse(serialize_conference(reservation), status_code=201)
+    except OverlappingReservation as e:
+        return FastJSONResponse({'error': e.message}, status_code=400)
+    except ConferenceExists as e:
+        # The reservation would start during a running conference of the room
+        return FastJSONResponse({'message': e.message, 'conflict_id': e.id}, status_code=409)
+    except ValueError as e:
+        return FastJSONResponse({'error': str(e)}, status_code=400)
+
+
+@token_required
+@idempotent
+async def reservation_batch(request, current_user):
+    data = await request.json()
+    if not isinstance(data, list):
+        return FastJSONResponse({'error': 'Expected a JSON list of reservations'}, status_code=400)
+    if len(data) > BATCH_MAX_SIZE:
+        return FastJSONResponse({'error': f'At most {BATCH_MAX_SIZE} reservations can be created at once'}, status_code=400)
+
+    results = []
+    valid = []
+    for index, item in enumerate(data):
+        error = prepare_reservation(item)
+        if error:
+            results.append({'index': index, 'status': 'invalid', **error})
+        else:
+            valid.append((index, item))
+
+    added = await manager.call('add_reservations', data=[item for _, item in valid], current_user=current_user)
+    for (index, _), result in zip(valid, added):
+        if isinstance(result, (OverlappingReservation, ConferenceExists)):
+            results.append({'index': index, 'status': 'conflict', 'error': result.message})
+        elif isinstance(result, ValueError):
+            results.append({'index': index, 'status': 'invalid', 'error': str(result)})
+        else:
+            results.append({'index': index, 'status': 'created', 'reservation': serialize_conference(result)})
+
+    results.sort(key=lambda result: result['index'])
+    return FastJSONResponse(results)
+
+
+@token_required
+async def reservation_availability(request, current_user):
+    params = request.query_params
+    query, validation_errors = parse_availability_query(params.getlist('name'), params.get('start_time'),
+                                                        params.get('end_time'), params.get('duration'),
+                                                        AVAILABILITY_MAX_ROOMS, RECURRENCE_HORIZON)
+    if validation_errors:
+        return FastJSONResponse({'error': 'Validation failed', 'validation_errors': validation_errors}, status_code=400)
+
+    rooms = await manager.call('free_slots', current_user=current_user, **query)
+    with Stage('serialize'):
+        output = [{'name': name, 'slots': [{'start_time': start.isoformat(), 'end_time': end.isoformat()}
+                                           for start, end in slots]}
+                  for name, slots in rooms.items()]
+    return FastJSONResponse(output)
+
+
+@token_required
+async def events(request, current_user):
+    params = request.query_params
+    query, validation_errors = parse_events_query(params.get('after'), params.get('limit'), params.get('wait'),
+                                                  Events.MAX_LIMIT, Events.MAX_WAIT)
+    if validation_errors:
+        return FastJSONResponse({'error': 'Validation failed', 'validation_errors': validation_errors}, status_code=400)
+    # Without a cursor, follow from the oldest event that was kept
+    pruned = await manager.call('events_pruned')
+    if query['after'] is None:
+        query['after'] = pruned
+    elif query['after'] < pruned:
+        return FastJSONResponse({'error': 'Events after this cursor were removed, reload the lists and follow a new cursor'},
+                                status_code=410)
+    if query['limit'] == 0:
+        cursor = max(await manager.call('latest_event_id', current_user=current_user), pruned)
+        return FastJSONResponse([], headers={'X-Next-After': str(cursor)})
+
+    deadline = time.monotonic() + query['wait']
+    while True:
+        rows = await manager.call('events', current_user=current_user, after=query['after'], limit=query['limit'])
+        remaining = deadline - time.monotonic()
+        if rows or remaining <= 0:
+            break
+        await asyncio.sleep(min(Events.POLL_INTERVAL, remaining))
+
+    if rows:
+        cursor = rows[-1].id
+    else:
+        # Events of other tenants may have been removed meanwhile, move past them so the
+        # next poll of an idle tenant is not answered with 410
+        cursor = max(query['after'], await manager.call('events_pruned'))
+    with Stage('serialize'):
+        output = [row.to_dict() for row in rows]
+    return FastJSONResponse(output, headers={'X-Next-After': str(cursor)})
+
+
+@token_required
+async def reservation_by_id(request, current_user):
+    id = request.path_params['id']
+    if request.method == 'DELETE':
+        try:
+            await manager.call('delete_reservation_by_id', id=id, name=None, current_user=current_user)
+            return FastJSONResponse({'id': id})
+        except Exception as e:
+            return FastJSONResponse({'error': str(e)}, status_code=400)
+
+    reservation = await manager.call('get_reservation_by_id', id=id, current_user=current_user)
+    if reservation is None:
+        return FastJSONResponse(None, status_code=404)
+    return row_response(request, reservation)
+
+
+@token_required
+async def reservation_by_name(request, current_user):
+    reservation = await manager.call('get_reservation', name=request.path_params['name'], current_user=current_user)
+    if reservation is None:
+        return FastJSONResponse(None, status_code=404)
+    return FastJSONResponse(serialize_conference(reservation))
+
+
+async def metrics(request):
+    return Response(Metrics.render(), media_type=Metrics.CONTENT_TYPE)
+
+
+def route(path: str, endpoint, methods: list) -> Route:
+    """Route a path to an endpoint, recording request metrics under the path template"""
+    if not Metrics.ENABLED:
+        return Route(path, endpoint, methods=methods)
+
+    @wraps(endpoint)
+    async def measured(request):
+        request_metrics = Metrics.RequestMetrics(f'{request.method} {path}')
+        response = None
+        try:
+            response = await endpoint(request)
+            return response
+        finally:
+            request_metrics.finish(path, request.method, response.status_code if response is not None else 500)
+
+    return Route(path, measured, methods=methods)
+
+
+routes = [
+    route('/api/v1/scheduler/conference', conferences, methods=['GET', 'POST']),
+    route('/api/v1/scheduler/conference/room/{name}', conference_by_name, methods=['GET']),
+    route('/api/v1/scheduler/conference/{id}', conference_by_id, methods=['GET', 'DELETE']),
+    route('/api/v1/scheduler/reservation', reservations, methods=['GET', 'POST']),
+    route('/api/v1/scheduler/reservation/batch', reservation_batch, methods=['POST']),
+    route('/api/v1/scheduler/reservation/availability', reservation_availability, methods=['GET']),
+    route('/api/v1/scheduler/reservation/room/{name}', reservation_by_name, methods=['GET']),
+    route('/api/v1/scheduler/reservation/{id}', reservation_by_id, methods=['GET', 'DELETE']),
+    route('/api/v1/scheduler/events', events, methods=['GET']),
+    Route('/metrics', metrics, methods=['GET']),
+]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await manager.create_schema()
+    yield
+    await manager.dispose()
+
+
+app = Starlette(routes=routes, lifespan=lifespan)
@@ -0,0 +1,70 @@
+"""Gunicorn settings for the reservation service.
+
+Every setting can be overridden through the environment. Start with
+
+    gunicorn 'app:create_app()' --config gunicorn.conf.py
+"""
+import math
+import os
+
+
+def available_cores() -> int:
+    """Get the number of cores this container may use, honouring a cgroup CPU quota"""
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+cores = available_cores()
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8080')
+# Requests mostly wait on the database and the key service, so each worker
+# serves several of them on threads instead of adding processes
+workers = int(os.getenv('GUNICORN_WORKERS', cores * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+# Longer than the idle timeout of the load balancer in front of the pods
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 75))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+backlog = int(os.getenv('GUNICORN_BACKLOG', 2048))
+# Load the app once in the master so workers share its memory copy-on-write
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+# Heartbeat files on tmpfs, a disk-backed /tmp can stall workers under load
+worker_tmp_dir = os.getenv('GUNICORN_WORKER_TMP_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.getenv('GUNICORN_ERROR_LOG', '-')
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Remove the metrics files of workers of an earlier run from PROMETHEUS_MULTIPROC_DIR"""
+    import Metrics
+    Metrics.clear_store()
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool, metrics and background threads"""
+    from app import manager, start_background_tasks
+    import LogQueue
+    import Metrics
+    LogQueue.after_fork()
+    Metrics.after_fork()
+    manager.after_fork()
+    start_background_tasks()
+
+
+def child_exit(server, worker):
+    """Tell prometheus_client that a worker exited, its counters and histograms stay in the totals"""
+    import Metrics
+    Metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,108 @@
+"""Free slot search on dense calendars.
+
+Seeds rooms whose calendar is full of 30 minute reservations with 10 minute
+gaps, plus daily series, so a 15 minute reservation only fits after the last
+one. Times GET /reservation/availability over the whole calendar and over one
+week of it, and the trial and error it replaces: POSTing the reservation 5
+minutes later after every overlap until it is created. Prints milliseconds per search as JSON:
+
+    python benchmarks/availability.py --sizes 100,1000,10000 --series 20
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import statistics
+import time
+from service import start_service
+
+START = datetime(2040, 1, 1, 8, 0)
+BUSY = timedelta(minutes=30)
+GAP = timedelta(minutes=10)
+DURATION_MINUTES = 15
+STEP = timedelta(minutes=5)
+
+
+def seed(service, room: str, size: int, series: int):
+    from sqlalchemy import insert
+    from Reservation import Reservation
+
+    rows = []
+    for i in range(size):
+        start = START + i * (BUSY + GAP)
+        rows.append({'name': room, 'start_time': start, 'end_time': start + BUSY, 'duration': BUSY,
+                     'timezone': 'UTC', 'active': False, 'owner_id': 'bench', 'user_id': 'bench'})
+    session = service.module.manager.session
+    session.execute(insert(Reservation), rows)
+    session.commit()
+    service.module.manager.remove_session()
+    # Daily series inside the gaps, created through the API to get their recurrence_end
+    for i in range(series):
+        start = START + BUSY + timedelta(minutes=i % 10)
+        service.client.post('/api/v1/scheduler/reservation', headers=service.headers, json={
+            'name': room, 'start_time': start.strftime('%Y-%m-%dT%H:%M'), 'duration': 1, 'timezone': 'UTC',
+            'recurrence': f'FREQ=DAILY;INTERVAL={i + 1};COUNT={max(1, size // 16 // (i + 1))}'})
+
+
+def search(service, room: str, end: datetime, start: datetime = START) -> int:
+    response = service.client.get(
+        f'/api/v1/scheduler/reservation/availability?name={room}&start_time={start.isoformat()}'
+        f'&end_time={end.isoformat()}&duration={DURATION_MINUTES}', headers=service.headers)
+    return len(response.get_json()[0]['slots'])
+
+
+def trial_and_error(service, room: str) -> int:
+    """POST the reservation later and later until it no longer overlaps, return the attempts"""
+    attempts, start = 0, START
+    while True:
+        attempts += 1
+        response = service.client.post('/api/v1/scheduler/reservation', headers=service.headers, json={
+            'name': room, 'start_time': start.strftime('%Y-%m-%dT%H:%M'), 'duration': DURATION_MINUTES,
+            'timezone': 'UTC'})
+        if response.status_code == 201:
+            service.client.delete(f'/api/v1/scheduler/reservation/{response.get_json()["id"]}',
+                                  headers=service.headers)
+            return attempts
+        start += STEP
+
+
+def timed(function, repeat: int):
+    """Median milliseconds of repeated calls and the last result"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return round(statistics.median(times) * 1000, 3), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the free slot search on dense calendars.')
+    parser.add_argument('--sizes', default='100,1000,10000', help='Reservations per room, comma separated')
+    parser.add_argument('--series', type=int, default=20, help='Daily series per room')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--trial-limit', type=int, default=100,
+                        help='Skip trial and error on calendars with more reservations')
+    args = parser.parse_args()
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        room = f'dense{size}'
+        seed(service, room, size, args.series)
+        end = START + size * (BUSY + GAP) + timedelta(hours=2)
+        search_ms, slots = timed(lambda: search(service, room, end), args.repeat)
+        # A week in the middle of the calendar
+        week = START + (end - START) / 2
+        week_ms, _ = timed(lambda: search(service, room, week + timedelta(days=7), week), args.repeat)
+        result = {'reservations': size, 'series': args.series, 'window_days': (end - START).days,
+                  'slots': slots, 'search_ms': search_ms, 'week_search_ms': week_ms}
+        if size <= args.trial_limit:
+            result['trial_and_error_ms'], result['trial_and_error_attempts'] = \
+                timed(lambda: trial_and_error(service, room), 1)
+        results.append(result)
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
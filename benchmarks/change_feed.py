@@ -0,0 +1,112 @@
+"""Following a tenant through the event feed instead of polling its lists.
+
+Seeds a tenant per size with reservations and times one sync of a consumer three ways:
+fetching GET /reservation and GET /conference in full, fetching them with the
+ETags of the previous sync in If-None-Match, and fetching GET /events after the
+cursor of the previous sync. Syncs are timed when nothing changed and after a
+few reservations were added. Prints milliseconds and response bytes per sync as JSON:
+
+    python benchmarks/change_feed.py --sizes 100,1000,10000 --changes 5
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import statistics
+import time
+from service import start_service
+
+START = datetime(2040, 1, 1, 8, 0)
+LISTS = ['/api/v1/scheduler/reservation', '/api/v1/scheduler/conference']
+EVENTS = '/api/v1/scheduler/events'
+
+
+def seed(service, tenant: str, size: int):
+    from sqlalchemy import insert
+    from Reservation import Reservation
+
+    rows = [{'name': f'room{i}', 'start_time': START + timedelta(hours=i), 'end_time': START + timedelta(hours=i, minutes=30),
+             'duration': timedelta(minutes=30), 'timezone': 'UTC', 'active': False, 'owner_id': tenant, 'user_id': tenant}
+            for i in range(size)]
+    session = service.module.manager.session
+    session.execute(insert(Reservation), rows)
+    session.commit()
+    service.module.manager.remove_session()
+
+
+def poll_lists(service, headers: dict, etags: dict = None) -> int:
+    """Fetch the lists, conditionally if etags is given, and return the response bytes"""
+    size = 0
+    for path in LISTS:
+        conditional = dict(headers, **{'If-None-Match': etags[path]}) if etags and path in etags else headers
+        response = service.client.get(path, headers=conditional)
+        if etags is not None:
+            etags[path] = response.headers['ETag']
+        size += len(response.get_data())
+    return size
+
+
+def poll_events(service, headers: dict, cursor: list) -> int:
+    """Fetch the events after the cursor and move it, return the response bytes"""
+    response = service.client.get(f'{EVENTS}?after={cursor[0]}', headers=headers)
+    cursor[0] = int(response.headers['X-Next-After'])
+    return len(response.get_data())
+
+
+def add(service, tenant: str, changes: int, offset: int):
+    """Add reservations in new rooms of the tenant, room names are shared by all tenants"""
+    for i in range(changes):
+        service.client.post('/api/v1/scheduler/reservation', headers=service.headers_for(tenant), json={
+            'name': f'{tenant}_{offset}_{i}', 'start_time': '2041-01-01T10:00', 'duration': 30, 'timezone': 'UTC'})
+
+
+def timed(function, repeat: int, before=None):
+    """Median milliseconds of repeated calls, running before() untimed ahead of each, and the last result"""
+    times = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return round(statistics.median(times) * 1000, 3), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare list polling, conditional list polling and the event feed.')
+    parser.add_argument('--sizes', default='100,1000,10000', help='Reservations of the tenant, comma separated')
+    parser.add_argument('--changes', type=int, default=5, help='Reservations added between two syncs')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        tenant = f'feed{size}'
+        headers = service.headers_for(tenant)
+        seed(service, tenant, size)
+        cursor = [0]
+        poll_events(service, headers, cursor)
+        batches = iter(range(args.repeat * 3))
+        result = {'reservations': size, 'changes': args.changes}
+        etags = {}
+        poll_lists(service, headers, etags)
+        result['idle_lists_ms'], result['idle_lists_bytes'] = timed(lambda: poll_lists(service, headers), args.repeat)
+        result['idle_conditional_ms'], result['idle_conditional_bytes'] = timed(
+            lambda: poll_lists(service, headers, etags), args.repeat)
+        result['idle_events_ms'], result['idle_events_bytes'] = timed(
+            lambda: poll_events(service, headers, cursor), args.repeat)
+        result['changed_lists_ms'], result['changed_lists_bytes'] = timed(
+            lambda: poll_lists(service, headers), args.repeat, lambda: add(service, tenant, args.changes, next(batches)))
+        result['changed_conditional_ms'], result['changed_conditional_bytes'] = timed(
+            lambda: poll_lists(service, headers, etags), args.repeat, lambda: add(service, tenant, args.changes, next(batches)))
+        poll_events(service, headers, cursor)
+        result['changed_events_ms'], result['changed_events_bytes'] = timed(
+            lambda: poll_events(service, headers, cursor), args.repeat,
+            lambda: add(service, tenant, args.changes, next(batches)))
+        results.append(result)
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Peak memory of listing a large tenant, streamed and in one response.
+
+Seeds a tenant per size with that many reservations, then fetches
+GET /reservation once with stream=true, reading the body chunk by chunk
+like a client would, and once as a single response built in memory.
+Peak Python memory of each request is taken with tracemalloc. Prints
+megabytes, bytes and seconds per request as JSON:
+
+    python benchmarks/list_memory.py --sizes 50000,500000
+
+Exits with 1 when the streamed peak of the largest size is more than
+--max-growth times that of the smallest, i.e. when streaming stopped
+keeping memory flat.
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from service import start_service
+
+START = datetime(2040, 1, 1, 8, 0)
+BATCH = 50000
+PATH = '/api/v1/scheduler/reservation'
+
+
+def seed(service, tenant: str, size: int):
+    from sqlalchemy import insert
+    from Reservation import Reservation
+
+    session = service.module.manager.session
+    for first in range(0, size, BATCH):
+        session.execute(insert(Reservation), [
+            {'name': f'{tenant}_room{i}', 'start_time': START + timedelta(hours=i),
+             'end_time': START + timedelta(hours=i, minutes=30), 'duration': timedelta(minutes=30),
+             'timezone': 'UTC', 'mail_owner': f'user{i}@example.com', 'active': False,
+             'owner_id': tenant, 'user_id': tenant}
+            for i in range(first, min(size, first + BATCH))])
+    session.commit()
+    service.module.manager.remove_session()
+
+
+def measure(service, headers: dict, stream: bool) -> dict:
+    """Fetch the list and return the peak memory while it was built and read"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    if stream:
+        response = service.client.get(f'{PATH}?stream=true', headers=headers, buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+    else:
+        response = service.client.get(PATH, headers=headers)
+        size = len(response.get_data())
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del response
+    return {'peak_mb': round(peak / 2 ** 20, 1), 'bytes': size, 'seconds': round(elapsed, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the peak memory of streamed and buffered list responses.')
+    parser.add_argument('--sizes', default='50000,500000', help='Reservations of the tenant, comma separated')
+    parser.add_argument('--max-growth', type=float, default=1.5,
+                        help='Allowed ratio of the streamed peaks of the largest and the smallest size')
+    parser.add_argument('--skip-buffered', action='store_true', help='Only measure the streamed response')
+    args = parser.parse_args()
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='WARNING', RESERVATION_SERVICE_METRICS_ENABLED='false')
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        tenant = f'memory{size}'
+        seed(service, tenant, size)
+        headers = service.headers_for(tenant)
+        result = {'reservations': size, 'streamed': measure(service, headers, stream=True)}
+        if not args.skip_buffered:
+            result['buffered'] = measure(service, headers, stream=False)
+        results.append(result)
+    service.close()
+    print(json.dumps(results, indent=2))
+
+    growth = results[-1]['streamed']['peak_mb'] / max(results[0]['streamed']['peak_mb'], 0.1)
+    if growth > args.max_growth:
+        print(f'Streamed peak grew {growth:.1f}x from {results[0]["reservations"]} to '
+              f'{results[-1]["reservations"]} reservations', file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
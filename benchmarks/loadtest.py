@@ -0,0 +1,393 @@
+"""Load test of the scheduler API with a realistic request mix, or a replay of captured traffic.
+
+Runs the Flask app in-process with no network: service.py serves the public
+key and signs a token per tenant. The database is seeded with reservations for
+a dataset size, then worker threads drive a weighted mix of Jicofo joins and
+ends (POST/DELETE /conference) and reservation create/list/get/delete calls.
+Throughput and p50/p95/p99 latency per endpoint are written as JSON, so runs of
+two commits can be compared:
+
+    python benchmarks/loadtest.py --dataset medium --requests 20000 --threads 4 --output before.json
+    python benchmarks/loadtest.py --dataset medium --requests 20000 --threads 4 --compare before.json
+
+--database runs against another database instead of a temporary SQLite file,
+e.g. a local PostgreSQL (requires psycopg2). Rows of the load test tenants
+(owner_id 'loadtest-*') are deleted there before seeding, so use a scratch
+database.
+
+--replay drives captured traffic instead of the mix, one JSON request per line:
+
+    {"method": "GET", "path": "/api/v1/scheduler/reservation?limit=50", "tenant": 0}
+    {"method": "POST", "path": "/api/v1/scheduler/conference", "json": {"name": "room"}, "offset_ms": 120}
+
+tenant selects the token (index or name, default the first tenant), offset_ms
+paces the request relative to the start with --paced. Lines without method and
+path are skipped and counted.
+
+--env KEY=VALUE sets service environment variables, e.g. to compare pool sizes
+or the admission control.
+
+--target asgi drives the async app of asgi.py instead of the Flask app, with
+all threads sharing one event loop like a uvicorn worker. The database is
+opened through its async driver (aiosqlite or asyncpg), or
+RESERVATION_SERVICE_ASYNC_DATABASE_URL. The mix names endpoints the same way
+for both targets, so the serving modes can be compared:
+
+    python benchmarks/loadtest.py --dataset medium --threads 16 --output wsgi.json
+    python benchmarks/loadtest.py --dataset medium --threads 16 --target asgi --compare wsgi.json
+"""
+from datetime import datetime, timedelta, timezone
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from service import percentile, start_service
+
+CONFERENCE = '/api/v1/scheduler/conference'
+RESERVATION = '/api/v1/scheduler/reservation'
+
+DATASETS = {
+    'small': {'tenants': 5, 'reservations': 200},
+    'medium': {'tenants': 20, 'reservations': 2000},
+    'large': {'tenants': 100, 'reservations': 5000},
+}
+
+# Relative weights of the operations of the mix
+MIX = {
+    'conference_join': 30,
+    'conference_end': 10,
+    'reservation_create': 15,
+    'reservation_list': 20,
+    'reservation_get': 20,
+    'reservation_delete': 5,
+}
+
+# Seeded reservations that already started, so Jicofo can join them
+JOINABLE_RATIO = 0.2
+
+
+def tenant_name(index: int) -> str:
+    return f'loadtest-{index}'
+
+
+def seed(service, tenants: int, reservations: int, rng: random.Random) -> dict:
+    """Insert reservations for every tenant, return {tenant: [(id, name, mail_owner, joinable)]}"""
+    from sqlalchemy import delete, insert
+    from Reservation import Reservation
+
+    manager = service.manager
+    session = manager.session
+    session.execute(delete(Reservation).where(Reservation.owner_id.like('loadtest-%')))
+    now = datetime.utcnow().replace(microsecond=0)
+    for tenant in range(tenants):
+        rows = []
+        for i in range(reservations):
+            if rng.random() < JOINABLE_RATIO:
+                # Start times are wall-clock times of the reservation's timezone, stay clear of its offset
+                start = now - timedelta(minutes=rng.randint(6 * 60, 12 * 60))
+            else:
+                start = now + timedelta(minutes=rng.randint(60, 60 * 24 * 90))
+            duration = timedelta(minutes=rng.choice((15, 30, 60, 120)))
+            rows.append({'name': f'{tenant_name(tenant)}-room{i}', 'mail_owner': f'owner{i}@example.com',
+                         'start_time': start, 'end_time': start + duration, 'duration': duration,
+                         'timezone': rng.choice(('UTC', 'Europe/Berlin', 'Asia/Kolkata', 'America/New York')),
+                         'pin': str(rng.randint(1000, 9999)) if i % 3 == 0 else None, 'active': False,
+                         'owner_id': tenant_name(tenant), 'user_id': f'user{i}'})
+        session.execute(insert(Reservation), rows)
+    session.commit()
+
+    seeded = {}
+    for row in session.query(Reservation.id, Reservation.name, Reservation.mail_owner, Reservation.owner_id,
+                             Reservation.start_time) \
+            .filter(Reservation.owner_id.like('loadtest-%')):
+        seeded.setdefault(row.owner_id, []).append((row.id, row.name, row.mail_owner, row.start_time <= now))
+    manager.remove_session()
+    return seeded
+
+
+class Recorder:
+    """Latencies and status codes per endpoint, shared by the worker threads"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.__lock = threading.Lock()
+
+    def record(self, endpoint: str, elapsed: float, status: int):
+        with self.__lock:
+            self.latencies.setdefault(endpoint, []).append(elapsed)
+            statuses = self.statuses.setdefault(endpoint, {})
+            statuses[status] = statuses.get(status, 0) + 1
+
+    def report(self, seconds: float) -> dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                'requests': len(latencies),
+                'requests_per_second': round(len(latencies) / seconds, 1),
+                'statuses': {str(code): count for code, count in sorted(self.statuses[endpoint].items())},
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'max_ms': round(max(latencies) * 1000, 3),
+            }
+        total = sum(len(latencies) for latencies in self.latencies.values())
+        return {'requests': total, 'seconds': round(seconds, 3),
+                'requests_per_second': round(total / seconds, 1) if seconds else None, 'endpoints': endpoints}
+
+
+class Worker:
+    """Runs operations of the mix for random tenants and keeps the ids it created"""
+
+    def __init__(self, service, tenants: dict, headers: dict, recorder: Recorder, rng: random.Random, index: int):
+        self.client = service.client
+        self.tenants = tenants
+        self.headers = headers
+        self.recorder = recorder
+        self.rng = rng
+        self.index = index
+        self.created = 0
+        self.conferences = []
+        self.reservations = []
+        self.joinable = {tenant: [room for room in rooms if room[3]] or rooms for tenant, rooms in tenants.items()}
+        self.operations = list(MIX)
+        self.weights = list(MIX.values())
+
+    def request(self, endpoint: str, method: str, path: str, tenant: str, body: dict = None):
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, headers=self.headers[tenant], json=body)
+        self.recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+        return response
+
+    def run(self, count: int):
+        for _ in range(count):
+            operation = self.rng.choices(self.operations, self.weights)[0]
+            getattr(self, operation)(self.rng.choice(list(self.tenants)))
+
+    def conference_join(self, tenant: str):
+        if self.rng.random() < 0.8:
+            _, name, mail_owner, _ = self.rng.choice(self.joinable[tenant])
+        else:
+            # Ad-hoc room without a reservation
+            self.created += 1
+            name, mail_owner = f'{tenant}-adhoc-{self.index}-{self.created}', 'adhoc@example.com'
+        # Jicofo sends the join time with its offset
+        start_time = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+        response = self.request(f'POST {CONFERENCE}', 'POST', CONFERENCE, tenant,
+                                {'name': name, 'mail_owner': mail_owner, 'start_time': start_time})
+        if response.status_code == 200:
+            self.conferences.append((tenant, response.get_json()['id']))
+
+    def conference_end(self, tenant: str):
+        if not self.conferences:
+            return self.conference_join(tenant)
+        tenant, id = self.conferences.pop(self.rng.randrange(len(self.conferences)))
+        self.request(f'DELETE {CONFERENCE}/<id>', 'DELETE', f'{CONFERENCE}/{id}', tenant)
+
+    def reservation_create(self, tenant: str):
+        self.created += 1
+        start = datetime(2040, 1, 1) + timedelta(minutes=self.rng.randint(0, 60 * 24 * 365))
+        response = self.request(f'POST {RESERVATION}', 'POST', RESERVATION, tenant, {
+            'name': f'{tenant}-new-{self.index}-{self.created}', 'mail_owner': 'owner@example.com',
+            'start_time': start.isoformat(), 'duration': self.rng.choice((900, 1800, 3600)), 'timezone': 'UTC'})
+        if response.status_code in (200, 201):
+            self.reservations.append((tenant, response.get_json()['id']))
+
+    def reservation_list(self, tenant: str):
+        rooms = self.tenants[tenant]
+        after = self.rng.choice(rooms)[0] if self.rng.random() < 0.5 else None
+        path = f'{RESERVATION}?limit=50' + (f'&after={after}' if after is not None else '')
+        self.request(f'GET {RESERVATION}', 'GET', path, tenant)
+
+    def reservation_get(self, tenant: str):
+        id = self.rng.choice(self.tenants[tenant])[0]
+        self.request(f'GET {RESERVATION}/<id>', 'GET', f'{RESERVATION}/{id}', tenant)
+
+    def reservation_delete(self, tenant: str):
+        if not self.reservations:
+            return self.reservation_create(tenant)
+        tenant, id = self.reservations.pop(self.rng.randrange(len(self.reservations)))
+        self.request(f'DELETE {RESERVATION}/<id>', 'DELETE', f'{RESERVATION}/{id}', tenant)
+
+
+def run_threads(target, threads: int) -> float:
+    """Run target(index) on threads and return the elapsed seconds"""
+    workers = [threading.Thread(target=target, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - started
+
+
+def run_mix(service, seeded: dict, headers: dict, args) -> dict:
+    recorder = Recorder()
+    workers = [Worker(service, seeded, headers, recorder, random.Random(args.seed + index), index)
+               for index in range(args.threads)]
+    for worker in workers:
+        worker.run(args.warmup // args.threads)
+    recorder = Recorder()
+    for worker in workers:
+        worker.recorder = recorder
+    seconds = run_threads(lambda index: workers[index].run(args.requests // args.threads), args.threads)
+    return recorder.report(seconds)
+
+
+def endpoint_of(service, method: str, path: str) -> str:
+    """Get 'METHOD /route/template' for a request path"""
+    if service.asgi:
+        for route in service.module.app.routes:
+            if route.path_regex.match(path.split('?')[0]) and method in (route.methods or ()):
+                return f'{method} {route.path}'
+        return f'{method} unmatched'
+    adapter = service.module.app.url_map.bind('localhost')
+    try:
+        rule, _ = adapter.match(path.split('?')[0], method, return_rule=True)
+        return f'{method} {rule.rule}'
+    except Exception:
+        return f'{method} unmatched'
+
+
+def run_replay(service, headers: dict, args) -> dict:
+    tenants = list(headers)
+    entries, skipped = [], 0
+    with open(args.replay) as f:
+        for line in f:
+            line = line.strip()
+            entry = json.loads(line) if line else {}
+            if not isinstance(entry, dict) or 'method' not in entry or 'path' not in entry:
+                skipped += 1
+                continue
+            tenant = entry.get('tenant', 0)
+            tenant = tenants[tenant % len(tenants)] if isinstance(tenant, int) else tenant
+            if tenant not in headers:
+                headers[tenant] = service.headers_for(tenant)
+            method = entry['method'].upper()
+            entries.append((entry.get('offset_ms', 0) / 1000, method, entry['path'], tenant, entry.get('json'),
+                            endpoint_of(service, method, entry['path'])))
+
+    recorder = Recorder()
+    position = iter(range(len(entries)))
+    lock = threading.Lock()
+    started = time.perf_counter()
+
+    def replay(index):
+        client = service.client
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            offset, method, path, tenant, body, endpoint = entries[i]
+            if args.paced:
+                delay = started + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            request_started = time.perf_counter()
+            response = client.open(path, method=method, headers=headers[tenant], json=body)
+            recorder.record(endpoint, time.perf_counter() - request_started, response.status_code)
+
+    seconds = run_threads(replay, args.threads)
+    report = recorder.report(seconds)
+    report['skipped_lines'] = skipped
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Print the change of each endpoint against a baseline report, return the regressions"""
+    regressions = []
+    for endpoint, result in report['endpoints'].items():
+        before = baseline.get('endpoints', {}).get(endpoint)
+        if before is None:
+            continue
+        changes = {key: result[key] / before[key] - 1 for key in ('p50_ms', 'p95_ms', 'p99_ms') if before[key]}
+        print(f'{endpoint}: ' + ', '.join(f'{key} {change:+.1%}' for key, change in changes.items()),
+              file=sys.stderr)
+        if changes.get('p99_ms', 0) > tolerance:
+            regressions.append(endpoint)
+    if baseline.get('requests_per_second'):
+        change = report['requests_per_second'] / baseline['requests_per_second'] - 1
+        print(f'throughput: {change:+.1%}', file=sys.stderr)
+        if change < -tolerance:
+            regressions.append('throughput')
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the scheduler API.')
+    parser.add_argument('--dataset', choices=sorted(DATASETS), default='small')
+    parser.add_argument('--requests', type=int, default=5000, help='Requests of the mix after the warm-up')
+    parser.add_argument('--warmup', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--target', choices=('wsgi', 'asgi'), default='wsgi',
+                        help='Serve the Flask app or the ASGI app of asgi.py')
+    parser.add_argument('--database', help='Database URL instead of a temporary SQLite file')
+    parser.add_argument('--replay', help='JSONL file of captured requests to drive instead of the mix')
+    parser.add_argument('--paced', action='store_true', help='Keep the offset_ms timing of replayed requests')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Environment variable for the service')
+    parser.add_argument('--output', help='Write the report to this file')
+    parser.add_argument('--compare', help='Report of an earlier run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Exit with 1 if p99 or throughput are worse than the baseline by more than this')
+    args = parser.parse_args()
+
+    environment = dict(RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    environment.update(value.split('=', 1) for value in args.env)
+    dataset = DATASETS[args.dataset]
+    rng = random.Random(args.seed)
+    service = start_service(tenant_name(0), database_url=args.database, asgi=args.target == 'asgi',
+                            **environment)
+    headers = {tenant_name(i): service.headers_for(tenant_name(i)) for i in range(dataset['tenants'])}
+
+    seed_started = time.perf_counter()
+    seeded = seed(service, dataset['tenants'], dataset['reservations'], rng)
+    seed_seconds = time.perf_counter() - seed_started
+    if args.replay:
+        report = run_replay(service, headers, args)
+    else:
+        report = run_mix(service, seeded, headers, args)
+    service.close()
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'target': args.target,
+        'database': service.manager.engine.dialect.name,
+        'dataset': {'name': args.dataset, **dataset, 'seed_seconds': round(seed_seconds, 3)},
+        'mode': 'replay' if args.replay else 'mix',
+        'mix': None if args.replay else MIX,
+        'threads': args.threads,
+        'seed': args.seed,
+        'environment': environment,
+        **report,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
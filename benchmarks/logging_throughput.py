@@ -0,0 +1,88 @@
+"""Request throughput of the Flask app with synchronous and queue-based logging.
+
+Runs the same workload (create a reservation, fetch it, list a page) through the
+Flask test client against a temporary SQLite database, once per logging mode,
+each in a fresh process, and prints requests per second as JSON:
+
+    python benchmarks/logging_throughput.py --requests 2000 --log-file /tmp/bench.log
+
+sync  the root logger writes to stderr in the request thread, like logging.basicConfig
+queue records go through LogQueue to a writer thread (the service default)
+
+Log output goes to --log-file (default /dev/null) in both modes. --slow-sink instead
+writes it to a pipe drained at a limited rate, like a backed-up log collector, which is
+where synchronous writes stall requests. Running the script against an older checkout
+with --modes sync measures the print() baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from service import start_service, throughput
+
+
+def slow_sink(delay: float):
+    """Point fd 2 at a pipe that a reader thread drains one chunk per delay"""
+    read_end, write_end = os.pipe()
+    os.dup2(write_end, 2)
+
+    def drain():
+        while os.read(read_end, 4096):
+            time.sleep(delay)
+
+    threading.Thread(target=drain, daemon=True).start()
+
+
+def run(mode: str, requests: int, log_file: str, sink_delay: float = None) -> dict:
+    """Run the workload in this process and return its throughput"""
+    # Both modes write to the same sink through fd 2
+    if sink_delay:
+        slow_sink(sink_delay)
+    else:
+        log = open(log_file, 'a')
+        os.dup2(log.fileno(), 2)
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='INFO')
+    if mode == 'sync':
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s %(message)s'))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+
+    result = throughput(service, requests)
+    service.close()
+    return {'mode': mode, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare request throughput with synchronous and queued logging.')
+    parser.add_argument('--requests', type=int, default=3000, help='Requests per mode')
+    parser.add_argument('--modes', default='sync,queue', help='Comma separated logging modes to run')
+    parser.add_argument('--log-file', default=os.devnull, help='Where the service logs are written')
+    parser.add_argument('--slow-sink', type=float, default=0,
+                        help='Drain the logs through a pipe, sleeping this many milliseconds per 4 KiB')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.requests, args.log_file, args.slow_sink / 1000)))
+        return
+
+    results = []
+    for mode in args.modes.split(','):
+        output = subprocess.run([sys.executable, __file__, '--mode', mode, '--requests', str(args.requests),
+                                 '--log-file', args.log_file, '--slow-sink', str(args.slow_sink)],
+                                check=True, capture_output=True, text=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Cost of the metrics instrumentation.
+
+Measures the per-call cost of the recording primitives, then the request
+throughput of the Flask app with RESERVATION_SERVICE_METRICS_ENABLED=true and
+false, each in a fresh process, and prints both as JSON. The two modes run in
+alternating rounds and the best round of each is compared, to filter out noise
+from the machine:
+
+    python benchmarks/metrics_overhead.py --requests 3000 --rounds 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+import timeit
+from service import APP_DIR, start_service, throughput
+
+
+def primitives(number: int) -> dict:
+    """Nanoseconds per call of each recording primitive"""
+    sys.path.insert(0, APP_DIR)
+    import Metrics
+
+    histogram = Metrics.Histogram('bench_seconds', 'Benchmark', ['route', 'method', 'status'], registry=None)
+    counter = [0]
+    token = Metrics.query_counter.set(counter)
+
+    @Metrics.instrumented
+    def method():
+        pass
+
+    def stage():
+        with Metrics.Stage('bench'):
+            pass
+
+    def request():
+        Metrics.RequestMetrics('GET /bench').finish('/bench', 'GET', 200)
+
+    cases = {
+        'histogram_observe': lambda: histogram.labels('/bench', 'GET', 200).observe(0.003),
+        'stage': stage,
+        'manager_method': method,
+        'request': request,
+        'query_count': lambda: Metrics.count_query(None, None, None, None, None, False),
+    }
+    results = {name: round(timeit.timeit(case, number=number) / number * 1e9) for name, case in cases.items()}
+    Metrics.query_counter.reset(token)
+    return results
+
+
+def run(enabled: bool, requests: int) -> dict:
+    service = start_service(RESERVATION_SERVICE_METRICS_ENABLED='true' if enabled else 'false',
+                            RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    result = throughput(service, requests)
+    service.close()
+    return {'metrics': enabled, **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the overhead of the metrics instrumentation.')
+    parser.add_argument('--requests', type=int, default=3000, help='Requests per run')
+    parser.add_argument('--rounds', type=int, default=3, help='Runs per mode')
+    parser.add_argument('--number', type=int, default=100000, help='Calls per primitive')
+    parser.add_argument('--enabled', choices=['true', 'false'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.enabled:
+        print(json.dumps(run(args.enabled == 'true', args.requests)))
+        return
+
+    best = {}
+    for _ in range(args.rounds):
+        for enabled in ('false', 'true'):
+            output = subprocess.run([sys.executable, __file__, '--enabled', enabled, '--requests', str(args.requests)],
+                                    check=True, capture_output=True, text=True)
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            if enabled not in best or result['requests_per_second'] > best[enabled]['requests_per_second']:
+                best[enabled] = result
+    overhead = 1 - best['true']['requests_per_second'] / best['false']['requests_per_second']
+    print(json.dumps({'primitives_ns': primitives(args.number), 'throughput': [best['false'], best['true']],
+                      'overhead': round(overhead, 4)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Latency of a quiet tenant while another tenant floods the list endpoint.
+
+Noisy threads of one tenant request reservation pages as fast as they can,
+waiting for Retry-After when they get 429, while a quiet tenant fetches single
+reservations. Runs with the per-tenant admission control off and on, each in a
+fresh process, and prints the latency percentiles of the quiet tenant and the
+response codes of the noisy one as JSON:
+
+    python benchmarks/noisy_neighbour.py --noisy-threads 8 --seconds 5
+    python benchmarks/noisy_neighbour.py --backend local   # shared buckets on the Redis stand-in
+
+All clients share one process here, so noisy clients that ignore Retry-After
+(--no-retry-after) still compete with the quiet one for the interpreter even
+when they are rejected.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import threading
+import time
+from service import percentile, start_service
+
+LIMITS = {
+    'RESERVATION_SERVICE_RATE_LIMIT_ROUTES': 'GET /api/v1/scheduler/reservation=50:50',
+    'RESERVATION_SERVICE_TENANT_MAX_IN_FLIGHT': '2',
+}
+
+
+def run(limited: bool, noisy_threads: int, seconds: float, backend: str, retry: bool) -> dict:
+    environment = dict(LIMITS) if limited else {}
+    if limited and backend == 'local':
+        environment['RESERVATION_SERVICE_RATE_LIMIT_REDIS_URL'] = 'local'
+    service = start_service('noisy', RESERVATION_SERVICE_LOG_LEVEL='WARNING', **environment)
+    client, noisy_headers = service.client, service.headers
+    quiet_headers = service.headers_for('quiet')
+    for i in range(200):
+        client.post('/api/v1/scheduler/reservation', headers=noisy_headers, json={
+            'name': f'noisy{i}', 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'UTC'})
+    quiet_id = client.post('/api/v1/scheduler/reservation', headers=quiet_headers, json={
+        'name': 'quiet', 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'UTC'}).get_json()['id']
+
+    stop = threading.Event()
+    statuses = {}
+    lock = threading.Lock()
+
+    def flood():
+        while not stop.is_set():
+            response = client.get('/api/v1/scheduler/reservation?limit=200', headers=noisy_headers)
+            with lock:
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 429 and retry:
+                stop.wait(float(response.headers['Retry-After']))
+
+    threads = [threading.Thread(target=flood) for _ in range(noisy_threads)]
+    for thread in threads:
+        thread.start()
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        client.get(f'/api/v1/scheduler/reservation/{quiet_id}', headers=quiet_headers)
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.005)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    service.close()
+
+    return {
+        'limited': limited,
+        'quiet_requests': len(latencies),
+        'quiet_p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'quiet_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'noisy_statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure a quiet tenant next to a noisy one.')
+    parser.add_argument('--noisy-threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--backend', choices=['memory', 'local'], default='memory')
+    parser.add_argument('--no-retry-after', action='store_true',
+                        help='Let the noisy tenant ignore Retry-After and retry at once')
+    parser.add_argument('--limited', choices=['true', 'false'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.limited:
+        print(json.dumps(run(args.limited == 'true', args.noisy_threads, args.seconds, args.backend,
+                             not args.no_retry_after)))
+        return
+
+    results = []
+    for limited in ('false', 'true'):
+        output = subprocess.run([sys.executable, __file__, '--limited', limited, '--noisy-threads',
+                                 str(args.noisy_threads), '--seconds', str(args.seconds), '--backend', args.backend]
+                                + (['--no-retry-after'] if args.no_retry_after else []),
+                                check=True, capture_output=True, text=True)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
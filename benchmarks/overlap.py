@@ -0,0 +1,128 @@
+"""Cost of the overlap checks of a new reservation as the history of its room grows.
+
+Seeds one room per size with that many past reservations and a running
+conference, into a temporary SQLite database or --database-url. Then times
+the checks add_reservation runs before it inserts: the check against running
+conferences and the check against other reservations, for a reservation that
+fits between two others. Also checks that one starting during the running
+conference is rejected. Prints milliseconds per check and the query plans as JSON:
+
+    python benchmarks/overlap.py --sizes 10000,100000,1000000
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import statistics
+import time
+from service import start_service
+
+START = datetime(2000, 1, 1, 8, 0)
+BATCH = 50000
+
+
+def seed(manager, name: str, size: int):
+    """Add size half-hour reservations an hour apart, and a conference running after the last one"""
+    from sqlalchemy import insert
+    from Reservation import Reservation
+
+    session = manager.session
+    for first in range(0, size, BATCH):
+        session.execute(insert(Reservation), [
+            {'name': name, 'start_time': START + timedelta(hours=i), 'end_time': START + timedelta(hours=i, minutes=30),
+             'duration': timedelta(minutes=30), 'timezone': 'UTC', 'active': False, 'owner_id': 'bench', 'user_id': 'bench'}
+            for i in range(first, min(size, first + BATCH))])
+    session.execute(insert(Reservation), [{
+        'name': name, 'start_time': START + timedelta(hours=size), 'end_time': START + timedelta(hours=size + 2),
+        'duration': timedelta(hours=2), 'timezone': 'UTC', 'active': True, 'owner_id': 'bench', 'user_id': 'bench'}])
+    session.commit()
+    manager.remove_session()
+
+
+def timed(function, repeat: int) -> float:
+    """Median milliseconds of repeated calls, each in a fresh session like a request"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return round(statistics.median(times) * 1000, 3)
+
+
+def plan(manager, check) -> list:
+    """Get the query plan of the statement a check runs"""
+    from sqlalchemy import event
+
+    engine = manager.engine
+    statements = []
+
+    def collect(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', collect)
+    try:
+        check()
+    finally:
+        event.remove(engine, 'before_cursor_execute', collect)
+    statement, parameters = statements[-1]
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            return [row[0] for row in connection.exec_driver_sql('EXPLAIN ' + statement, parameters)]
+        return [row[3] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the overlap checks against rooms with a long history.')
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Reservations per room, comma separated')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--database-url', help='Database to seed instead of a temporary SQLite file')
+    args = parser.parse_args()
+
+    service = start_service(database_url=args.database_url, RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    from CustomExceptions import ConferenceExists
+    from Reservation import Reservation
+
+    manager = service.module.manager
+    current_user = {'context': {'group': 'bench', 'user': {'id': 'bench'}}}
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        name = f'overlap_{size}'
+        started = time.perf_counter()
+        seed(manager, name, size)
+        seeded = time.perf_counter() - started
+
+        # Fits between two reservations in the middle of the history
+        middle = START + timedelta(hours=size // 2, minutes=40)
+        event = Reservation().from_dict({'name': name, 'start_time': middle.isoformat(), 'duration': 600}, current_user)
+        running = Reservation().from_dict({'name': name, 'start_time': (START + timedelta(hours=size, minutes=30)).isoformat(),
+                                           'duration': 600}, current_user)
+
+        def conference_check(event=event):
+            manager.check_overlapping_conference(event, current_user)
+            manager.remove_session()
+
+        def reservation_check(event=event):
+            manager.check_overlapping_reservations(event, current_user)
+            manager.remove_session()
+
+        try:
+            manager.check_overlapping_conference(running, current_user)
+            rejected = False
+        except ConferenceExists:
+            rejected = True
+        manager.remove_session()
+
+        results.append({
+            'reservations': size,
+            'seed_seconds': round(seeded, 1),
+            'conference_check_ms': timed(conference_check, args.repeat),
+            'reservation_check_ms': timed(reservation_check, args.repeat),
+            'running_conference_rejected': rejected,
+            'conference_check_plan': plan(manager, conference_check),
+            'reservation_check_plan': plan(manager, reservation_check),
+        })
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Cost of loading list pages as ORM entities and as projected records.
+
+Seeds reservations for one tenant into a temporary SQLite database, then loads
+them in pages the way all_reservations does: once as full Reservation entities,
+as the list endpoints did before, and once as ReservationRecord rows with only
+the response columns. Both are serialized with the compiled conference
+serializer. Prints microseconds per row as JSON:
+
+    python benchmarks/read_queries.py --rows 20000 --limit 500
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import time
+from service import start_service
+
+GROUP = 'bench'
+
+
+def seed(manager, rows: int):
+    from Reservation import Reservation
+
+    session = manager.session
+    start = datetime(2040, 1, 1, 9, 0)
+    session.bulk_save_objects([
+        Reservation(name=f'room{i}', mail_owner=f'user{i}@example.com', start_time=start + timedelta(hours=i),
+                    end_time=start + timedelta(hours=i, minutes=30), duration=timedelta(minutes=30), timezone='UTC',
+                    owner_id=GROUP, user_id=GROUP, user_name='A user name', email=f'user{i}@example.com',
+                    avatar='https://example.com/avatars/' + 'x' * 64, active=False)
+        for i in range(rows)])
+    session.commit()
+    manager.remove_session()
+
+
+def entities(manager, limit: int):
+    """Load all pages as Reservation entities"""
+    from Reservation import Reservation
+
+    session = manager.session
+    after = 0
+    while True:
+        page = session.query(Reservation) \
+            .filter(Reservation.owner_id == GROUP) \
+            .filter(Reservation.active == False) \
+            .filter(Reservation.id > after) \
+            .order_by(Reservation.id) \
+            .limit(limit) \
+            .all()
+        if not page:
+            break
+        yield page
+        after = page[-1].id
+        # Each request starts with a fresh session
+        manager.remove_session()
+        session = manager.session
+
+
+def records(manager, limit: int):
+    """Load all pages as ReservationRecord rows"""
+    current_user = {'context': {'group': GROUP}}
+    after = 0
+    while True:
+        page = manager.all_reservations(current_user=current_user, limit=limit, after=after)
+        if not page:
+            break
+        yield page
+        after = page[-1].id
+        manager.remove_session()
+
+
+def per_row(load, serialize, manager, limit: int, rows: int, repeat: int = 3) -> float:
+    """Best microseconds per row of loading and serializing every page"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in load(manager, limit):
+            [serialize(row) for row in page]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    manager.remove_session()
+    return round(best / rows * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time list pages loaded as entities and as records.')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--limit', type=int, default=500, help='Rows per page')
+    args = parser.parse_args()
+
+    service = start_service(GROUP, RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    manager, serialize = service.module.manager, service.module.serialize_conference
+    seed(manager, args.rows)
+
+    results = {
+        'rows': args.rows,
+        'limit': args.limit,
+        'entities_us': per_row(entities, serialize, manager, args.limit, args.rows),
+        'records_us': per_row(records, serialize, manager, args.limit, args.rows),
+    }
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
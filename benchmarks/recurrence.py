@@ -0,0 +1,123 @@
+"""Weekly meetings stored as series against one row per occurrence.
+
+For each size, seeds a room with that many weekly series of --count
+occurrences, and another room with the same meetings stored one row per
+occurrence, as they were before series existed. Each room has its own
+tenant. Then times the overlap check of a new reservation in a free slot
+halfway through the series, and a list of one week of the tenant with the
+series expanded in the window. Prints rows stored and milliseconds per call as JSON:
+
+    python benchmarks/recurrence.py --sizes 10,100,1000 --count 104
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import statistics
+import time
+from service import start_service
+
+START = datetime(2040, 1, 5, 0, 0)
+SLOT = timedelta(minutes=10)
+LENGTH = timedelta(minutes=5)
+WEEK = timedelta(weeks=1)
+BATCH = 50000
+
+
+def user(tenant: str) -> dict:
+    return {'context': {'group': tenant, 'user': {'id': tenant}}}
+
+
+def seed_series(manager, tenant: str, size: int, count: int):
+    """Add size weekly series of count occurrences, series i starting in the i-th slot of the week"""
+    from Reservation import Reservation
+
+    session = manager.session
+    session.add_all([Reservation().from_dict({
+        'name': tenant, 'start_time': (START + i * SLOT).isoformat(), 'duration': int(LENGTH.total_seconds()),
+        'timezone': 'UTC', 'recurrence': f'FREQ=WEEKLY;COUNT={count}'}, user(tenant)) for i in range(size)])
+    session.commit()
+    manager.remove_session()
+
+
+def seed_rows(manager, tenant: str, size: int, count: int):
+    """Add the same meetings as seed_series as one row per occurrence"""
+    from sqlalchemy import insert
+    from Reservation import Reservation
+
+    rows = ({'name': tenant, 'start_time': START + i * SLOT + week * WEEK, 'end_time': START + i * SLOT + week * WEEK + LENGTH,
+             'duration': LENGTH, 'timezone': 'UTC', 'active': False, 'owner_id': tenant, 'user_id': tenant}
+            for week in range(count) for i in range(size))
+    session = manager.session
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH:
+            session.execute(insert(Reservation), batch)
+            batch = []
+    if batch:
+        session.execute(insert(Reservation), batch)
+    session.commit()
+    manager.remove_session()
+
+
+def timed(function, repeat: int):
+    """Median milliseconds of repeated calls, each in a fresh session like a request, and the last result"""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - started)
+    return round(statistics.median(times) * 1000, 3), result
+
+
+def measure(manager, tenant: str, count: int, repeat: int) -> dict:
+    from sqlalchemy import func
+    from Reservation import Reservation
+
+    # Between two meetings, in the week halfway through the series
+    middle = START + (count // 2) * WEEK
+    event = Reservation().from_dict({'name': tenant, 'start_time': (middle + LENGTH + timedelta(minutes=1)).isoformat(),
+                                     'duration': 60, 'timezone': 'UTC'}, user(tenant))
+
+    def check():
+        manager.check_overlapping_reservations(event, user(tenant))
+        manager.remove_session()
+
+    def week():
+        rows = manager.all_reservations(user(tenant), start_time=middle, end_time=middle + WEEK - SLOT)
+        entries = len(list(manager.expand_occurrences(rows, middle, middle + WEEK - SLOT)))
+        manager.remove_session()
+        return entries
+
+    stored = manager.session.query(func.count(Reservation.id)).filter(Reservation.owner_id == tenant).scalar()
+    manager.remove_session()
+    check_ms, _ = timed(check, repeat)
+    week_ms, entries = timed(week, repeat)
+    return {'rows': stored, 'overlap_check_ms': check_ms, 'week_list_ms': week_ms, 'week_entries': entries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare weekly series with one row per occurrence.')
+    parser.add_argument('--sizes', default='10,100,1000', help='Weekly meetings per room, comma separated')
+    parser.add_argument('--count', type=int, default=104, help='Occurrences per meeting')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    manager = service.module.manager
+    results = []
+    for size in map(int, args.sizes.split(',')):
+        seed_series(manager, f'series{size}', size, args.count)
+        seed_rows(manager, f'rows{size}', size, args.count)
+        results.append({
+            'meetings': size,
+            'occurrences': args.count,
+            'series': measure(manager, f'series{size}', args.count, args.repeat),
+            'rows': measure(manager, f'rows{size}', args.count, args.repeat),
+        })
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
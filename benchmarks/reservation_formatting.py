@@ -0,0 +1,73 @@
+"""Per-row cost of formatting reservations for Jicofo and the frontend.
+
+Builds reservations in memory across a set of timezones and times
+get_jicofo_api_dict and start_time_formatted over all of them, on a cold
+instance cache and again on a warm one. The legacy column repeats the formatting
+without the timezone lookup cache, as it was done before. Prints microseconds
+per row as JSON:
+
+    python benchmarks/reservation_formatting.py --rows 100000
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import sys
+import time
+import pytz
+from service import APP_DIR
+
+sys.path.insert(0, APP_DIR)
+from Reservation import Reservation
+
+TIMEZONES = ['UTC', 'America/New York', 'Europe/Berlin', 'Asia/Kolkata', 'Australia/Sydney', 'America/Sao_Paulo']
+
+
+def legacy_jicofo_api_dict(reservation: Reservation) -> dict:
+    timezone = pytz.timezone(reservation.timezone.replace(' ', '_'))
+    start_time = timezone.localize(reservation.start_time).strftime('%Y-%m-%dT%H:%M:%S.ms%z')
+    start_time = start_time.replace('ms', '{:03.0f}'.format(reservation.start_time.microsecond // 1000))
+    return {
+        'id': reservation.id,
+        'name': reservation.name,
+        'start_time': start_time,
+        'duration': reservation.get_duration_in_seconds(),
+        'timezone': reservation.timezone,
+    }
+
+
+def legacy_start_time_formatted(reservation: Reservation) -> str:
+    timezone = pytz.timezone(reservation.timezone.replace(' ', '_'))
+    return timezone.localize(reservation.start_time).strftime('%d %b %Y - %H:%M %Z')
+
+
+def per_row(function, rows: list) -> float:
+    """Microseconds per row of calling function on every row"""
+    started = time.perf_counter()
+    for row in rows:
+        function(row)
+    return round((time.perf_counter() - started) / len(rows) * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time Reservation formatting per row.')
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    start = datetime(2030, 1, 1, 9, 0)
+    rows = [Reservation(id=i, name=f'room{i}', start_time=start + timedelta(minutes=17 * i, microseconds=i),
+                        duration=timedelta(hours=1), timezone=TIMEZONES[i % len(TIMEZONES)])
+            for i in range(args.rows)]
+
+    results = {
+        'rows': args.rows,
+        'jicofo_dict_legacy_us': per_row(legacy_jicofo_api_dict, rows),
+        'jicofo_dict_cold_us': per_row(Reservation.get_jicofo_api_dict, rows),
+        'jicofo_dict_warm_us': per_row(Reservation.get_jicofo_api_dict, rows),
+        'start_time_formatted_legacy_us': per_row(legacy_start_time_formatted, rows),
+        'start_time_formatted_us': per_row(lambda row: row.start_time_formatted, rows),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
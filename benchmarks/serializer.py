@@ -0,0 +1,115 @@
+"""Compatibility and speed of the compiled serializer against flask-restx marshal.
+
+First checks a fixed set of reservations covering NULLs, defaults, series and
+microsecond times: the compiled serializer and marshal(conference_model) must
+both produce the checked-in golden output (benchmarks/golden/conference_list.json),
+including key order. Then times both serializers with their JSON encoders over
+generated rows and prints microseconds per row as JSON:
+
+    python benchmarks/serializer.py --rows 10000
+    python benchmarks/serializer.py --update-golden   # after an intended schema change
+"""
+from datetime import datetime, timedelta
+import argparse
+import json
+import os
+import sys
+import time
+from service import start_service
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'golden', 'conference_list.json')
+
+
+def golden_rows(Reservation) -> list:
+    """Reservations that exercise every field of conference_model"""
+    return [
+        Reservation(id=1, name='room', mail_owner='owner@example.com', start_time=datetime(2030, 1, 1, 10, 0),
+                    duration=timedelta(minutes=60), timezone='UTC', pin='1234'),
+        Reservation(id=2, name='micro', start_time=datetime(2030, 2, 3, 4, 5, 6, 789012),
+                    duration=timedelta(hours=6, seconds=1), timezone='America/New York'),
+        Reservation(id=3, name='no_timezone', start_time=datetime(2031, 12, 31, 23, 59), duration=timedelta(0),
+                    timezone=None),
+        Reservation(id=4, name='series', start_time=datetime(2030, 1, 6, 9, 0), duration=timedelta(minutes=30),
+                    timezone='Europe/Berlin', recurrence='FREQ=WEEKLY;BYDAY=MO;COUNT=10'),
+        Reservation(id=5, name='empty', start_time=None, duration=None, timezone='', pin=''),
+        Reservation(id=6, name='unicode_ümlaut', mail_owner='a"b\\c@example.com', start_time=datetime(2030, 5, 5),
+                    duration=timedelta(days=2), timezone='Asia/Kolkata'),
+        Reservation(),
+        None,
+    ]
+
+
+def check_golden(service, update: bool) -> int:
+    from flask_restx import marshal
+    from Reservation import Reservation
+
+    rows = golden_rows(Reservation)
+    marshalled = json.loads(json.dumps(marshal(rows, service.module.conference_model)))
+    compiled = json.loads(service.module.dumps([service.module.serialize_conference(row) for row in rows]))
+    if update:
+        with open(GOLDEN, 'w') as f:
+            json.dump(marshalled, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+    with open(GOLDEN) as f:
+        golden = json.load(f)
+
+    failures = 0
+    for name, output in (('marshal', marshalled), ('compiled', compiled)):
+        for index, (expected, actual) in enumerate(zip(golden, output)):
+            if expected != actual or list(expected) != list(actual):
+                print(f'{name} differs from the golden output for row {index}:\n  {expected}\n  {actual}',
+                      file=sys.stderr)
+                failures += 1
+        if len(golden) != len(output):
+            print(f'{name} returned {len(output)} rows, expected {len(golden)}', file=sys.stderr)
+            failures += 1
+    return failures
+
+
+def per_row(function, rows: list, repeat: int = 3) -> float:
+    """Best microseconds per row of encoding all rows with function"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(rows)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best / len(rows) * 1e6, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check and time the compiled conference serializer.')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--update-golden', action='store_true', help='Rewrite the golden output from marshal')
+    args = parser.parse_args()
+
+    service = start_service(RESERVATION_SERVICE_LOG_LEVEL='WARNING')
+    failures = check_golden(service, args.update_golden)
+    if failures:
+        sys.exit(1)
+
+    from flask_restx import marshal
+    from Reservation import Reservation
+    import Serializer
+    module = service.module
+    start = datetime(2030, 1, 1, 9, 0)
+    rows = [Reservation(id=i, name=f'room{i}', mail_owner=f'user{i}@example.com',
+                        start_time=start + timedelta(minutes=17 * i), duration=timedelta(hours=1),
+                        timezone='UTC', pin=str(i) if i % 2 else None)
+            for i in range(args.rows)]
+
+    results = {
+        'rows': args.rows,
+        'golden': 'ok',
+        'json_encoder': 'orjson' if Serializer.orjson is not None else 'json',
+        'marshal_json_us': per_row(lambda rows: json.dumps(marshal(rows, module.conference_model)), rows),
+        'compiled_us': per_row(lambda rows: [module.serialize_conference(row) for row in rows], rows),
+        'compiled_dumps_us': per_row(lambda rows: module.dumps([module.serialize_conference(row) for row in rows]),
+                                     rows),
+    }
+    service.close()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
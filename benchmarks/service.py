@@ -0,0 +1,183 @@
+"""Runs the Flask app in-process for the benchmarks.
+
+start_service() serves a fresh RSA public key the way the secret management
+service does, points the app at a temporary SQLite database (or a given one)
+and returns a test client with a matching bearer token. With asgi=True the
+ASGI app of asgi.py is served instead, through a Starlette test client that
+answers like the Flask one.
+"""
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import os
+import sys
+import tempfile
+import threading
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+
+
+def key_server(public_pem: bytes, kid: str) -> HTTPServer:
+    """Serve the public key for kid on a local port"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == f'/{kid}.pem':
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(public_pem)
+            else:
+                self.send_response(404)
+                self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class AsgiResponse:
+    """Response of the ASGI test client with the accessors of a Flask test response"""
+
+    def __init__(self, response):
+        self.response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+
+    def get_json(self):
+        return self.response.json()
+
+    def get_data(self, as_text: bool = False):
+        return self.response.text if as_text else self.response.content
+
+
+class AsgiClient:
+    """Starlette test client with the open() call of the Flask test client.
+    Requests of all threads run on the one event loop of the client, like in a uvicorn worker."""
+
+    def __init__(self, app):
+        from starlette.testclient import TestClient
+
+        self.client = TestClient(app, raise_server_exceptions=False)
+        # Runs the lifespan, which creates the schema
+        self.client.__enter__()
+
+    def open(self, path: str, method: str = 'GET', headers: dict = None, json=None) -> AsgiResponse:
+        return AsgiResponse(self.client.request(method, path, headers=headers, json=json))
+
+    def get(self, path: str, headers: dict = None) -> AsgiResponse:
+        return self.open(path, headers=headers)
+
+    def post(self, path: str, headers: dict = None, json=None) -> AsgiResponse:
+        return self.open(path, method='POST', headers=headers, json=json)
+
+    def close(self):
+        self.client.__exit__(None, None, None)
+
+
+def async_url(url: str) -> str:
+    """Get the async driver URL of a database URL, aiosqlite for SQLite and asyncpg for PostgreSQL"""
+    scheme, rest = url.split(':', 1)
+    driver = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}.get(scheme.split('+')[0], scheme)
+    return driver + ':' + rest
+
+
+class Service:
+    def __init__(self, module, client, headers, server, database, key=None, manager=None):
+        self.module = module
+        self.client = client
+        # Sync Manager on the service's database, for seeding
+        self.manager = manager if manager is not None else module.manager
+        self.asgi = isinstance(client, AsgiClient)
+        self.headers = headers
+        self.server = server
+        self.database = database
+        self.key = key
+
+    def headers_for(self, group: str) -> dict:
+        """Get request headers with a bearer token of another tenant"""
+        return bearer_headers(self.key, group)
+
+    def close(self):
+        if self.asgi:
+            self.client.close()
+        self.server.shutdown()
+        if self.database is not None:
+            os.remove(self.database)
+
+
+def start_service(group: str = 'bench', database_url: str = None, asgi: bool = False, **environment) -> Service:
+    """Import the app against a temporary SQLite database, or database_url if given, and return
+    it with an authorized test client. asgi serves asgi.py instead of the Flask app. Extra keyword
+    arguments are set as environment variables before the import."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    public_pem = key.public_key().public_bytes(serialization.Encoding.PEM,
+                                               serialization.PublicFormat.SubjectPublicKeyInfo)
+    server = key_server(public_pem, 'bench')
+    database = None
+    if database_url is None:
+        database = tempfile.NamedTemporaryFile(suffix='.db', delete=False).name
+        database_url = f'sqlite:///{database}'
+    os.environ.update(
+        SECRET_MANAGEMENT_SERVICE_PUBLIC_KEY_URL=f'http://127.0.0.1:{server.server_port}',
+        RESERVATION_SERVICE_DATABASE_URL=database_url,
+        DEPLOYMENT_ENV=os.getenv('DEPLOYMENT_ENV', 'development'),
+        **environment,
+    )
+
+    sys.path.insert(0, APP_DIR)
+    os.chdir(APP_DIR)
+    if asgi:
+        from sqlalchemy import create_engine
+        from Conferences import Manager, engine_options
+
+        os.environ.setdefault('RESERVATION_SERVICE_ASYNC_DATABASE_URL', async_url(database_url))
+        import asgi as module
+        manager = Manager(create_engine(database_url, **engine_options(database_url)))
+        return Service(module, AsgiClient(module.app), bearer_headers(key, group), server, database, key, manager)
+
+    import app as module
+    module.create_app()
+
+    return Service(module, module.app.test_client(), bearer_headers(key, group), server, database, key)
+
+
+def bearer_headers(key, group: str) -> dict:
+    """Sign a token for group with the key served by key_server"""
+    import jwt
+
+    token = jwt.encode({'iss': 'sariska', 'aud': 'media', 'exp': int(time.time()) + 3600,
+                        'context': {'group': group, 'user': {'id': group, 'name': group}}},
+                       key, algorithm='RS256', headers={'kid': 'bench'})
+    return {'Authorization': 'Bearer ' + token, 'User-Agent': 'benchmark'}
+
+
+def reservation_cycle(service: Service, i: int):
+    """Create a reservation, fetch it and list a page"""
+    client, headers = service.client, service.headers
+    response = client.post('/api/v1/scheduler/reservation', headers=headers, json={
+        'name': f'bench{i}', 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'UTC'})
+    client.get(f'/api/v1/scheduler/reservation/{response.get_json()["id"]}', headers=headers)
+    client.get('/api/v1/scheduler/reservation?limit=50', headers=headers)
+
+
+def throughput(service: Service, requests: int) -> dict:
+    """Run reservation cycles after a warm-up and return the request rate"""
+    for i in range(min(50, requests)):
+        reservation_cycle(service, -i - 1)
+    cycles = max(1, requests // 3)
+    started = time.perf_counter()
+    for i in range(cycles):
+        reservation_cycle(service, i)
+    elapsed = time.perf_counter() - started
+    return {'requests': cycles * 3, 'seconds': round(elapsed, 3),
+            'requests_per_second': round(cycles * 3 / elapsed, 1)}
+
+
+def percentile(values: list, q: float) -> float:
+    """Nearest-rank percentile of values, q between 0 and 1"""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
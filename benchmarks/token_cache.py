@@ -0,0 +1,118 @@
+"""Cold and warm token verification with the decoded-token cache.
+
+Times the verification token_required does for a bearer token: cold, with the
+unverified header and the full signature check, and warm, from TokenCache.
+Both are timed for RS256 and ES256 keys. Then replays a request mix in which
+repeat callers reuse their tokens (a few hot tokens and a long tail) through
+the cache, and reports its hit rate and mean latency per request against
+verifying every request. Prints the results as JSON:
+
+    python benchmarks/token_cache.py --tokens 1000 --requests 50000 --threads 4
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+AUDIENCE = ['media_messaging_co-browsing', 'media']
+
+
+def keys(algorithm: str):
+    from cryptography.hazmat.primitives.asymmetric import ec, rsa
+
+    if algorithm == 'RS256':
+        private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    else:
+        private = ec.generate_private_key(ec.SECP256R1())
+    return private, private.public_key()
+
+
+def sign(private, algorithm: str, i: int) -> str:
+    import jwt
+
+    return jwt.encode({'iss': 'sariska', 'aud': 'media', 'exp': int(time.time()) + 3600,
+                       'context': {'group': f'tenant{i % 50}', 'user': {'id': f'user{i}', 'name': 'bench'}}},
+                      private, algorithm=algorithm, headers={'kid': 'bench'})
+
+
+def verify(token: str, public_key) -> dict:
+    """The cold path of token_required, without the key lookup"""
+    import jwt
+
+    header = jwt.get_unverified_header(token)
+    return jwt.decode(token, public_key, algorithms=[header['alg']], issuer='sariska', audience=AUDIENCE)
+
+
+def cached(cache, token: str, public_key) -> dict:
+    """The path of token_required with the token cache"""
+    claims = cache.get(token)
+    if claims is None:
+        claims = verify(token, public_key)
+        cache.put(token, claims)
+    return claims
+
+
+def per_call_us(function, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return round((time.perf_counter() - started) / calls * 1e6, 2)
+
+
+def replay(requests: list, function, threads: int) -> float:
+    """Run the requests split over threads, return the mean microseconds per request"""
+    chunks = [requests[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=lambda chunk=chunk: [function(token) for token in chunk]) for chunk in chunks]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return round((time.perf_counter() - started) / len(requests) * 1e6, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time token verification with and without the token cache.')
+    parser.add_argument('--tokens', type=int, default=1000, help='Distinct tokens in the request mix')
+    parser.add_argument('--requests', type=int, default=50000, help='Requests in the request mix')
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--calls', type=int, default=2000, help='Calls per cold and warm timing')
+    args = parser.parse_args()
+
+    from TokenCache import TokenCache
+
+    results = {'verify': []}
+    for algorithm in ('RS256', 'ES256'):
+        private, public = keys(algorithm)
+        token = sign(private, algorithm, 0)
+        cache = TokenCache()
+        cache.put(token, verify(token, public))
+        cold = per_call_us(lambda: verify(token, public), args.calls)
+        warm = per_call_us(lambda: cached(cache, token, public), args.calls)
+        results['verify'].append({'algorithm': algorithm, 'cold_us': cold, 'warm_us': warm,
+                                  'speedup': round(cold / warm, 1)})
+
+    # Repeat callers: request i uses token k with probability proportional to 1 / (k + 1)
+    private, public = keys('RS256')
+    tokens = [sign(private, 'RS256', i) for i in range(args.tokens)]
+    weights = [1 / (k + 1) for k in range(args.tokens)]
+    requests = random.Random(1).choices(tokens, weights=weights, k=args.requests)
+    cache = TokenCache(max_size=args.cache_size)
+    results['mix'] = {
+        'tokens': args.tokens,
+        'requests': args.requests,
+        'threads': args.threads,
+        'uncached_us': replay(requests, lambda token: verify(token, public), args.threads),
+        'cached_us': replay(requests, lambda token: cached(cache, token, public), args.threads),
+        'hit_rate': round(cache.hits / (cache.hits + cache.misses), 4),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,16 @@
+-- Indexes for the lookups done by Conferences.Manager.
+-- The service creates missing indexes on startup; on large PostgreSQL tables run
+-- this file beforehand so the indexes are built without locking out writes.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reservations_name_active
+    ON reservations (name, active);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reservations_owner_id_active_id
+    ON reservations (owner_id, active, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reservations_name_start_time_end_time
+    ON reservations (name, start_time, end_time);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_reservations_active_name
+    ON reservations (name)
+    WHERE active = true;
@@ -0,0 +1,14 @@
+-- Reject overlapping reservations of the same room and index their time ranges.
+-- Rows created before overlap checks were enforced may already overlap; find them with
+--
+--   SELECT a.id, b.id FROM reservations a JOIN reservations b
+--     ON a.name = b.name AND a.id < b.id AND NOT a.active AND NOT b.active
+--    AND tsrange(a.start_time, a.end_time, '[]') && tsrange(b.start_time, b.end_time, '[]');
+--
+-- and resolve them before applying this file.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE reservations ADD CONSTRAINT ex_reservations_name_during
+    EXCLUDE USING gist (name WITH =, tsrange(start_time, end_time, '[]') WITH &&)
+    WHERE (active = false);
@@ -0,0 +1,10 @@
+-- Allow only one running conference per room, so that concurrent joins cannot both succeed.
+-- Resolve duplicate running conferences first; find them with
+--
+--   SELECT name, array_agg(id) FROM reservations WHERE active GROUP BY name HAVING count(*) > 1;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_reservations_active_name
+    ON reservations (name)
+    WHERE active = true;
+
+DROP INDEX CONCURRENTLY IF EXISTS ix_reservations_active_name;
@@ -0,0 +1,4 @@
+-- Recurring reservations: the RRULE of a series and the end of its last occurrence.
+
+ALTER TABLE reservations ADD COLUMN IF NOT EXISTS recurrence VARCHAR;
+ALTER TABLE reservations ADD COLUMN IF NOT EXISTS recurrence_end TIMESTAMP WITHOUT TIME ZONE;
@@ -0,0 +1,14 @@
+-- Stored responses of create requests by Idempotency-Key, removed by the sweeper after their TTL.
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key VARCHAR(64) PRIMARY KEY,
+    request_hash VARCHAR(64) NOT NULL,
+    status INTEGER,
+    body BYTEA,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    locked_until TIMESTAMP WITHOUT TIME ZONE,
+    expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at
+    ON idempotency_keys (expires_at);
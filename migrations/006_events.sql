@@ -0,0 +1,23 @@
+-- Event log of conference and reservation changes, read by consumers of GET /api/v1/scheduler/events.
+
+CREATE TABLE IF NOT EXISTS events (
+    id BIGSERIAL PRIMARY KEY,
+    owner_id VARCHAR NOT NULL,
+    type VARCHAR NOT NULL,
+    reservation_id INTEGER,
+    name VARCHAR,
+    data JSON,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_events_owner_id_id ON events (owner_id, id);
+CREATE INDEX IF NOT EXISTS ix_events_created_at ON events (created_at);
+
+-- Version counters, created at startup since the conference registry; databases
+-- managed only through these files do not have them yet.
+CREATE TABLE IF NOT EXISTS versions (
+    scope VARCHAR PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+INSERT INTO versions (scope, version) VALUES ('events_pruned', 0) ON CONFLICT (scope) DO NOTHING;
@@ -0,0 +1,4 @@
+-- Row versions of reservations, incremented on every update. They are the ETags of
+-- GET /reservation/<id> and GET /conference/<id>.
+
+ALTER TABLE reservations ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
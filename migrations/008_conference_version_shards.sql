@@ -0,0 +1,4 @@
+-- Running conferences are counted per shard of room names ('conferences:<n>'), the shard
+-- rows are created on first use. Remove the single counter the shards replace.
+
+DELETE FROM versions WHERE scope = 'conferences';
@@ -0,0 +1,23 @@
+-- Conferences and reservations retired by the sweeper in archive mode, partitioned by month
+-- of start_time. The sweeper creates the default and the monthly partitions on each pass.
+
+CREATE TABLE IF NOT EXISTS reservations_archive (
+    id INTEGER NOT NULL,
+    start_time TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    name VARCHAR,
+    end_time TIMESTAMP WITHOUT TIME ZONE,
+    duration INTERVAL,
+    timezone VARCHAR,
+    pin VARCHAR,
+    mail_owner VARCHAR,
+    active BOOLEAN,
+    user_id VARCHAR,
+    owner_id VARCHAR,
+    user_name VARCHAR,
+    email VARCHAR,
+    avatar VARCHAR,
+    recurrence VARCHAR,
+    recurrence_end TIMESTAMP WITHOUT TIME ZONE,
+    archived_at TIMESTAMP WITHOUT TIME ZONE,
+    PRIMARY KEY (id, start_time)
+) PARTITION BY RANGE (start_time);
@@ -0,0 +1,207 @@
+"""Shared fixtures. The app modules are imported flat from app/, like gunicorn does."""
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import sys
+import threading
+import time
+import uuid
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app')
+sys.path.insert(0, APP_DIR)
+
+# Tests marked postgres_only run against this database, in a schema of their own that is dropped afterwards
+POSTGRES_URL = os.getenv('DATABASE_URL', '')
+postgres_only = pytest.mark.skipif(not POSTGRES_URL.startswith('postgresql'),
+                                   reason='DATABASE_URL does not point at PostgreSQL')
+
+
+class KeyService:
+    """Local stand-in for the secret management service, serving <kid>.pem.
+
+    answers maps a kid to (status, body); kids without an answer get 404.
+    Every request is recorded, and delay slows down all answers.
+    """
+
+    def __init__(self):
+        self.answers = {}
+        self.requests = []
+        self.delay = 0.0
+        self.lock = threading.Lock()
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                kid = self.path.strip('/').rsplit('.pem', 1)[0]
+                with service.lock:
+                    service.requests.append(kid)
+                if service.delay:
+                    time.sleep(service.delay)
+                status, body = service.answers.get(kid, (404, b''))
+                try:
+                    self.send_response(status)
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, kid: str) -> int:
+        with self.lock:
+            return self.requests.count(kid)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def key_service():
+    service = KeyService()
+    yield service
+    service.close()
+
+
+@pytest.fixture(scope='session')
+def rsa_key():
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@pytest.fixture(scope='session')
+def public_pem(rsa_key) -> bytes:
+    from cryptography.hazmat.primitives import serialization
+    return rsa_key.public_key().public_bytes(serialization.Encoding.PEM,
+                                             serialization.PublicFormat.SubjectPublicKeyInfo)
+
+
+def user(group: str, id: str = None) -> dict:
+    """Get the claims of a token of a tenant, as token_required passes them on"""
+    return {'context': {'group': group, 'user': {'id': id or group, 'name': id or group}}}
+
+
+@pytest.fixture
+def manager(tmp_path):
+    """A Manager on a fresh SQLite database file, shared by all threads like a gthread worker's"""
+    from sqlalchemy import create_engine
+    from Conferences import Manager, engine_options
+
+    url = f'sqlite:///{tmp_path / "reservations.db"}'
+    engine = create_engine(url, connect_args={'timeout': 30}, **engine_options(url))
+    manager = Manager(engine)
+    yield manager
+    manager.remove_session()
+    engine.dispose()
+
+
+@contextmanager
+def postgres_schema():
+    """Yield an engine on a fresh schema of the PostgreSQL database at DATABASE_URL, dropped afterwards"""
+    from sqlalchemy import create_engine
+
+    schema = f'test_{uuid.uuid4().hex[:12]}'
+    admin = create_engine(POSTGRES_URL)
+    with admin.begin() as connection:
+        connection.exec_driver_sql(f'CREATE SCHEMA {schema}')
+    engine = create_engine(POSTGRES_URL, connect_args={'options': f'-csearch_path={schema}'})
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+        with admin.begin() as connection:
+            connection.exec_driver_sql(f'DROP SCHEMA {schema} CASCADE')
+        admin.dispose()
+
+
+@pytest.fixture
+def postgres_engine():
+    """An engine on a fresh schema of the PostgreSQL database at DATABASE_URL"""
+    with postgres_schema() as engine:
+        yield engine
+
+
+@pytest.fixture(params=['sqlite', pytest.param('postgresql', marks=postgres_only)])
+def engine(request, tmp_path):
+    """An engine on an empty database, of each dialect the service runs on that is available"""
+    from sqlalchemy import create_engine
+
+    if request.param == 'postgresql':
+        yield request.getfixturevalue('postgres_engine')
+        return
+    engine = create_engine(f'sqlite:///{tmp_path / "reservations.db"}')
+    yield engine
+    engine.dispose()
+
+
+class Api:
+    """The Flask app with a test client, and tokens signed with the key the stand-in serves"""
+
+    def __init__(self, module, key):
+        self.module = module
+        self.client = module.app.test_client()
+        self.key = key
+
+    def headers_for(self, group: str) -> dict:
+        import jwt
+
+        token = jwt.encode({'iss': 'sariska', 'aud': 'media', 'exp': int(time.time()) + 3600,
+                            'context': {'group': group, 'user': {'id': group, 'name': group}}},
+                           self.key, algorithm='RS256', headers={'kid': 'tests'})
+        return {'Authorization': 'Bearer ' + token}
+
+
+class AsgiApi(Api):
+    """The ASGI app with a Starlette test client, whose responses have json() instead of get_json()"""
+
+    def __init__(self, module, client, key):
+        self.module = module
+        self.client = client
+        self.key = key
+
+
+@pytest.fixture(scope='session')
+def api_module(tmp_path_factory, rsa_key, public_pem):
+    """Import the Flask app once, against a temporary SQLite database"""
+    service = KeyService()
+    service.answers['tests'] = (200, public_pem)
+    os.environ.update(
+        SECRET_MANAGEMENT_SERVICE_PUBLIC_KEY_URL=service.url,
+        RESERVATION_SERVICE_DATABASE_URL=f'sqlite:///{tmp_path_factory.mktemp("api") / "reservations.db"}',
+        RESERVATION_SERVICE_LOG_LEVEL='WARNING',
+        DEPLOYMENT_ENV=os.getenv('DEPLOYMENT_ENV', 'development'),
+    )
+    # The rootdir, which pytest puts first, holds the app/ package of the same name
+    sys.path.insert(0, APP_DIR)
+    import app as module
+    module.create_app()
+    yield module
+    service.close()
+
+
+@pytest.fixture(scope='session')
+def asgi(api_module, rsa_key):
+    """The ASGI app on the database of the Flask app, imported once with its lifespan running"""
+    from starlette.testclient import TestClient
+
+    os.environ['RESERVATION_SERVICE_ASYNC_DATABASE_URL'] = f'sqlite+aiosqlite:///{api_module.manager.engine.url.database}'
+    import asgi as module
+    with TestClient(module.app, raise_server_exceptions=False) as client:
+        yield AsgiApi(module, client, rsa_key)
+
+
+@pytest.fixture
+def api(api_module, rsa_key):
+    """The Flask app, with the request sessions bound to its database again after other tests rebound them"""
+    from Conferences import Session
+
+    Session.configure(bind=api_module.manager.engine)
+    yield Api(api_module, rsa_key)
+    api_module.manager.remove_session()
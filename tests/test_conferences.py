@@ -0,0 +1,94 @@
+from datetime import datetime, timedelta
+import pytest
+from CustomExceptions import ConferenceExists
+from tests.conftest import user
+
+
+def test_reservation_cannot_start_during_a_running_conference(manager):
+    manager.allocate({'name': 'room', 'start_time': '2040-01-01T10:00', 'duration': 3600}, user('tenant'))
+
+    with pytest.raises(ConferenceExists):
+        manager.add_reservation({'name': 'room', 'start_time': '2040-01-01T10:30', 'duration': 1800},
+                                user('tenant'))
+    event = manager.add_reservation({'name': 'room', 'start_time': '2040-01-01T11:30', 'duration': 1800},
+                                    user('tenant'))
+    assert event.id is not None
+
+
+def test_free_slots_use_the_requested_duration(manager):
+    manager.add_reservation({'name': 'room', 'start_time': '2040-01-01T09:00', 'duration': 3 * 3600, 'timezone': 'UTC'},
+                            user('tenant'))
+    manager.remove_session()
+
+    slots = manager.free_slots(['room'], datetime(2040, 1, 1, 8), datetime(2040, 1, 1, 13), timedelta(minutes=30),
+                               user('tenant'))
+
+    assert slots == {'room': [(datetime(2040, 1, 1, 8), datetime(2040, 1, 1, 9)),
+                              (datetime(2040, 1, 1, 12), datetime(2040, 1, 1, 13))]}
+
+
+def test_reservation_during_a_running_conference_gets_409(api):
+    headers = api.headers_for('running')
+    conference = api.client.post('/api/v1/scheduler/conference', headers=headers,
+                                 json={'name': 'running_room', 'start_time': '2040-01-01T10:00', 'duration': 3600})
+    assert conference.status_code == 200
+
+    response = api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                               json={'name': 'running_room', 'start_time': '2040-01-01T10:30', 'duration': 30,
+                                     'timezone': 'UTC'})
+
+    assert response.status_code == 409
+    assert response.get_json()['conflict_id'] == conference.get_json()['id']
+    assert response.get_json()['message'].startswith('A conference with this name currently exists.')
+
+
+def test_start_times_with_an_offset_are_stored_as_wall_clock_time(api):
+    headers = api.headers_for('offset')
+    first = api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                            json={'name': 'offset_room', 'start_time': '2040-01-01T10:00', 'duration': 60,
+                                  'timezone': 'Europe/Berlin'})
+    assert first.status_code == 201
+
+    # 09:30 UTC is 10:30 in Berlin, inside the first reservation
+    response = api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                               json={'name': 'offset_room', 'start_time': '2040-01-01T09:30:00+00:00', 'duration': 30,
+                                     'timezone': 'Europe/Berlin'})
+    assert response.status_code == 400
+    response = api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                               json={'name': 'offset_room', 'start_time': '2040-01-01T10:30:00+00:00', 'duration': 30,
+                                     'timezone': 'Europe/Berlin'})
+    assert response.status_code == 201
+    assert response.get_json()['start_time'].startswith('2040-01-01T11:30:00')
+
+
+def test_batch_items_cannot_start_during_a_running_conference(api):
+    headers = api.headers_for('running_batch')
+    conference = api.client.post('/api/v1/scheduler/conference', headers=headers,
+                                 json={'name': 'batch_running', 'start_time': '2040-01-01T10:00', 'duration': 3600})
+    assert conference.status_code == 200
+
+    response = api.client.post('/api/v1/scheduler/reservation/batch', headers=headers, json=[
+        {'name': 'batch_running', 'start_time': '2040-01-01T10:30', 'duration': 30, 'timezone': 'UTC'},
+        {'name': 'batch_running', 'start_time': '2040-01-01T11:30', 'duration': 30, 'timezone': 'UTC'},
+    ])
+
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [result['status'] for result in results] == ['conflict', 'created']
+    assert results[0]['error'].startswith('A conference with this name currently exists.')
+
+
+def test_free_slots_skip_running_conferences(manager):
+    manager.add_reservation({'name': 'room', 'start_time': '2040-01-01T09:00', 'duration': 3600, 'timezone': 'UTC'},
+                            user('tenant'))
+    manager.allocate({'name': 'room', 'start_time': '2040-01-01T09:00:00+00:00'}, user('tenant'))
+    manager.allocate({'name': 'other', 'start_time': '2040-01-01T11:00', 'duration': 3600}, user('tenant'))
+    manager.remove_session()
+
+    slots = manager.free_slots(['room', 'other'], datetime(2040, 1, 1, 8), datetime(2040, 1, 1, 13),
+                               timedelta(minutes=30), user('tenant'))
+
+    assert slots == {'room': [(datetime(2040, 1, 1, 8), datetime(2040, 1, 1, 9)),
+                              (datetime(2040, 1, 1, 10), datetime(2040, 1, 1, 13))],
+                     'other': [(datetime(2040, 1, 1, 8), datetime(2040, 1, 1, 11)),
+                               (datetime(2040, 1, 1, 12), datetime(2040, 1, 1, 13))]}
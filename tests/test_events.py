@@ -0,0 +1,55 @@
+import threading
+import pytest
+from Version import Version
+
+PATH = '/api/v1/scheduler/events'
+
+
+def prune(api, event_id: int):
+    """Record that the sweeper removed the events up to event_id, like sweep_events does"""
+    session = api.module.manager.session
+    session.query(Version).filter(Version.scope == Version.EVENTS_PRUNED) \
+        .update({Version.version: event_id}, synchronize_session=False)
+    session.commit()
+    api.module.manager.remove_session()
+
+
+@pytest.fixture
+def pruned(api):
+    yield prune
+    prune(api, 0)
+
+
+def test_idle_tenant_follows_the_removed_events(api, pruned):
+    headers = api.headers_for('idle')
+    cursor = api.client.get(f'{PATH}?limit=0', headers=headers).headers['X-Next-After']
+
+    # The sweeper removes events of other tenants while the poll waits
+    timer = threading.Timer(0.2, pruned, (api, int(cursor) + 100))
+    timer.start()
+    response = api.client.get(f'{PATH}?after={cursor}&wait=1', headers=headers)
+    timer.join()
+
+    assert response.status_code == 200
+    assert response.get_json() == []
+    cursor = response.headers['X-Next-After']
+    assert int(cursor) >= 100
+    assert api.client.get(f'{PATH}?after={cursor}', headers=headers).status_code == 200
+
+
+def test_waiting_polls_are_capped(api, monkeypatch):
+    headers = api.headers_for('capped')
+    monkeypatch.setattr(api.module, 'waiting_polls', threading.BoundedSemaphore(1))
+    api.module.waiting_polls.acquire()
+
+    response = api.client.get(f'{PATH}?wait=5', headers=headers)
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+
+    # Polls that do not need to wait are answered
+    assert api.client.get(PATH, headers=headers).status_code == 200
+    api.client.post('/api/v1/scheduler/conference', headers=headers,
+                    json={'name': 'capped_room', 'start_time': '2040-01-01T10:00'})
+    response = api.client.get(f'{PATH}?wait=5', headers=headers)
+    assert response.status_code == 200
+    assert [event['type'] for event in response.get_json()] == ['conference.started']
@@ -0,0 +1,79 @@
+from datetime import timedelta
+import json
+import Idempotency
+
+PATH = '/api/v1/scheduler/reservation'
+
+
+def reservation(name: str) -> dict:
+    return {'name': name, 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'UTC'}
+
+
+def post(api, tenant: str, key: str, data: dict):
+    """Post a reservation with an Idempotency-Key, the body is sent as encoded here"""
+    return api.client.post(PATH, headers={**api.headers_for(tenant), Idempotency.HEADER: key},
+                           data=json.dumps(data), content_type='application/json')
+
+
+def claim(api, tenant: str, key: str, data: dict):
+    """Claim the key like a request of the tenant that is still running"""
+    scoped = Idempotency.scoped_key(tenant, 'POST', '/api/v1/scheduler/reservation', key)
+    assert api.module.manager.claim_idempotency_key(scoped, Idempotency.request_digest(json.dumps(data).encode())) is None
+    api.module.manager.remove_session()
+
+
+def names(api, tenant: str) -> list:
+    return [row['name'] for row in api.client.get(PATH, headers=api.headers_for(tenant)).get_json()]
+
+
+def test_retry_gets_the_stored_response(api):
+    first = post(api, 'replay', 'key-1', reservation('replayed'))
+    assert first.status_code == 201
+    assert 'Idempotent-Replayed' not in first.headers
+
+    retry = post(api, 'replay', 'key-1', reservation('replayed'))
+    assert retry.status_code == 201
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert retry.get_json() == first.get_json()
+    assert names(api, 'replay') == ['replayed']
+
+
+def test_key_reused_for_a_different_request_gets_422(api):
+    assert post(api, 'reused', 'key-1', reservation('reused_a')).status_code == 201
+
+    response = post(api, 'reused', 'key-1', reservation('reused_b'))
+    assert response.status_code == 422
+    assert names(api, 'reused') == ['reused_a']
+
+
+def test_retry_while_the_request_runs_gets_409(api):
+    claim(api, 'running', 'key-1', reservation('in_flight'))
+
+    response = post(api, 'running', 'key-1', reservation('in_flight'))
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+    assert names(api, 'running') == []
+
+
+def test_retry_takes_over_once_the_lease_ran_out(api, monkeypatch):
+    monkeypatch.setattr(Idempotency, 'LEASE', timedelta(0))
+    claim(api, 'abandoned', 'key-1', reservation('taken_over'))
+
+    response = post(api, 'abandoned', 'key-1', reservation('taken_over'))
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert names(api, 'abandoned') == ['taken_over']
+
+
+def test_key_is_released_after_a_server_error(api, monkeypatch):
+    def unavailable(*args, **kwargs):
+        raise RuntimeError('database unavailable')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(api.module.manager, 'add_reservation', unavailable)
+        assert post(api, 'failed', 'key-1', reservation('retried')).status_code >= 500
+
+    response = post(api, 'failed', 'key-1', reservation('retried'))
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+    assert names(api, 'failed') == ['retried']
@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+import pytest
+from Conferences import Manager
+from Reservation import Reservation
+from tests.conftest import user
+
+LIST_INDEX = 'ix_reservations_owner_id_active_id'
+# PostgreSQL matches single reservations on the GiST index of the exclusion constraint
+OVERLAP_INDEXES = ('ix_reservations_name_start_time_end_time', 'ex_reservations_name_during')
+CONFERENCE_INDEXES = ('uq_reservations_active_name', 'ix_reservations_name_active') + OVERLAP_INDEXES
+
+
+@pytest.fixture
+def manager(engine):
+    manager = Manager(engine)
+    yield manager
+    manager.remove_session()
+
+
+@contextmanager
+def queries(engine):
+    """Collect the (statement, parameters) of the SELECTs on reservations run inside the block"""
+    collected = []
+
+    def collect(connection, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'FROM reservations' in statement:
+            collected.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', collect)
+    try:
+        yield collected
+    finally:
+        event.remove(engine, 'before_cursor_execute', collect)
+
+
+def explain(engine, statement: str, parameters) -> str:
+    """Get the query plan of a statement as text. The tables of the tests are tiny, so PostgreSQL
+    is told to avoid sequential scans, it still falls back to one if no index applies."""
+    with engine.connect() as connection:
+        if engine.dialect.name == 'postgresql':
+            connection.exec_driver_sql('SET enable_seqscan = off')
+            return '\n'.join(row[0] for row in connection.exec_driver_sql('EXPLAIN ' + statement, parameters))
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)
+        return '\n'.join(row[3] for row in rows)
+
+
+def plans(engine, call) -> list:
+    with queries(engine) as collected:
+        call()
+    assert collected
+    return [explain(engine, statement, parameters) for statement, parameters in collected]
+
+
+def assert_no_full_scan(plan: str):
+    assert 'Seq Scan on reservations' not in plan, plan
+    assert not any(line.startswith('SCAN reservations') for line in plan.splitlines()), plan
+
+
+@pytest.mark.parametrize('list_call', [
+    lambda manager: manager.all_reservations(user('tenant')),
+    lambda manager: manager.all_conferences(user('tenant')),
+    lambda manager: manager.all_reservations(user('tenant'), limit=50, after=100),
+    lambda manager: manager.all_conferences(user('tenant'), limit=50, after=100),
+])
+def test_lists_use_the_owner_index(manager, engine, list_call):
+    for plan in plans(engine, lambda: list_call(manager)):
+        assert LIST_INDEX in plan, plan
+        assert_no_full_scan(plan)
+
+
+def test_overlap_check_uses_the_time_index(manager, engine):
+    event = Reservation().from_dict({'name': 'room', 'start_time': '2040-01-01T10:00', 'duration': 1800},
+                                    user('tenant'))
+
+    for plan in plans(engine, lambda: manager.check_overlapping_reservations(event, user('tenant'))):
+        assert any(index in plan for index in OVERLAP_INDEXES), plan
+        assert_no_full_scan(plan)
+
+
+def test_conference_overlap_check_uses_the_name_index(manager, engine):
+    event = Reservation().from_dict({'name': 'room', 'start_time': '2040-01-01T10:00', 'duration': 1800},
+                                    user('tenant'))
+
+    for plan in plans(engine, lambda: manager.check_overlapping_conference(event, user('tenant'))):
+        assert any(index in plan for index in CONFERENCE_INDEXES), plan
+        assert_no_full_scan(plan)
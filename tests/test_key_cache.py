@@ -0,0 +1,139 @@
+import asyncio
+import threading
+import time
+from KeyCache import AsyncKeyCache, KeyCache
+
+
+def numbers(key):
+    return key.public_numbers() if key is not None else None
+
+
+def test_key_is_fetched_once(key_service, public_pem, rsa_key):
+    key_service.answers['k1'] = (200, public_pem)
+    cache = KeyCache(base_url=key_service.url)
+
+    first = cache.get('k1')
+    second = cache.get('k1')
+
+    assert numbers(first) == rsa_key.public_key().public_numbers()
+    assert second is first
+    assert key_service.count('k1') == 1
+    assert cache.stats['hits'] == 1 and cache.stats['misses'] == 1
+
+
+def test_unknown_kid_is_cached_negatively(key_service):
+    cache = KeyCache(base_url=key_service.url, negative_ttl=60)
+
+    assert cache.get('missing') is None
+    assert cache.get('missing') is None
+    assert key_service.count('missing') == 1
+
+
+def test_server_errors_are_not_cached(key_service, public_pem):
+    for status in (500, 503, 429):
+        kid = f'k{status}'
+        key_service.answers[kid] = (status, b'')
+        cache = KeyCache(base_url=key_service.url, negative_ttl=60)
+
+        assert cache.get(kid) is None
+        # The key service recovers, the next request must not be rejected from the cache
+        key_service.answers[kid] = (200, public_pem)
+        assert cache.get(kid) is not None
+        assert key_service.count(kid) == 2
+        assert cache.stats['failures'] == 1
+
+
+def test_expired_key_is_served_while_refresh_fails(key_service, public_pem):
+    key_service.answers['k1'] = (200, public_pem)
+    cache = KeyCache(base_url=key_service.url, ttl=0.05, retry_interval=60)
+    key = cache.get('k1')
+
+    time.sleep(0.1)
+    key_service.answers['k1'] = (503, b'')
+    assert cache.get('k1') is key
+    # Retried only after the retry interval
+    assert cache.get('k1') is key
+    assert key_service.count('k1') == 2
+
+
+def test_expired_key_is_served_on_timeout(key_service, public_pem):
+    key_service.answers['k1'] = (200, public_pem)
+    cache = KeyCache(base_url=key_service.url, ttl=0.05, timeout=0.2)
+    key = cache.get('k1')
+
+    time.sleep(0.1)
+    key_service.delay = 1
+    assert cache.get('k1') is key
+
+
+def test_refresh_after_expiry_replaces_the_key(key_service, public_pem):
+    key_service.answers['k1'] = (200, public_pem)
+    cache = KeyCache(base_url=key_service.url, ttl=0.05)
+    cache.get('k1')
+
+    time.sleep(0.1)
+    cache.get('k1')
+    assert key_service.count('k1') == 2
+
+
+def test_concurrent_misses_share_one_fetch(key_service, public_pem):
+    key_service.answers['k1'] = (200, public_pem)
+    key_service.delay = 0.2
+    cache = KeyCache(base_url=key_service.url)
+    results = []
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get('k1'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8 and all(result is not None for result in results)
+    assert key_service.count('k1') == 1
+
+
+def test_least_recently_used_keys_are_dropped(key_service, public_pem):
+    for kid in ('a', 'b', 'c'):
+        key_service.answers[kid] = (200, public_pem)
+    cache = KeyCache(base_url=key_service.url, max_size=2)
+
+    cache.get('a')
+    cache.get('b')
+    cache.get('a')
+    cache.get('c')
+    cache.get('a')
+    cache.get('b')
+
+    assert key_service.count('a') == 1
+    assert key_service.count('b') == 2
+
+
+def test_async_cache_does_not_cache_server_errors(key_service, public_pem):
+    async def run():
+        cache = AsyncKeyCache(base_url=key_service.url, negative_ttl=60, ttl=0.05, retry_interval=60)
+        key_service.answers['k1'] = (503, b'')
+        assert await cache.get('k1') is None
+        key_service.answers['k1'] = (200, public_pem)
+        key = await cache.get('k1')
+        assert key is not None
+
+        await asyncio.sleep(0.1)
+        key_service.answers['k1'] = (500, b'')
+        assert await cache.get('k1') is key
+        assert key_service.count('k1') == 3
+        await cache.client.aclose()
+
+    asyncio.run(run())
+
+
+def test_async_concurrent_misses_share_one_fetch(key_service, public_pem):
+    async def run():
+        key_service.answers['k1'] = (200, public_pem)
+        key_service.delay = 0.2
+        cache = AsyncKeyCache(base_url=key_service.url)
+        keys = await asyncio.gather(*(cache.get('k1') for _ in range(8)))
+        assert all(key is keys[0] for key in keys)
+        assert key_service.count('k1') == 1
+        await cache.client.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,76 @@
+import pytest
+
+PATHS = ['/api/v1/scheduler/conference', '/api/v1/scheduler/reservation']
+
+
+@pytest.mark.parametrize('path', PATHS)
+@pytest.mark.parametrize('query', ['limit=0', 'limit=-1', 'limit=abc', 'after=abc'])
+def test_invalid_pagination_gets_400(api, asgi, path, query):
+    assert api.client.get(f'{path}?{query}', headers=api.headers_for('lists')).status_code == 400
+    assert asgi.client.get(f'{path}?{query}', headers=asgi.headers_for('lists')).status_code == 400
+
+
+def test_pages_follow_the_cursor(api):
+    headers = api.headers_for('pages')
+    for hour in range(3):
+        api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                        json={'name': f'page{hour}', 'start_time': f'2040-01-01T1{hour}:00', 'duration': 30})
+
+    first = api.client.get('/api/v1/scheduler/reservation?limit=2', headers=headers)
+    assert [row['name'] for row in first.get_json()] == ['page0', 'page1']
+    after = first.headers['X-Next-After']
+    second = api.client.get(f'/api/v1/scheduler/reservation?limit=2&after={after}', headers=headers)
+    assert [row['name'] for row in second.get_json()] == ['page2']
+    assert 'X-Next-After' not in second.headers
+
+
+@pytest.mark.parametrize('query', ['', '?limit=2', '?after=1&limit=1',
+                                   '?start_time=2040-01-01T00:00&end_time=2040-01-20T00:00',
+                                   '?start_time=2040-01-01T00:00&end_time=2040-01-20T00:00&limit=1',
+                                   '?stream=true', '?stream=true&limit=2',
+                                   '?stream=true&start_time=2040-01-01T00:00&end_time=2040-01-20T00:00'])
+def test_asgi_lists_answer_like_flask(api, asgi, monkeypatch, query):
+    headers = api.headers_for('parity')
+    if not api.client.get('/api/v1/scheduler/reservation', headers=headers).get_json():
+        for name, start, recurrence in (('parity_single', '2040-01-02T10:00', None),
+                                        ('parity_series', '2040-01-01T09:00', 'FREQ=WEEKLY;COUNT=4'),
+                                        ('parity_late', '2041-01-01T10:00', None)):
+            assert api.client.post('/api/v1/scheduler/reservation', headers=headers,
+                                   json={'name': name, 'start_time': start, 'duration': 30, 'timezone': 'Europe/Berlin',
+                                         'recurrence': recurrence}).status_code == 201
+    # Streams read pages of one row, to go through the paging
+    monkeypatch.setattr(asgi.module, 'STREAM_BATCH_SIZE', 1)
+
+    expected = api.client.get('/api/v1/scheduler/reservation' + query, headers=headers)
+    response = asgi.client.get('/api/v1/scheduler/reservation' + query, headers=asgi.headers_for('parity'))
+
+    assert response.status_code == expected.status_code == 200
+    assert response.json() == expected.get_json()
+    assert response.headers.get('X-Next-After') == expected.headers.get('X-Next-After')
+
+
+@pytest.mark.parametrize('query', ['start_time=tomorrow&end_time=2040-01-02T00:00', 'stream=maybe'])
+def test_invalid_list_arguments_get_400(api, asgi, query):
+    path = f'/api/v1/scheduler/reservation?{query}'
+    assert api.client.get(path, headers=api.headers_for('lists')).status_code == 400
+    assert asgi.client.get(path, headers=asgi.headers_for('lists')).status_code == 400
+
+
+def test_list_etags_cover_the_route_and_the_arguments(api, asgi):
+    headers = api.headers_for('etags')
+    tag = api.client.get('/api/v1/scheduler/reservation?limit=1', headers=headers).headers['ETag']
+    cached = {**headers, 'If-None-Match': tag}
+
+    assert api.client.get('/api/v1/scheduler/reservation?limit=1', headers=cached).status_code == 304
+    # Both apps tag the same list alike
+    assert asgi.client.get('/api/v1/scheduler/reservation?limit=1', headers=cached).status_code == 304
+    for path in ('/api/v1/scheduler/conference?limit=1', '/api/v1/scheduler/reservation?limit=2',
+                 '/api/v1/scheduler/reservation?limit=1&after=5', '/api/v1/scheduler/reservation?limit=1&stream=true',
+                 '/api/v1/scheduler/reservation?limit=1&start_time=2040-01-01T00:00&end_time=2040-01-02T00:00'):
+        assert api.client.get(path, headers=cached).status_code == 200, path
+        assert asgi.client.get(path, headers=cached).status_code == 200, path
+
+    # Arguments are compared after parsing
+    tag = api.client.get(f'/api/v1/scheduler/reservation?limit={api.module.LIST_MAX_LIMIT}', headers=headers).headers['ETag']
+    assert api.client.get(f'/api/v1/scheduler/reservation?limit={api.module.LIST_MAX_LIMIT + 1}',
+                          headers={**headers, 'If-None-Match': tag}).status_code == 304
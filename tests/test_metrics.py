@@ -0,0 +1,84 @@
+import multiprocessing
+import os
+from types import SimpleNamespace
+import Metrics
+
+
+def worker(queries: int, connection):
+    """A worker process recording queries into PROMETHEUS_MULTIPROC_DIR, rendering /metrics on request"""
+    Metrics.watch_cache('token', SimpleNamespace(stats={'hits': 3, 'misses': 1}))
+    Metrics.QUERIES.inc(queries)
+    Metrics.REQUEST_LATENCY.labels('/api/v1/scheduler/reservation', 'GET', 200).observe(0.002)
+    connection.send(os.getpid())
+    while connection.recv() == 'render':
+        connection.send(Metrics.render().decode())
+
+
+def start_worker(queries: int):
+    # Spawned processes import prometheus_client again, in multiprocess mode
+    context = multiprocessing.get_context('spawn')
+    connection, child = context.Pipe()
+    process = context.Process(target=worker, args=(queries, child), daemon=True)
+    process.start()
+    assert connection.poll(30), 'worker did not start'
+    return process, connection, connection.recv()
+
+
+def render(connection) -> str:
+    connection.send('render')
+    return connection.recv()
+
+
+def stop_worker(process, connection):
+    connection.send(None)
+    process.join(10)
+
+
+def test_metrics_of_all_workers_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    first, first_connection, first_pid = start_worker(2)
+    second, second_connection, second_pid = start_worker(5)
+
+    output = render(first_connection)
+
+    assert 'reservation_db_queries_total 7.0\n' in output
+    assert 'reservation_http_request_duration_seconds_bucket{le="0.0025",method="GET",' \
+           'route="/api/v1/scheduler/reservation",status="200"} 2.0\n' in output
+    # Values read on collection are those of the worker answering
+    assert f'reservation_cache_requests_total{{cache="token",pid="{first_pid}",result="hit"}} 3.0\n' in output
+    assert f'pid="{second_pid}"' not in output
+    stop_worker(first, first_connection)
+    stop_worker(second, second_connection)
+
+
+def test_exited_workers_keep_their_totals(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROMETHEUS_MULTIPROC_DIR', str(tmp_path))
+    process, connection, pid = start_worker(4)
+    stop_worker(process, connection)
+    monkeypatch.setattr(Metrics, 'MULTIPROC_DIR', str(tmp_path))
+    Metrics.mark_process_dead(pid)
+
+    process, connection, _ = start_worker(3)
+    assert 'reservation_db_queries_total 7.0\n' in render(connection)
+    stop_worker(process, connection)
+
+
+def test_files_of_an_earlier_run_are_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(Metrics, 'MULTIPROC_DIR', str(tmp_path))
+    for name in ('counter_1.db', 'gauge_livesum_1.db', f'histogram_{os.getpid()}.db'):
+        (tmp_path / name).write_bytes(b'')
+
+    Metrics.clear_store()
+    assert os.listdir(tmp_path) == [f'histogram_{os.getpid()}.db']
+
+
+def test_forked_worker_starts_from_zero():
+    Metrics.QUERIES.inc(10)
+    Metrics.MANAGER_LATENCY.labels('allocate').observe(0.01)
+    Metrics.POOL_CHECKOUT_LATENCY.observe(0.01)
+    Metrics.after_fork()
+
+    assert Metrics.REGISTRY.get_sample_value('reservation_db_queries_total') == 0
+    assert Metrics.REGISTRY.get_sample_value('reservation_manager_call_duration_seconds_count',
+                                             {'method': 'allocate'}) is None
+    assert Metrics.REGISTRY.get_sample_value('reservation_db_pool_checkout_duration_seconds_count') == 0
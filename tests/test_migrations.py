@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+import glob
+import os
+from sqlalchemy import inspect
+from Conferences import Manager
+from Events import Event
+from Sweeper import Sweeper
+from tests.conftest import postgres_only, postgres_schema, user
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'migrations')
+
+# The reservations table as the first release created it, before any migration
+BASELINE = '''
+CREATE TABLE reservations (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR,
+    start_time TIMESTAMP WITHOUT TIME ZONE,
+    end_time TIMESTAMP WITHOUT TIME ZONE,
+    duration INTERVAL,
+    timezone VARCHAR,
+    pin VARCHAR,
+    mail_owner VARCHAR,
+    active BOOLEAN,
+    user_id VARCHAR,
+    owner_id VARCHAR,
+    user_name VARCHAR,
+    email VARCHAR,
+    avatar VARCHAR
+)
+'''
+
+
+def statements(path: str) -> list:
+    """Split a migration file into its statements, without the comment lines"""
+    with open(path) as file:
+        sql = '\n'.join(line for line in file if not line.lstrip().startswith('--'))
+    return [statement.strip() for statement in sql.split(';') if statement.strip()]
+
+
+def migrate(engine):
+    """Apply the migrations in order like psql -f does, outside of a transaction for CREATE INDEX CONCURRENTLY"""
+    with engine.execution_options(isolation_level='AUTOCOMMIT').connect() as connection:
+        connection.exec_driver_sql(BASELINE)
+        for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql'))):
+            for statement in statements(path):
+                connection.exec_driver_sql(statement)
+
+
+def schema(engine) -> dict:
+    """Get the tables with their columns and the names of their indexes and constraints"""
+    inspector = inspect(engine)
+    tables = {}
+    for table in inspector.get_table_names():
+        tables[table] = {
+            'columns': {column['name']: (str(column['type']), column['nullable'])
+                        for column in inspector.get_columns(table)},
+            'primary_key': inspector.get_pk_constraint(table)['constrained_columns'],
+            'indexes': sorted(index['name'] for index in inspector.get_indexes(table)),
+            'unique': sorted(constraint['name'] for constraint in inspector.get_unique_constraints(table)),
+        }
+    return tables
+
+
+@postgres_only
+def test_migrations_match_the_schema_created_at_startup(postgres_engine):
+    migrate(postgres_engine)
+
+    with postgres_schema() as created:
+        Manager(created).remove_session()
+        assert schema(postgres_engine) == schema(created)
+
+
+@postgres_only
+def test_service_runs_on_a_migrated_database(postgres_engine):
+    migrate(postgres_engine)
+    manager = Manager(postgres_engine, create_schema=False)
+    tenant = user('tenant')
+
+    reservation = manager.add_reservation({'name': 'planned', 'start_time': '2040-01-01T10:00', 'duration': 3600}, tenant)
+    conference = manager.allocate({'name': 'room', 'start_time': '2040-01-01T10:00'}, tenant)
+    manager.remove_session()
+    assert [record.id for record in manager.all_reservations(tenant)] == [reservation.id]
+    assert [record.id for record in manager.all_conferences(tenant)] == [conference['id']]
+    assert manager.delete_conference(id=conference['id'], current_user=tenant)
+    manager.remove_session()
+    assert [event.type for event in manager.events(tenant)] == \
+        [Event.RESERVATION_CREATED, Event.CONFERENCE_STARTED, Event.CONFERENCE_ENDED]
+    assert manager.tenant_version(tenant) > 0
+    manager.remove_session()
+
+    # An expired conference is moved to the archive
+    expired = manager.allocate({'name': 'old', 'start_time': (datetime.utcnow() - timedelta(days=3)).isoformat(),
+                                'duration': 600}, tenant)
+    manager.remove_session()
+    sweeper = Sweeper(manager, retention=timedelta(hours=1), mode='archive')
+    assert sweeper.sweep()['conferences'] == 1
+    with postgres_engine.connect() as connection:
+        archived = connection.exec_driver_sql('SELECT id FROM reservations_archive').scalars().all()
+    assert archived == [expired['id']]
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+import pytest
+import RateLimit
+from RateLimit import AdmissionControl, LocalRedis, RedisBackend, TOKEN_BUCKET_SCRIPT, refill
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A clock for the buckets that only moves when the test sets it, in seconds"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(RateLimit, 'time', SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_bucket_refills_with_the_elapsed_time():
+    # 2 tokens per second, 500 ms after the bucket ran empty one token is back
+    assert refill(0, 0, 500, rate=2, burst=4) == (0, 0)
+    assert refill(0, 0, 0, rate=2, burst=4) == (0, 500)
+    # A bucket never holds more than its burst
+    assert refill(1, 0, 60000, rate=2, burst=4) == (3, 0)
+    assert refill(0.5, 0, 0, rate=1, burst=4, cost=2) == (0.5, 1500)
+
+
+def test_local_redis_takes_refills_and_expires_buckets(clock):
+    redis = LocalRedis()
+    take = lambda: redis.eval(TOKEN_BUCKET_SCRIPT, 1, 'tenant', 1, 2, 1)
+
+    assert [take(), take(), take()] == [0, 0, 1000]
+    assert len(redis) == 1
+    clock.value += 1
+    assert [take(), take()] == [0, 1000]
+
+    # Full buckets expire like the PEXPIRE of the script
+    clock.value += 3.001
+    assert len(redis) == 0
+    assert [take(), take(), take()] == [0, 0, 1000]
+
+
+def test_local_redis_only_runs_the_token_bucket():
+    with pytest.raises(ValueError):
+        LocalRedis().eval("return redis.call('GET', KEYS[1])", 1, 'key')
+    with pytest.raises(ValueError):
+        LocalRedis().eval(TOKEN_BUCKET_SCRIPT, 2, 'a', 'b', 1, 2, 1)
+
+
+@pytest.mark.parametrize('app', ['api', 'asgi'])
+def test_tenant_over_its_rate_gets_429_with_retry_after(request, monkeypatch, clock, app):
+    app = request.getfixturevalue(app)
+    monkeypatch.setattr(app.module, 'admission', AdmissionControl(RedisBackend(LocalRedis()), rate=0.5, burst=1))
+    path = '/api/v1/scheduler/reservation'
+
+    assert app.client.get(path, headers=app.headers_for('flood')).status_code == 200
+    response = app.client.get(path, headers=app.headers_for('flood'))
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '2'
+    # Buckets are per tenant
+    assert app.client.get(path, headers=app.headers_for('quiet')).status_code == 200
+
+    clock.value += 2
+    assert app.client.get(path, headers=app.headers_for('flood')).status_code == 200
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+import random
+import pytest
+from Reservation import parse_recurrence, occurrences_between, check_recurrence, MAX_HORIZON_OCCURRENCES
+
+START = datetime(2040, 3, 1, 9, 30)
+RULES = [
+    'FREQ=WEEKLY', 'FREQ=WEEKLY;COUNT=10', 'FREQ=WEEKLY;INTERVAL=2;COUNT=30', 'FREQ=DAILY;UNTIL=20400601T093000',
+    'FREQ=DAILY;INTERVAL=3', 'FREQ=WEEKLY;UNTIL=20400415T000000',
+    # Rules with BY* parts are expanded by dateutil
+    'FREQ=WEEKLY;BYDAY=MO,WE;COUNT=40', 'FREQ=DAILY;BYHOUR=9,17', 'FREQ=MONTHLY;COUNT=12',
+]
+
+
+@pytest.mark.parametrize('recurrence', RULES)
+def test_occurrences_match_dateutil(recurrence):
+    rule = parse_recurrence(recurrence, START)
+    windows = random.Random(recurrence)
+    for _ in range(200):
+        start_time = START + timedelta(minutes=windows.randrange(-20000, 400000))
+        end_time = start_time + timedelta(minutes=windows.choice([0, 1, 30, 1440, 10080, 100000]))
+        assert occurrences_between(rule, start_time, end_time) == rule.between(start_time, end_time, inc=True)
+
+
+def test_window_bounds_are_inclusive():
+    rule = parse_recurrence('FREQ=WEEKLY;COUNT=3', START)
+
+    assert occurrences_between(rule, START, START) == [START]
+    assert occurrences_between(rule, START + timedelta(weeks=2), START + timedelta(weeks=5)) == [START + timedelta(weeks=2)]
+
+
+@pytest.mark.parametrize('recurrence', [
+    'FREQ=SOMETIMES', 'FREQ=WEEKLY;COUNT=x', 'every monday', 5, ['FREQ=WEEKLY'],
+    # More often than daily, or too many occurrences to expand on every overlap check
+    'FREQ=SECONDLY;INTERVAL=30', 'FREQ=HOURLY;COUNT=5', 'FREQ=DAILY;BYHOUR=0,4,8,12,16,20',
+])
+def test_invalid_rule_gets_400(api, recurrence):
+    response = api.client.post('/api/v1/scheduler/reservation', headers=api.headers_for('recurrence'), json={
+        'name': 'series', 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'UTC', 'recurrence': recurrence})
+
+    assert response.status_code == 400
+    listed = api.client.get('/api/v1/scheduler/reservation', headers=api.headers_for('recurrence')).get_json()
+    assert listed == []
+
+
+def test_rules_are_limited_within_the_horizon():
+    check_recurrence(parse_recurrence('FREQ=DAILY;BYHOUR=9,17', START))
+    check_recurrence(parse_recurrence(f'FREQ=DAILY;BYHOUR=0,4,8,12,16,20;COUNT={MAX_HORIZON_OCCURRENCES}', START))
+    with pytest.raises(ValueError):
+        check_recurrence(parse_recurrence('FREQ=DAILY;BYHOUR=0,4,8,12,16,20', START))
+    with pytest.raises(ValueError):
+        check_recurrence(parse_recurrence('FREQ=MINUTELY;COUNT=2', START))
@@ -0,0 +1,144 @@
+import multiprocessing
+import time
+import pytest
+from Registry import ActiveConferenceRegistry
+from Version import Version
+from tests.conftest import user
+
+POLL_INTERVAL = 0.2
+
+
+def worker(url: str, poll_interval: float, connection):
+    """Another worker process on the same database, answering commands sent through the pipe"""
+    from sqlalchemy import create_engine
+    from Conferences import Manager
+    from CustomExceptions import ConferenceExists
+
+    manager = Manager(create_engine(url), create_schema=False)
+    manager.registry = ActiveConferenceRegistry(poll_interval)
+    for command, argument in iter(connection.recv, None):
+        try:
+            if command == 'lookup':
+                conference = manager.get_conference_with_id(argument, current_user=user('tenant'))
+                result = conference.id if conference is not None else None
+            else:
+                result = manager.allocate({'name': argument, 'start_time': '2040-01-01T10:00'}, user('tenant'))['id']
+        except ConferenceExists as e:
+            result = ('exists', e.id)
+        finally:
+            manager.remove_session()
+        connection.send((result, manager.registry.loads))
+
+
+class Worker:
+    def __init__(self, manager, poll_interval: float = POLL_INTERVAL):
+        context = multiprocessing.get_context('spawn')
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=worker, args=(str(manager.engine.url), poll_interval, child), daemon=True)
+        self.process.start()
+
+    def __call__(self, command: str, argument):
+        self.connection.send((command, argument))
+        assert self.connection.poll(30), 'worker did not answer'
+        return self.connection.recv()
+
+    def close(self):
+        self.connection.send(None)
+        self.process.join(10)
+
+
+@pytest.fixture
+def other_worker(manager):
+    workers = []
+
+    def start(poll_interval: float = POLL_INTERVAL):
+        workers.append(Worker(manager, poll_interval))
+        return workers[-1]
+
+    yield start
+    for started in workers:
+        started.close()
+
+
+def start(manager, name: str) -> int:
+    id = manager.allocate({'name': name, 'start_time': '2040-01-01T10:00'}, user('tenant'))['id']
+    manager.remove_session()
+    return id
+
+
+def end(manager, id: int):
+    assert manager.delete_conference(id=id, current_user=user('tenant'))
+    manager.remove_session()
+
+
+def rooms_in_different_shards() -> tuple:
+    names = [f'room{i}' for i in range(Version.CONFERENCE_SHARDS + 1)]
+    first = names[0]
+    return first, next(name for name in names if Version.conferences(name) != Version.conferences(first))
+
+
+def test_ended_conference_is_dropped_by_other_workers(manager, other_worker):
+    id = start(manager, 'room')
+    other = other_worker()
+    assert other('lookup', id)[0] == id
+
+    end(manager, id)
+    time.sleep(POLL_INTERVAL * 2)
+
+    assert other('lookup', id)[0] is None
+
+
+def test_only_the_changed_room_is_loaded_again(manager, other_worker):
+    first, second = rooms_in_different_shards()
+    first_id, second_id = start(manager, first), start(manager, second)
+    other = other_worker()
+    other('lookup', first_id)
+    _, loads = other('lookup', second_id)
+    assert other('lookup', second_id) == (second_id, loads)
+
+    end(manager, first_id)
+    time.sleep(POLL_INTERVAL * 2)
+
+    assert other('lookup', second_id) == (second_id, loads)
+    assert other('lookup', first_id)[0] is None
+
+
+def test_stale_entry_does_not_reject_a_join(manager, other_worker):
+    id = start(manager, 'room')
+    # The other worker does not see the end of the conference for a minute
+    other = other_worker(poll_interval=60)
+    assert other('lookup', id)[0] == id
+
+    end(manager, id)
+
+    started, _ = other('allocate', 'room')
+    assert isinstance(started, int)
+    assert other('allocate', 'room')[0] == ('exists', started)
+
+
+def test_own_changes_are_seen_right_away(manager):
+    manager.registry = ActiveConferenceRegistry(poll_interval=60)
+    id = start(manager, 'room')
+    assert manager.get_conference_with_id(id, current_user=user('tenant')).id == id
+    manager.remove_session()
+
+    end(manager, id)
+
+    assert manager.get_conference_with_id(id, current_user=user('tenant')) is None
+
+
+def test_missing_conferences_are_not_cached(manager):
+    from Reservation import Reservation
+
+    manager.registry = ActiveConferenceRegistry(poll_interval=60)
+    assert manager.get_conference_with_id(1, current_user=user('tenant')) is None
+    manager.remove_session()
+
+    # Started by another process, this one has not read the counters again since
+    conference = Reservation().from_dict({'name': 'room', 'start_time': '2040-01-01T10:00'}, user('tenant'))
+    conference.id, conference.active = 1, True
+    manager.session.add(conference)
+    manager.session.commit()
+    manager.remove_session()
+
+    assert manager.get_conference_with_id(1, current_user=user('tenant')).id == 1
@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+import json
+import os
+import sys
+from flask_restx import Model, fields, marshal
+import pytest
+from Reservation import Reservation
+from Serializer import compile_model, dumps
+
+# The golden rows and output are shared with benchmarks/serializer.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+import serializer as benchmark
+
+ATTENDEE = Model('Attendee', {
+    'name': fields.String,
+    'joined': fields.DateTime(dt_format='iso8601'),
+})
+MEETING = Model('Meeting', {
+    'id': fields.Integer,
+    'title': fields.String(default='untitled'),
+    'starts': fields.DateTime,
+    'host': fields.Nested(ATTENDEE, allow_null=True),
+    'attendees': fields.List(fields.Nested(ATTENDEE)),
+    'tags': fields.List(fields.String),
+    'extra': fields.Raw,
+    'room': {'name': fields.String(attribute='room_name')},
+})
+
+
+class Meeting:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def test_compiled_serializer_matches_the_golden_output(api_module):
+    with open(benchmark.GOLDEN) as f:
+        golden = json.load(f)
+    rows = benchmark.golden_rows(Reservation)
+
+    output = json.loads(dumps([api_module.serialize_conference(row) for row in rows]))
+
+    assert output == golden
+    # Clients may depend on the key order
+    assert [list(entry) for entry in output] == [list(entry) for entry in golden]
+
+
+@pytest.mark.parametrize('obj', [
+    None,
+    Meeting(),
+    Meeting(id=1, title=None, starts=datetime(2040, 1, 1, 10), host=None, attendees=[], tags=[], extra=None),
+    Meeting(id='2', title='standup', starts=datetime(2040, 1, 1, 10, 0, 0, 123456),
+            host=Meeting(name='ann', joined=datetime(2040, 1, 1, 9, 59)),
+            attendees=[Meeting(name='bob', joined=None), {'name': 'eve', 'joined': datetime(2040, 1, 1, 10, 1)}],
+            tags=['daily', 7], extra={'nested': [1, None]}, room_name='room 1'),
+    {'id': 3, 'title': 'dict', 'host': {'name': 'ann'}, 'attendees': None, 'room_name': 'room 2'},
+])
+def test_compiled_serializer_matches_marshal(obj):
+    compiled, marshalled = compile_model(MEETING)(obj), marshal(obj, MEETING)
+
+    assert compiled == marshalled
+    assert list(compiled) == list(marshalled)
@@ -0,0 +1,108 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from CustomExceptions import ConferenceExists
+from tests.conftest import user
+
+THREADS = 8
+
+
+def run_parallel(function, count: int = THREADS) -> list:
+    """Call function(i) from count threads released at the same time, return results or exceptions"""
+    barrier = threading.Barrier(count)
+
+    def call(i):
+        barrier.wait()
+        try:
+            return function(i)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(count) as pool:
+        return list(pool.map(call, range(count)))
+
+
+def test_each_thread_gets_its_own_session(manager):
+    def session_of(i):
+        session = manager.session
+        # The session must stay the same within the thread, across calls
+        assert manager.session is session
+        manager.remove_session()
+        return id(session), session
+
+    results = run_parallel(session_of)
+
+    assert len({session_id for session_id, _ in results}) == THREADS
+
+
+def test_sessions_do_not_share_objects_between_threads(manager):
+    def add_and_list(i):
+        tenant = f'tenant{i}'
+        try:
+            event = manager.add_reservation({'name': f'room{i}', 'start_time': '2040-01-01T10:00',
+                                             'duration': 1800, 'timezone': 'UTC'}, user(tenant))
+            loaded = {(type(row).__name__, row.id) for row in manager.session.identity_map.values()}
+            return event.id, loaded, [record.id for record in manager.all_reservations(user(tenant))]
+        finally:
+            manager.remove_session()
+
+    results = run_parallel(add_and_list)
+
+    assert all(not isinstance(result, Exception) for result in results), results
+    assert len({id for id, _, _ in results}) == THREADS
+    for id, loaded, listed in results:
+        assert ('Reservation', id) in loaded
+        assert {row for row in loaded if row[0] == 'Reservation'} == {('Reservation', id)}
+        assert listed == [id]
+
+
+def test_parallel_joins_start_one_conference(manager):
+    def join(i):
+        try:
+            return manager.allocate({'name': 'room', 'start_time': '2040-01-01T10:00', 'mail_owner': f'user{i}'},
+                                    user('tenant', f'user{i}'))
+        finally:
+            manager.remove_session()
+
+    results = run_parallel(join)
+
+    started = [result for result in results if isinstance(result, dict)]
+    rejected = [result for result in results if isinstance(result, ConferenceExists)]
+    assert len(started) == 1, results
+    assert len(rejected) == THREADS - 1, results
+    assert {e.id for e in rejected} == {started[0]['id']}
+    assert [record.name for record in manager.all_conferences(user('tenant'))] == ['room']
+
+
+def test_parallel_joins_to_different_rooms_all_start(manager):
+    def join(i):
+        try:
+            return manager.allocate({'name': f'room{i}', 'start_time': '2040-01-01T10:00'}, user('tenant'))
+        finally:
+            manager.remove_session()
+
+    results = run_parallel(join)
+
+    assert all(isinstance(result, dict) for result in results), results
+    assert len(manager.all_conferences(user('tenant'))) == THREADS
+
+
+def test_parallel_joins_of_a_reservation_start_one_conference(manager):
+    reservation = manager.add_reservation({'name': 'room', 'start_time': '2040-01-01T10:00', 'duration': 3600,
+                                           'timezone': 'UTC', 'mail_owner': 'owner@example.com'}, user('tenant'))
+    manager.remove_session()
+
+    def join(i):
+        try:
+            # Jicofo sends the join time with its offset
+            return manager.allocate({'name': 'room', 'start_time': '2040-01-01T10:00:00+00:00',
+                                     'mail_owner': 'owner@example.com'}, user('tenant'))
+        finally:
+            manager.remove_session()
+
+    results = run_parallel(join)
+
+    started = [result for result in results if isinstance(result, dict)]
+    rejected = [result for result in results if isinstance(result, ConferenceExists)]
+    assert len(started) == 1, results
+    assert len(rejected) == THREADS - 1, results
+    assert started[0]['id'] == reservation.id
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from Sweeper import Sweeper
+from Version import Version
+from Events import Event
+from tests.conftest import user
+
+
+def test_sweeper_bumps_counters_in_scope_order(manager, monkeypatch):
+    started = (datetime.utcnow() - timedelta(days=3)).isoformat()
+    for tenant, room in (('b', 'room1'), ('a', 'room2'), ('b', 'room3')):
+        manager.allocate({'name': room, 'start_time': started, 'duration': 600}, user(tenant))
+        manager.remove_session()
+    bumped = []
+    bump_version = manager.bump_version
+    monkeypatch.setattr(manager, 'bump_version', lambda scope: (bumped.append(scope), bump_version(scope)))
+
+    assert Sweeper(manager, retention=timedelta(hours=1)).sweep()['conferences'] == 3
+
+    # Conference shards before tenants, like every other transaction takes these row locks
+    shards = sorted({Version.conferences(room) for room in ('room1', 'room2', 'room3')})
+    assert bumped == shards + [Version.tenant('a'), Version.tenant('b')]
+    assert shards[-1] < Version.tenant('a')
+
+
+def test_retired_rows_are_reported_in_the_change_feed(manager):
+    ended = (datetime.utcnow() - timedelta(days=3)).isoformat()
+    conference = manager.allocate({'name': 'room1', 'start_time': ended, 'duration': 600}, user('tenant'))
+    reservation = manager.add_reservation({'name': 'room2', 'start_time': ended, 'duration': 600}, user('tenant'))
+    manager.remove_session()
+    cursor = manager.latest_event_id(user('tenant'))
+    version = manager.tenant_version(user('tenant'))
+    manager.remove_session()
+
+    assert Sweeper(manager, retention=timedelta(hours=1), mode='delete').sweep()['conferences'] == 1
+
+    events = manager.events(user('tenant'), after=cursor)
+    assert [(event.type, event.reservation_id) for event in events] == \
+        [(Event.CONFERENCE_ENDED, conference['id']), (Event.RESERVATION_DELETED, reservation.id)]
+    assert events[1].data['name'] == 'room2'
+    # Both batches bumped the tenant version
+    assert manager.tenant_version(user('tenant')) == version + 2
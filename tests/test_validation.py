@@ -0,0 +1,42 @@
+from Validation import validate_reservation_data
+
+VALID = {'name': 'room 1', 'start_time': '2040-01-01T10:00', 'duration': 30, 'timezone': 'Europe/Berlin'}
+
+
+def test_valid_reservation_has_no_errors():
+    assert validate_reservation_data(dict(VALID)) == {}
+    assert validate_reservation_data(dict(VALID, start_time='2040-01-01T10:00:00')) == {}
+
+
+def test_invalid_fields_are_reported():
+    errors = validate_reservation_data({'name': 'bad!', 'start_time': 'tomorrow', 'duration': -1,
+                                        'timezone': 'Mars/Base', 'pin': '12 34'})
+
+    assert set(errors) == {'name', 'start_time', 'duration', 'timezone', 'pin'}
+
+
+def test_missing_fields_are_reported():
+    assert set(validate_reservation_data({})) == {'name', 'start_time'}
+
+
+def test_batch_rejects_only_the_invalid_items(api):
+    response = api.client.post('/api/v1/scheduler/reservation/batch', headers=api.headers_for('batch'), json=[
+        dict(VALID, name='batch_good'),
+        dict(VALID, name='bad!'),
+        dict(VALID, name='batch_mars', timezone='Mars/Base'),
+    ])
+
+    assert response.status_code == 200
+    results = response.get_json()
+    assert [result['status'] for result in results] == ['created', 'invalid', 'invalid']
+    assert set(results[1]['validation_errors']) == {'name'}
+    assert set(results[2]['validation_errors']) == {'timezone'}
+    listed = api.client.get('/api/v1/scheduler/reservation', headers=api.headers_for('batch')).get_json()
+    assert [reservation['name'] for reservation in listed] == ['batch_good']
+
+
+def test_invalid_reservation_gets_400(api):
+    response = api.client.post('/api/v1/scheduler/reservation', headers=api.headers_for('single'),
+                               json=dict(VALID, name='bad!'))
+
+    assert response.status_code == 400